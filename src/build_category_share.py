@@ -8,7 +8,8 @@ contraception listings?
                 llm_relevant == True), split into abortion vs contraception
   denominator = every distinct product parsed across the pipeline
                 (data/parsed/parsed_merged.json + data/parsed/parsed-torzone.json,
-                deduped by original_url)
+                deduped by original_url), plus the listings parser.py --prefilter
+                skipped (listed in each file's .prefiltered.json sidecar)
 
 Renders a donut with three segments -- Abortion, Contraception, Other products --
 and the combined abortion+contraception share annotated in the center. A one-row
@@ -26,6 +27,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Sequence
 
+from prefilter import load_pruned_urls
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 
@@ -90,7 +93,8 @@ def count_numerator(path: Path) -> Dict[str, int]:
 
 
 def count_denominator(paths: Sequence[Path]) -> int:
-    """Distinct products fetched, deduped by original_url across all parse files."""
+    """Distinct products fetched, deduped by original_url across all parse files
+    (including the listings parser.py --prefilter didn't parse)."""
     urls: set[str] = set()
     for path in paths:
         if not path.exists():
@@ -102,6 +106,10 @@ def count_denominator(paths: Sequence[Path]) -> int:
             if url:
                 urls.add(str(url))
         print(f"  loaded {len(chunk)} parsed product(s) from {path.name}")
+        pruned = load_pruned_urls(path)
+        if pruned:
+            urls.update(pruned)
+            print(f"  counted {len(pruned)} prefiltered listing(s) from {path.name}")
     return len(urls)
 
 
@@ -42,7 +42,7 @@ from termcolor import colored
 
 # Sibling modules (same src/ dir is on sys.path when run as a script).
 from scrape_simple import setup_requests_session, extract_product_links
-from filter_medicines import build_patterns, load_term_groups
+from filter_medicines import build_matcher, load_term_groups
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = PROJECT_ROOT / "data"
@@ -206,7 +206,7 @@ def is_walled(status: Optional[int], html: Optional[str]) -> bool:
     return False
 
 
-def score_market(session, base_url: str, patterns, max_pages: int, timeout: int) -> dict:
+def score_market(session, base_url: str, matcher, max_pages: int, timeout: int) -> dict:
     """Crawl homepage + a few category pages, count unique keyword matches."""
     status, home = probe(session, base_url, timeout)
     if home is None:
@@ -228,12 +228,9 @@ def score_market(session, base_url: str, patterns, max_pages: int, timeout: int)
         time.sleep(0.5)
 
     haystack = "\n".join(BeautifulSoup(t, "html.parser").get_text(" ", strip=True) for t in texts)
-    matched_terms = set()
-    matched_categories = set()
-    for category, term, pattern in patterns:
-        if pattern.search(haystack):
-            matched_terms.add(term)
-            matched_categories.add(category)
+    matches = matcher.match(haystack)
+    matched_terms = {term for _, term in matches}
+    matched_categories = {category for category, _ in matches}
 
     return {
         "status": "scored",
@@ -333,7 +330,7 @@ def main() -> None:
 
     sources = load_json(SOURCES_FILE)
     term_groups = load_term_groups(KEYWORDS_FILE)
-    patterns = build_patterns(term_groups)
+    matcher = build_matcher(term_groups)
     print(colored(f"🔑 Loaded {sum(len(v) for v in term_groups.values())} keywords "
                   f"across {len(term_groups)} categories", "green"))
 
@@ -369,7 +366,7 @@ def main() -> None:
     print(colored(f"\n=== Stages B+C: liveness + scoring ({len(rows)} markets) ===", "cyan", attrs=["bold"]))
     for i, row in enumerate(rows, 1):
         print(colored(f"[{i}/{len(rows)}] {row['onion_url']}", "blue"))
-        result = score_market(session, row["onion_url"], patterns,
+        result = score_market(session, row["onion_url"], matcher,
                               args.max_pages_per_market, args.timeout)
         row.update(result)
         msg = f"   status={result['status']} score={result.get('score')}"
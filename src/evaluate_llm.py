@@ -19,14 +19,16 @@ Each record is annotated with:
     llm_confidence    0.0 - 1.0
     llm_reason        one-line justification
 
-Results are cached (data/llm_cache.json) keyed by model + content, so reruns are
-free and resumable. Default output keeps every record with its verdict; use
+Results are cached (data/llm_cache.sqlite, see verdict_cache.py) keyed by model +
+content, so reruns are free and resumable. Default output keeps every record with its verdict; use
 --relevant-only to drop the rejects.
 
 Usage:
     python3 src/evaluate_llm.py                       # eval filtered_medicines.json
     python3 src/evaluate_llm.py --limit 5             # smoke test
     python3 src/evaluate_llm.py --relevant-only       # only keep llm_relevant=true
+    python3 src/evaluate_llm.py --concurrency 8       # keep 8 requests in flight
+    python3 src/evaluate_llm.py --batch-size 8        # judge 8 listings per request
 """
 
 from __future__ import annotations
@@ -35,9 +37,11 @@ import argparse
 import hashlib
 import json
 import re
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import requests
 from termcolor import colored
@@ -45,6 +49,7 @@ from termcolor import colored
 # Reuse the filter's CSV/JSON writers so output columns stay consistent with the
 # rest of the pipeline (these modules are import-safe -- main() is __main__-gated).
 from filter_medicines import determine_columns, write_csv, write_json
+from verdict_cache import DEFAULT_CACHE, open_cache
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -57,7 +62,6 @@ DEFAULT_INPUTS = [
 ]
 DEFAULT_OUTPUT_JSON = DATA_DIR / "filtered" / "filtered_medicines_llm.json"
 DEFAULT_OUTPUT_CSV = DATA_DIR / "filtered" / "filtered_medicines_llm.csv"
-DEFAULT_CACHE = DATA_DIR / "llm_cache.json"
 
 DEFAULT_BASE_URL = "http://localhost:1234/v1"   # LM Studio default
 DEFAULT_MODEL = "qwen2.5-7b-instruct-1m"
@@ -112,6 +116,26 @@ JSON_SCHEMA = {
     },
 }
 
+# --batch-size: one verdict per listing, matched back by its 1-based index.
+BATCH_JSON_SCHEMA = {
+    "name": "product_eval_batch",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "verdicts": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"index": {"type": "integer"}, **JSON_SCHEMA["schema"]["properties"]},
+                    "required": ["index", *JSON_SCHEMA["schema"]["required"]],
+                },
+            },
+        },
+        "required": ["verdicts"],
+    },
+}
+
 
 def load_records(path: Path) -> List[Dict[str, object]]:
     with path.open("r", encoding="utf-8") as fh:
@@ -121,27 +145,6 @@ def load_records(path: Path) -> List[Dict[str, object]]:
     return [r for r in data if isinstance(r, dict)]
 
 
-def load_cache(path: Path) -> Dict[str, dict]:
-    if not path.exists():
-        return {}
-    try:
-        with path.open("r", encoding="utf-8") as fh:
-            data = json.load(fh)
-        return data if isinstance(data, dict) else {}
-    except Exception as exc:
-        print(colored(f"⚠️  Could not read cache {path}: {exc} (ignoring)", "yellow"))
-        return {}
-
-
-def save_cache(path: Path, cache: Dict[str, dict]) -> None:
-    try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("w", encoding="utf-8") as fh:
-            json.dump(cache, fh, ensure_ascii=False, indent=2)
-    except Exception as exc:
-        print(colored(f"⚠️  Could not write cache {path}: {exc}", "yellow"))
-
-
 def cache_key(model: str, record: Dict[str, object], max_desc: int) -> str:
     payload = "\n".join([
         model,
@@ -164,8 +167,8 @@ def build_user_message(record: Dict[str, object], max_desc: int) -> str:
     )
 
 
-def _parse_json_lenient(content: str) -> Optional[dict]:
-    """Parse a JSON object from a model response, tolerating code fences / prose."""
+def _parse_json_lenient(content: str) -> Optional[object]:
+    """Parse a JSON object (or array) from a model response, tolerating code fences / prose."""
     if not content:
         return None
     content = content.strip()
@@ -187,27 +190,101 @@ def _parse_json_lenient(content: str) -> Optional[dict]:
     return None
 
 
-def call_llm(base_url: str, model: str, user_msg: str, timeout: int) -> Optional[dict]:
-    """One chat-completion call returning the parsed verdict dict, or None on failure.
+# response_format variants, richest first. call_llm() walks down this list when a
+# server rejects one (HTTP 400); the first one a server accepts is remembered per
+# (base_url, model), so later calls start there instead of paying the 400s again.
+_FORMAT_ORDER = ["json_schema", "json_object", "text"]
+
+
+def response_format(name: str, schema: dict = JSON_SCHEMA) -> Optional[dict]:
+    """The response_format payload for format `name` (None: plain text)."""
+    if name == "json_schema":
+        return {"type": "json_schema", "json_schema": schema}
+    if name == "json_object":
+        return {"type": "json_object"}
+    return None
+
+# (base_url, model) -> [format name, confirmed]. "Confirmed" means the server has
+# answered a request in that format; a 400 on a confirmed format is blamed on
+# the request, not the format, and doesn't move the choice.
+_format_choices: Dict[Tuple[str, str], List] = {}
+_format_lock = threading.Lock()
+
+
+def _server_key(base_url: str, model: str) -> Tuple[str, str]:
+    return base_url.rstrip("/"), model
+
+
+def remembered_format(base_url: str, model: str, confirmed_only: bool = False) -> Optional[str]:
+    with _format_lock:
+        choice = _format_choices.get(_server_key(base_url, model))
+    if choice is None or (confirmed_only and not choice[1]):
+        return None
+    return choice[0]
+
+
+def remember_format(base_url: str, model: str, name: str, confirmed: bool = True) -> None:
+    """Start every later call_llm() for this server on `name`. Pass confirmed=False
+    for a format not seen working in this run (e.g. one loaded from the cache): the
+    first 400 then moves calls down to the next format instead of being blamed on
+    the request."""
+    with _format_lock:
+        _format_choices[_server_key(base_url, model)] = [name, confirmed]
+
+
+def _format_rejected(base_url: str, model: str, name: str) -> None:
+    with _format_lock:
+        key = _server_key(base_url, model)
+        choice = _format_choices.get(key)
+        if choice is None or (choice[0] == name and not choice[1]):
+            _format_choices[key] = [_FORMAT_ORDER[_FORMAT_ORDER.index(name) + 1], False]
+
+
+def _format_worked(base_url: str, model: str, name: str) -> None:
+    with _format_lock:
+        key = _server_key(base_url, model)
+        choice = _format_choices.get(key)
+        if choice is None or not choice[1]:
+            _format_choices[key] = [name, True]
+
+
+def negotiate_response_format(base_url: str, model: str, timeout: int) -> Optional[str]:
+    """Probe the server once with a one-token request per format, richest first;
+    returns (and remembers) the first one it accepts, or None if it can't tell."""
+    url = f"{base_url.rstrip('/')}/chat/completions"
+    for name in _FORMAT_ORDER:
+        payload = {"model": model, "messages": [{"role": "user", "content": "Reply with an empty JSON object."}],
+                   "temperature": 0, "max_tokens": 1}
+        rf = response_format(name)
+        if rf is not None:
+            payload["response_format"] = rf
+        try:
+            resp = requests.post(url, json=payload, timeout=timeout)
+        except requests.RequestException:
+            return None
+        if resp.status_code == 400 and rf is not None:
+            continue
+        if resp.status_code != 200:
+            return None
+        remember_format(base_url, model, name)
+        return name
+    return None
+
+
+def _chat(base_url: str, model: str, messages: List[dict], schema: dict, max_tokens: int,
+          timeout: int) -> Optional[object]:
+    """POST one chat completion and return its parsed JSON body, or None on failure.
 
     Tries strict json_schema structured output first, then falls back to json_object,
     then plain text -- so it works across OpenAI-compatible servers of varying support.
+    Once a server has shown which of those it takes, calls start on that one.
     """
     url = f"{base_url.rstrip('/')}/chat/completions"
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    for ex_user, ex_json in FEWSHOT:
-        messages.append({"role": "user", "content": ex_user})
-        messages.append({"role": "assistant", "content": json.dumps(ex_json)})
-    messages.append({"role": "user", "content": user_msg})
+    base_payload = {"model": model, "messages": messages, "temperature": 0, "max_tokens": max_tokens}
+    start = _FORMAT_ORDER.index(remembered_format(base_url, model) or _FORMAT_ORDER[0])
 
-    base_payload = {"model": model, "messages": messages, "temperature": 0, "max_tokens": 300}
-    response_formats = [
-        {"type": "json_schema", "json_schema": JSON_SCHEMA},
-        {"type": "json_object"},
-        None,
-    ]
-
-    for rf in response_formats:
+    for name in _FORMAT_ORDER[start:]:
+        rf = response_format(name, schema)
         payload = dict(base_payload)
         if rf is not None:
             payload["response_format"] = rf
@@ -218,6 +295,7 @@ def call_llm(base_url: str, model: str, user_msg: str, timeout: int) -> Optional
             return None
         if resp.status_code == 400 and rf is not None:
             # Server rejected this response_format; try the next, simpler one.
+            _format_rejected(base_url, model, name)
             continue
         if resp.status_code != 200:
             print(colored(f"    ⚠️  HTTP {resp.status_code}: {resp.text[:200]}", "yellow"))
@@ -227,6 +305,7 @@ def call_llm(base_url: str, model: str, user_msg: str, timeout: int) -> Optional
         except Exception as exc:
             print(colored(f"    ⚠️  unexpected response shape: {exc}", "yellow"))
             return None
+        _format_worked(base_url, model, name)
         parsed = _parse_json_lenient(content)
         if parsed is not None:
             return parsed
@@ -234,6 +313,108 @@ def call_llm(base_url: str, model: str, user_msg: str, timeout: int) -> Optional
     return None
 
 
+def call_llm(base_url: str, model: str, user_msg: str, timeout: int) -> Optional[dict]:
+    """One chat-completion call returning the parsed verdict dict, or None on failure."""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for ex_user, ex_json in FEWSHOT:
+        messages.append({"role": "user", "content": ex_user})
+        messages.append({"role": "assistant", "content": json.dumps(ex_json)})
+    messages.append({"role": "user", "content": user_msg})
+    return _chat(base_url, model, messages, JSON_SCHEMA, 300, timeout)
+
+
+def build_batch_message(user_msgs: List[str]) -> str:
+    """Several build_user_message() blocks, numbered from 1, in one prompt."""
+    parts = [f"Judge each of the {len(user_msgs)} listings below on its own. Reply with "
+             '{"verdicts": [...]}: one verdict per listing, with the listing\'s number as "index".']
+    parts.extend(f"### Listing {n}\n{msg}" for n, msg in enumerate(user_msgs, 1))
+    return "\n\n".join(parts)
+
+
+def _well_formed(raw: object) -> bool:
+    """Whether a batched verdict has the fields _normalise_verdict() needs, as
+    the schema types them (anything else is asked again on its own)."""
+    return (isinstance(raw, dict) and isinstance(raw.get("relevant"), bool)
+            and raw.get("category") in ("contraception", "abortion", "none"))
+
+
+def call_llm_batch(base_url: str, model: str, user_msgs: List[str],
+                   timeout: int) -> List[Tuple[Optional[dict], bool]]:
+    """Judge several listings in one request: (raw verdict, re-queried) per message.
+
+    The system prompt and few-shot turns are sent once for the whole batch (the
+    FEWSHOT examples as one batched exchange) and the reply is an array of
+    verdicts keyed by listing number. A listing whose verdict is missing,
+    duplicated or malformed -- or every listing, if the batch call fails -- is
+    re-sent alone through call_llm(), so a batch never loses a verdict a
+    single-item run would have produced.
+    """
+    if len(user_msgs) == 1:
+        return [(call_llm(base_url, model, user_msgs[0], timeout), False)]
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_batch_message([ex_user for ex_user, _ in FEWSHOT])},
+        {"role": "assistant", "content": json.dumps(
+            {"verdicts": [{"index": n, **ex_json} for n, (_, ex_json) in enumerate(FEWSHOT, 1)]})},
+        {"role": "user", "content": build_batch_message(user_msgs)},
+    ]
+    parsed = _chat(base_url, model, messages, BATCH_JSON_SCHEMA, 60 + 240 * len(user_msgs), timeout)
+    # json_object / text servers may answer with the bare array.
+    items = parsed.get("verdicts") if isinstance(parsed, dict) else parsed
+    by_index: Dict[int, dict] = {}
+    duplicated = set()
+    for item in items if isinstance(items, list) else []:
+        index = item.get("index") if isinstance(item, dict) else None
+        if type(index) is not int or not 1 <= index <= len(user_msgs):
+            continue
+        if index in by_index:
+            duplicated.add(index)
+        elif _well_formed(item):
+            by_index[index] = item
+    results = []
+    for n, user_msg in enumerate(user_msgs, 1):
+        raw = by_index.get(n) if n not in duplicated else None
+        if raw is None:
+            results.append((call_llm(base_url, model, user_msg, timeout), True))
+        else:
+            results.append((raw, False))
+    return results
+
+
+def submit_calls(executor: ThreadPoolExecutor, base_url: str, model: str, user_msgs: List[str],
+                 timeout: int, batch_size: int = 1) -> List["Future[Tuple[Optional[dict], bool]]"]:
+    """Queue the evaluation of `user_msgs` on `executor`: one future per message,
+    resolving to (raw verdict, re-queried). With batch_size > 1, consecutive
+    messages go out batch_size to a request."""
+    if batch_size <= 1:
+        return [executor.submit(_call_one, base_url, model, msg, timeout) for msg in user_msgs]
+    futures: List[Future] = []
+    for start in range(0, len(user_msgs), batch_size):
+        chunk = user_msgs[start:start + batch_size]
+        batch = executor.submit(call_llm_batch, base_url, model, chunk, timeout)
+        parts = [Future() for _ in chunk]
+        futures.extend(parts)
+        batch.add_done_callback(lambda done, parts=parts: _split_batch(done, parts))
+    return futures
+
+
+def _call_one(base_url: str, model: str, user_msg: str, timeout: int) -> Tuple[Optional[dict], bool]:
+    return call_llm(base_url, model, user_msg, timeout), False
+
+
+def _split_batch(batch: Future, parts: List[Future]) -> None:
+    if batch.cancelled():
+        for part in parts:
+            part.cancel()
+        return
+    exc = batch.exception()
+    for n, part in enumerate(parts):
+        if exc is not None:
+            part.set_exception(exc)
+        else:
+            part.set_result(batch.result()[n])
+
+
 def _normalise_verdict(raw: Optional[dict]) -> Dict[str, object]:
     """Coerce a raw model dict into the five llm_* fields (null verdict on failure)."""
     if not isinstance(raw, dict):
@@ -292,6 +473,15 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--limit", type=int, default=None, help="Only evaluate the first N records (smoke test)")
     p.add_argument("--relevant-only", action="store_true",
                    help="Write only records the LLM judged relevant")
+    p.add_argument("--renegotiate", action="store_true",
+                   help="Probe the server's response_format support again instead of using the one "
+                        "remembered in the cache (e.g. after switching servers or upgrading one)")
+    p.add_argument("--concurrency", "-c", type=int, default=1,
+                   help="Requests kept in flight (default 1). LM Studio, llama.cpp and vLLM batch "
+                        "concurrent requests; match their parallel slots")
+    p.add_argument("--batch-size", "-k", type=int, default=1,
+                   help="Listings judged per request (default 1). The prompt and few-shot turns are "
+                        "sent once per batch; missing or malformed verdicts are re-asked one by one")
     return p.parse_args()
 
 
@@ -313,36 +503,85 @@ def main() -> None:
     print(colored(f"✅ {len(records)} record(s) to evaluate", "green"))
 
     check_server(args.base_url, args.model)
-    cache = {} if args.no_cache else load_cache(args.cache)
+    cache = None if args.no_cache else open_cache(args.cache)
+    response_format = None
+    if cache is not None and not args.renegotiate:
+        response_format = cache.get_response_format(args.base_url, args.model)
+    if response_format:
+        # Only a hint: the server may have changed since, so the first calls confirm
+        # it (or step down from it, and the finally block stores what they settle on).
+        remember_format(args.base_url, args.model, response_format, confirmed=False)
+        print(colored(f"✅ Using response_format {response_format!r} remembered for this server.", "green"))
+    else:
+        response_format = negotiate_response_format(args.base_url, args.model, args.timeout)
+        if response_format:
+            print(colored(f"✅ Server accepts response_format {response_format!r}.", "green"))
+            if cache is not None:
+                cache.put_response_format(args.base_url, args.model, response_format)
 
     evaluated: List[Dict[str, object]] = []
-    n_cached = n_called = n_failed = 0
+    n_cached = n_called = n_failed = n_requeried = 0
+
+    # Every call is queued up front; the pool keeps --concurrency of them in
+    # flight while the loop below consumes the results in input order, so the
+    # output, the cache and the counters come out as in a one-at-a-time run.
+    # A key repeated within the run is only sent once: by the time the loop
+    # reaches the repeat, the first verdict is in the cache.
+    keys = [cache_key(args.model, record, args.max_desc_chars) for record in records]
+    executor = ThreadPoolExecutor(max_workers=max(1, args.concurrency))
+
+    pending: List[int] = []
+    queued = set()
+    for i, (record, key) in enumerate(zip(records, keys), 1):
+        if cache is None:
+            pending.append(i)
+        elif key not in queued and cache.get(key) is None:
+            queued.add(key)
+            pending.append(i)
+    futures = submit_calls(executor, args.base_url, args.model,
+                           [build_user_message(records[i - 1], args.max_desc_chars) for i in pending],
+                           args.timeout, args.batch_size)
+    calls: Dict[int, "Future[Tuple[Optional[dict], bool]]"] = dict(zip(pending, futures))
 
-    for i, record in enumerate(records, 1):
-        key = cache_key(args.model, record, args.max_desc_chars)
-        if not args.no_cache and key in cache:
-            verdict = cache[key]
-            n_cached += 1
-        else:
-            raw = call_llm(args.base_url, args.model,
-                           build_user_message(record, args.max_desc_chars), args.timeout)
-            verdict = _normalise_verdict(raw)
-            n_called += 1
-            if verdict["llm_relevant"] is None:
-                n_failed += 1
-            if not args.no_cache and raw is not None:
-                cache[key] = verdict
-                save_cache(args.cache, cache)  # persist per item → resumable
-
-        merged = {**record, **verdict}
-        evaluated.append(merged)
-
-        rel = verdict["llm_relevant"]
-        tag = ("✅ relevant" if rel else "✗ reject") if rel is not None else "⚠️ undecided"
-        colour = "green" if rel else ("yellow" if rel is None else "red")
-        print(colored(f"  [{i}/{len(records)}] {tag} "
-                      f"[{verdict.get('llm_category','')}] "
-                      f"{str(record.get('listing_title',''))[:55]}", colour))
+    try:
+        for i, (record, key) in enumerate(zip(records, keys), 1):
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                verdict = cached
+                n_cached += 1
+            else:
+                # No queued call: a repeated key whose first call failed, so ask again.
+                call = calls.pop(i, None) or submit_calls(
+                    executor, args.base_url, args.model,
+                    [build_user_message(record, args.max_desc_chars)], args.timeout)[0]
+                raw, requeried = call.result()
+                verdict = _normalise_verdict(raw)
+                n_called += 1
+                n_requeried += requeried
+                if verdict["llm_relevant"] is None:
+                    n_failed += 1
+                if cache is not None and raw is not None:
+                    cache.put(key, args.model, verdict)  # persist per item → resumable
+
+            merged = {**record, **verdict}
+            evaluated.append(merged)
+
+            rel = verdict["llm_relevant"]
+            tag = ("✅ relevant" if rel else "✗ reject") if rel is not None else "⚠️ undecided"
+            colour = "green" if rel else ("yellow" if rel is None else "red")
+            print(colored(f"  [{i}/{len(records)}] {tag} "
+                          f"[{verdict.get('llm_category','')}] "
+                          f"{str(record.get('listing_title',''))[:55]}", colour))
+    finally:
+        # Ctrl-C (or an error) drops the queued calls instead of waiting for them.
+        executor.shutdown(wait=False, cancel_futures=True)
+        if cache is not None:
+            # The first calls settle the format if the probe couldn't, or correct a
+            # cached one the server no longer takes.
+            settled = remembered_format(args.base_url, args.model, confirmed_only=True)
+            if settled and settled != response_format:
+                cache.put_response_format(args.base_url, args.model, settled)
+            cache.close()
 
     out = [r for r in evaluated if r.get("llm_relevant")] if args.relevant_only else evaluated
 
@@ -359,6 +598,8 @@ def main() -> None:
     print(colored(f"\n{'='*70}", "cyan"))
     print(colored("📊 LLM evaluation summary", "cyan", attrs=["bold"]))
     print(colored(f"   evaluated : {len(evaluated)}  (cached {n_cached}, called {n_called})", "white"))
+    if args.batch_size > 1:
+        print(colored(f"   batched   : {args.batch_size} per request, {n_requeried} re-queried alone", "white"))
     print(colored(f"   relevant  : {n_relevant}", "green"))
     print(colored(f"   rejected  : {n_reject}", "red"))
     print(colored(f"   undecided : {n_failed}", "yellow"))
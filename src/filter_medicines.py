@@ -6,7 +6,10 @@ import csv
 import json
 import re
 from pathlib import Path
-from typing import Dict, Iterable, List, Sequence, Set, Tuple
+from typing import Dict, Iterable, List, Sequence, Set, Tuple, Union
+
+from fuzzy_terms import FuzzyTermIndex
+from session_writer import SESSION_EXT, iter_jsonl
 
 # Terms grouped by category so the resulting CSV can show which families matched.
 TERM_GROUPS: Dict[str, Sequence[str]] = {
@@ -325,7 +328,85 @@ def build_patterns(term_groups: Dict[str, Sequence[str]] = TERM_GROUPS) -> List[
     return compiled
 
 
+_WORD = re.compile(r"\w+")
+
+
+class TermMatcher:
+    """Every term of build_patterns() matched in one pass over the text.
+
+    A term's pattern is its tokens joined by \W* between \b anchors. When the
+    tokens are all word characters (every built-in term), that is the same as
+    walking the text's words: the first token has to start a word, each next
+    token either continues the same word (\W* matching nothing) or, once the
+    word is used up, starts the next one, and the last token has to end a word.
+    The matcher splits the text into lowercased words once and looks terms up
+    by first token, so the cost no longer grows with the number of terms. Terms
+    with other characters in their tokens keep their own regex.
+
+    With `fuzzy`, the same words are also looked up in a FuzzyTermIndex for
+    misspelled terms (see fuzzy_terms.py).
+    """
+
+    def __init__(self, patterns: Sequence[Tuple[str, str, re.Pattern[str]]], fuzzy: bool = False):
+        # first token -> [(remaining tokens, [(category, term), ...])]
+        self._by_first: Dict[str, List[Tuple[Tuple[str, ...], List[Tuple[str, str]]]]] = {}
+        self._regex_terms: List[Tuple[str, str, re.Pattern[str]]] = []
+        entries: Dict[Tuple[str, ...], List[Tuple[str, str]]] = {}
+        for category, term, pattern in patterns:
+            tokens = tuple(token.lower() for token in re.split(r"[\s\-]+", term) if token)
+            if tokens and all(_WORD.fullmatch(token) for token in tokens):
+                entries.setdefault(tokens, []).append((category, term))
+            else:
+                self._regex_terms.append((category, term, pattern))
+        for tokens, matched in entries.items():
+            self._by_first.setdefault(tokens[0], []).append((tokens[1:], matched))
+        self._first_lengths = sorted({len(first) for first in self._by_first})
+        self.fuzzy = FuzzyTermIndex(entries) if fuzzy else None
+
+    @staticmethod
+    def _rest_matches(words: List[str], index: int, remainder: str, rest: Tuple[str, ...]) -> bool:
+        for token in rest:
+            if not remainder:
+                index += 1
+                if index == len(words):
+                    return False
+                remainder = words[index]
+            if not remainder.startswith(token):
+                return False
+            remainder = remainder[len(token):]
+        return not remainder
+
+    def match(self, text: str) -> Set[Tuple[str, str]]:
+        """(category, term) for every term whose pattern matches somewhere in `text`."""
+        found: Set[Tuple[str, str]] = set()
+        words = [word.lower() for word in _WORD.findall(text)]
+        by_first = self._by_first
+        for index, word in enumerate(words):
+            for length in self._first_lengths:
+                if length > len(word):
+                    break
+                candidates = by_first.get(word[:length])
+                if candidates is None:
+                    continue
+                for rest, matched in candidates:
+                    if self._rest_matches(words, index, word[length:], rest):
+                        found.update(matched)
+        for category, term, pattern in self._regex_terms:
+            if pattern.search(text):
+                found.add((category, term))
+        if self.fuzzy is not None:
+            found |= self.fuzzy.match(words, found)
+        return found
+
+
+def build_matcher(term_groups: Dict[str, Sequence[str]] = TERM_GROUPS, fuzzy: bool = False) -> TermMatcher:
+    return TermMatcher(build_patterns(term_groups), fuzzy=fuzzy)
+
+
 def load_products(path: Path) -> List[Dict[str, object]]:
+    if path.suffix == SESSION_EXT:
+        # e.g. a crawl's parse-on-fetch output (data/parsed/<session>.parsed.jsonl)
+        return list(iter_jsonl(path))
     with path.open("r", encoding="utf-8") as fh:
         data = json.load(fh)
     if not isinstance(data, list):
@@ -368,26 +449,33 @@ def determine_columns(products: Iterable[Dict[str, object]]) -> List[str]:
     return ordered
 
 
-def filter_products(products: Sequence[Dict[str, object]], patterns: Sequence[Tuple[str, str, re.Pattern[str]]]) -> List[Dict[str, object]]:
+def product_text(product: Dict[str, object]) -> str:
+    """The text the keywords are matched against: title, description and review."""
+    haystack_parts = [
+        normalise_cell(product.get("listing_title", "")),
+        normalise_cell(product.get("description", "")),
+        normalise_cell(product.get("review", "")),
+    ]
+    return " \n ".join(haystack_parts)
+
+
+def with_matches(product: Dict[str, object], matches: Iterable[Tuple[str, str]]) -> Dict[str, object]:
+    """Copy of `product` carrying its matched terms and categories."""
+    matches = list(matches)
+    product_copy = dict(product)
+    product_copy["matched_terms"] = "; ".join(sorted({term for _, term in matches}))
+    product_copy["matched_categories"] = "; ".join(sorted({category for category, _ in matches}))
+    return product_copy
+
+
+def filter_products(products: Sequence[Dict[str, object]],
+                    patterns: Union[TermMatcher, Sequence[Tuple[str, str, re.Pattern[str]]]]) -> List[Dict[str, object]]:
+    matcher = patterns if isinstance(patterns, TermMatcher) else TermMatcher(patterns)
     filtered: List[Dict[str, object]] = []
     for product in products:
-        haystack_parts = [
-            normalise_cell(product.get("listing_title", "")),
-            normalise_cell(product.get("description", "")),
-            normalise_cell(product.get("review", "")),
-        ]
-        haystack = " \n ".join(haystack_parts)
-        matched_terms: Set[str] = set()
-        matched_categories: Set[str] = set()
-        for category, term, pattern in patterns:
-            if pattern.search(haystack):
-                matched_terms.add(term)
-                matched_categories.add(category)
-        if matched_terms:
-            product_copy = dict(product)
-            product_copy["matched_terms"] = "; ".join(sorted(matched_terms))
-            product_copy["matched_categories"] = "; ".join(sorted(matched_categories))
-            filtered.append(product_copy)
+        matches = matcher.match(product_text(product))
+        if matches:
+            filtered.append(with_matches(product, matches))
     return filtered
 
 
@@ -434,21 +522,45 @@ def parse_args() -> argparse.Namespace:
                         help="Destination JSON path (consumed by push_to_sheets.py)")
     parser.add_argument("--keywords", "-k", type=Path, default=default_keywords,
                         help="Keyword groups JSON ({category: [terms]}); falls back to built-in TERM_GROUPS if missing")
+    parser.add_argument("--fuzzy", action="store_true",
+                        help="Also match misspelled terms within a small edit distance, "
+                             "reported as '<term> (fuzzy: <spelling>)'")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only match new/changed records and keyword edits, merging into the existing outputs "
+                             "(state: <json-output stem>.state.json)")
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
+    if args.fuzzy:
+        # Imported here: prefilter imports this module.
+        from prefilter import prefiltered_fuzzy, pruned_path_for
+
+        if prefiltered_fuzzy(args.input) is False:
+            print(f"⚠️  {args.input} was parsed with --prefilter but without --fuzzy "
+                  f"(see {pruned_path_for(args.input).name}): listings whose only hits are misspellings "
+                  "were never parsed, so --fuzzy can't find them. Re-run parser.py --prefilter --fuzzy.")
     products = load_products(args.input)
 
     if args.keywords and args.keywords.exists():
         term_groups = load_term_groups(args.keywords)
     else:
         term_groups = TERM_GROUPS
-    patterns = build_patterns(term_groups)
+    if args.incremental:
+        # Imported here: filter_state imports this module.
+        from filter_state import FilterState, filter_incremental, state_path_for
 
-    filtered = filter_products(products, patterns)
-    filtered = dedupe_products(filtered)
+        state_path = state_path_for(args.json_output)
+        state = FilterState.load(state_path)
+        existing = load_products(args.json_output) if args.json_output.exists() else []
+        filtered, stats = filter_incremental(products, term_groups, existing, state, fuzzy=args.fuzzy)
+        state.save(state_path)
+        print(f"Incremental: {stats['reused']} reused, {stats['rematched_terms']} re-matched on edited terms, "
+              f"{stats['matched']} fully matched ({stats['carried']} rows carried over from {args.json_output})")
+    else:
+        filtered = filter_products(products, build_matcher(term_groups, fuzzy=args.fuzzy))
+        filtered = dedupe_products(filtered)
     if not filtered:
         # Write empty files with standard headers to avoid stale data.
         write_csv([], list(PREFERRED_HEADERS), args.output)
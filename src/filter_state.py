@@ -0,0 +1,205 @@
+"""Incremental filter_medicines.py runs (--incremental).
+
+A normal run matches every parsed record against every keyword and rewrites
+the filtered CSV/JSON from scratch. With --incremental, filter_medicines.py
+keeps a state file next to its JSON output
+(filtered_medicines.json -> filtered_medicines.state.json) that remembers, per
+original_url, a fingerprint of the text the keywords are matched against
+(title, description, review), the keyword-set version it was matched with, and
+the (category, term) pairs that matched:
+
+    {"version": 1,
+     "keyword_sets": {"<version>": [[category, term], ...]},
+     "records": {"<original_url>": {"fingerprint": "...", "keywords": "<version>",
+                                    "matches": [[category, term], ...]}}}
+
+Per record, a run then:
+
+  - reuses the stored matches when fingerprint and keyword version are current;
+  - after a search_keywords.json edit, drops the removed terms from the stored
+    matches and matches only the added terms (each term matches on its own, so
+    that is exactly what a full run finds); with --fuzzy, whose hits depend on
+    the whole term set, such records are matched in full instead;
+  - matches everything for a new or changed record.
+
+Results are merged into the existing outputs: rows of the JSON output whose
+URL is not in this run's input are kept (and updated for keyword edits, from
+the text they carry), so parsed files can be filtered one at a time, e.g. each
+crawl's parse-on-fetch sidecar. Records without an original_url are matched
+every time and never carried over.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from filter_medicines import (
+    TermMatcher,
+    build_matcher,
+    normalise_cell,
+    product_text,
+    with_matches,
+)
+from fuzzy_terms import FUZZY_MIN_LENGTH
+from html_store import content_hash
+
+STATE_VERSION = 1
+
+Match = Tuple[str, str]
+
+
+def state_path_for(json_output) -> Path:
+    """State file kept next to the filter's JSON output."""
+    json_output = Path(json_output)
+    return json_output.with_name(json_output.stem + ".state.json")
+
+
+def keyword_pairs(term_groups: Dict[str, Sequence[str]]) -> List[Match]:
+    return sorted({(str(category), str(term)) for category, terms in term_groups.items() for term in terms})
+
+
+def keyword_version(pairs: Sequence[Match], fuzzy: bool = False) -> str:
+    data: list = [list(pair) for pair in pairs]
+    if fuzzy:
+        data.append(["--fuzzy", FUZZY_MIN_LENGTH])
+    return content_hash(json.dumps(data, ensure_ascii=False))[:16]
+
+
+class FilterState:
+    """Per-URL match results of earlier runs plus the keyword sets they used."""
+
+    def __init__(self, records: Optional[Dict[str, dict]] = None,
+                 keyword_sets: Optional[Dict[str, List[Match]]] = None):
+        self.records: Dict[str, dict] = records or {}
+        self.keyword_sets: Dict[str, List[Match]] = keyword_sets or {}
+
+    @classmethod
+    def load(cls, path) -> "FilterState":
+        """The saved state, or an empty one (a full run) if there is none."""
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with path.open("r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        if data.get("version") != STATE_VERSION:
+            print(f"⚠️  {path}: unsupported state version {data.get('version')!r}; matching every record")
+            return cls()
+        keyword_sets = {version: [tuple(pair) for pair in pairs]
+                        for version, pairs in data.get("keyword_sets", {}).items()}
+        return cls(data.get("records", {}), keyword_sets)
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Only keep the keyword sets some record was last matched with.
+        used = {record.get("keywords") for record in self.records.values()}
+        keyword_sets = {version: [list(pair) for pair in pairs]
+                        for version, pairs in self.keyword_sets.items() if version in used}
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump({"version": STATE_VERSION, "keyword_sets": keyword_sets, "records": self.records},
+                      fh, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+
+class IncrementalMatcher:
+    """filter_medicines matching that reuses a FilterState where it can."""
+
+    def __init__(self, state: FilterState, term_groups: Dict[str, Sequence[str]], fuzzy: bool = False):
+        self.state = state
+        self.fuzzy = fuzzy
+        self.pairs = keyword_pairs(term_groups)
+        self.version = keyword_version(self.pairs, fuzzy)
+        self.state.keyword_sets[self.version] = self.pairs
+        self.matcher = build_matcher(term_groups, fuzzy=fuzzy)
+        # old keyword version -> (removed pairs, matcher over the added terms)
+        self._deltas: Dict[str, Tuple[Set[Match], Optional[TermMatcher]]] = {}
+        self.stats = {"reused": 0, "rematched_terms": 0, "matched": 0}
+
+    def _delta(self, old_version: str) -> Optional[Tuple[Set[Match], Optional[TermMatcher]]]:
+        if old_version not in self._deltas:
+            old = self.state.keyword_sets.get(old_version)
+            # Fuzzy hits depend on the whole term set (a span spelled like any
+            # term is no typo), so only exact-only results are patched per term.
+            if old is None or self.fuzzy or keyword_version(old) != old_version:
+                return None
+            old_pairs, new_pairs = set(old), set(self.pairs)
+            added: Dict[str, List[str]] = {}
+            for category, term in sorted(new_pairs - old_pairs):
+                added.setdefault(category, []).append(term)
+            self._deltas[old_version] = (old_pairs - new_pairs, build_matcher(added) if added else None)
+        return self._deltas[old_version]
+
+    def matches_for(self, product: Dict[str, object], remember: bool = True) -> Set[Match]:
+        """The (category, term) pairs a full run would find for `product`."""
+        url = normalise_cell(product.get("original_url", ""))
+        text = product_text(product)
+        fingerprint = content_hash(text)
+        record = self.state.records.get(url) if url else None
+        matches: Optional[Set[Match]] = None
+        if record and record.get("fingerprint") == fingerprint:
+            previous = {tuple(pair) for pair in record.get("matches", [])}
+            if record.get("keywords") == self.version:
+                matches = previous
+                self.stats["reused"] += 1
+            else:
+                delta = self._delta(record.get("keywords"))
+                if delta is not None:
+                    removed, added = delta
+                    matches = (previous - removed) | (added.match(text) if added else set())
+                    self.stats["rematched_terms"] += 1
+        if matches is None:
+            matches = self.matcher.match(text)
+            self.stats["matched"] += 1
+        if url and remember:
+            self.state.records[url] = {"fingerprint": fingerprint, "keywords": self.version,
+                                       "matches": [list(pair) for pair in sorted(matches)]}
+        return matches
+
+
+def filter_incremental(products: Sequence[Dict[str, object]], term_groups: Dict[str, Sequence[str]],
+                       existing: Sequence[Dict[str, object]], state: FilterState,
+                       fuzzy: bool = False) -> Tuple[List[Dict[str, object]], dict]:
+    """Filtered rows for `products` merged into the `existing` output rows.
+
+    Matches like filter_products() + dedupe_products() (the first matching
+    record per URL wins), reusing `state` and updating it in place. Existing
+    rows keep their position; rows for new URLs are appended.
+    """
+    matcher = IncrementalMatcher(state, term_groups, fuzzy=fuzzy)
+    # URL -> row (None once it no longer matches); rows without a URL get a key of their own.
+    merged: Dict[object, Optional[Dict[str, object]]] = {}
+    for row in existing:
+        url = normalise_cell(row.get("original_url", ""))
+        if url:
+            merged[url] = row
+    carried = set(merged)
+
+    seen: Set[str] = set()
+    matched_urls: Set[str] = set()
+    for product in products:
+        url = normalise_cell(product.get("original_url", ""))
+        if url in matched_urls:
+            continue
+        matches = matcher.matches_for(product, remember=url not in seen)
+        if url:
+            seen.add(url)
+            carried.discard(url)
+        if matches:
+            if url:
+                matched_urls.add(url)
+            merged[url or object()] = with_matches(product, matches)
+    for url in seen - matched_urls:
+        merged[url] = None
+
+    for url in carried:
+        # Not in this run's input: the row's own text stands in for the record.
+        matches = matcher.matches_for(merged[url])
+        merged[url] = with_matches(merged[url], matches) if matches else None
+
+    rows = [row for row in merged.values() if row is not None]
+    stats = dict(matcher.stats, input=len(products), carried=len(carried), rows=len(rows))
+    return rows, stats
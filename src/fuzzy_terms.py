@@ -0,0 +1,158 @@
+"""Fuzzy (misspelled) keyword matching for filter_medicines.py (--fuzzy).
+
+Listings misspell drug names ("Mifeprestone", "Levonorgestrl"), and exact
+matching only finds the variants search_keywords.json happens to list. Trying
+an edit distance against every term for every listing word would be far too
+slow, so the terms go into a trigram index instead:
+
+  - every token of every term goes into the index;
+  - a listing word only gets compared with tokens it shares enough trigrams with
+    (k edits can destroy at most k * 4 of a token's distinct trigrams);
+  - the survivors are verified with a bounded edit distance (insertions,
+    deletions, substitutions and swapped neighbours);
+  - a term of several tokens matches consecutive words that each spell their
+    token exactly or within its limit ("Birth Controll").
+
+k is 1 for tokens of FUZZY_MIN_LENGTH to 9 characters and 2 from 10; shorter
+tokens (Yaz, Ella, LNG, E2, ...) are only matched exactly. A word that is
+itself spelled like a term is never a fuzzy hit ("Estrogens" is not a typo of
+"Estrogen"), and a term already matched exactly gets no fuzzy hit. Lookups are
+memoized per word, since listings reuse the same few thousand words.
+
+Fuzzy hits are reported as "<term> (fuzzy: <listing spelling>)" in
+matched_terms, so they are easy to tell apart from exact ones downstream.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from typing import Dict, FrozenSet, List, Sequence, Set, Tuple
+
+FUZZY_MIN_LENGTH = 6
+_TWO_EDITS_LENGTH = 10
+_Q = 3
+_MEMO_LIMIT = 200_000
+
+Match = Tuple[str, str]
+
+
+def max_edits(length: int) -> int:
+    if length < FUZZY_MIN_LENGTH:
+        return 0
+    return 1 if length < _TWO_EDITS_LENGTH else 2
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = "$$" + text + "$"
+    return {padded[i:i + _Q] for i in range(len(padded) - _Q + 1)}
+
+
+def bounded_distance(a: str, b: str, limit: int) -> int:
+    """Edit distance of a and b counting a swap of neighbours as one edit, or
+    limit + 1 as soon as it is known to exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+def format_fuzzy(term: str, spelling: str) -> str:
+    return f"{term} (fuzzy: {spelling})"
+
+
+class FuzzyTermIndex:
+    """Trigram index over the term tokens, queried with a listing's words."""
+
+    def __init__(self, entries: Dict[Tuple[str, ...], List[Match]]):
+        self._entries = entries
+        # Every single-word term counts as "not a typo", short ones included.
+        self._exact_words = {tokens[0] for tokens in entries if len(tokens) == 1}
+        # first token -> [(all tokens, matches)] for the multi-token terms
+        self._by_first: Dict[str, List[Tuple[Tuple[str, ...], List[Match]]]] = {}
+        tokens_seen: Set[str] = set()
+        for tokens, matched in entries.items():
+            tokens_seen.update(tokens)
+            if len(tokens) > 1:
+                self._by_first.setdefault(tokens[0], []).append((tokens, matched))
+        self._tokens: List[str] = []
+        self._limits: List[int] = []
+        self._needed: List[int] = []
+        self._index: Dict[str, List[int]] = {}
+        for token in sorted(tokens_seen):
+            limit = max_edits(len(token))
+            if not limit:
+                continue
+            token_id = len(self._tokens)
+            grams = trigrams(token)
+            self._tokens.append(token)
+            self._limits.append(limit)
+            self._needed.append(max(1, len(grams) - limit * (_Q + 1)))
+            for gram in grams:
+                self._index.setdefault(gram, []).append(token_id)
+        self._memo: Dict[str, FrozenSet[str]] = {}
+
+    def near_tokens(self, word: str) -> FrozenSet[str]:
+        """Term tokens within their edit limit of `word`, other than `word` itself."""
+        hits = self._memo.get(word)
+        if hits is not None:
+            return hits
+        if word in self._exact_words or len(word) < FUZZY_MIN_LENGTH - 1:
+            hits = frozenset()
+        else:
+            shared: Counter = Counter()
+            for gram in trigrams(word):
+                shared.update(self._index.get(gram, ()))
+            hits = frozenset(
+                self._tokens[token_id] for token_id, count in shared.items()
+                if count >= self._needed[token_id] and self._tokens[token_id] != word
+                and bounded_distance(word, self._tokens[token_id], self._limits[token_id]) <= self._limits[token_id]
+            )
+        if len(self._memo) >= _MEMO_LIMIT:
+            self._memo.clear()
+        self._memo[word] = hits
+        return hits
+
+    def _follows(self, words: Sequence[str], start: int, tokens: Tuple[str, ...]) -> bool:
+        """Whether words[start:] begin with `tokens`, each spelled exactly or nearly,
+        at least one of them nearly."""
+        if start + len(tokens) > len(words):
+            return False
+        fuzzy = False
+        for word, token in zip(words[start:], tokens):
+            if word != token:
+                if token not in self.near_tokens(word):
+                    return False
+                fuzzy = True
+        return fuzzy
+
+    def match(self, words: Sequence[str], exact: Set[Match]) -> Set[Match]:
+        """(category, "<term> (fuzzy: <spelling>)") for every misspelled term in
+        `words` (lowercased) that `exact` doesn't hold already."""
+        found: Set[Match] = set()
+        entries = self._entries
+        for start, word in enumerate(words):
+            near = self.near_tokens(word)
+            for token in near:
+                for category, term in entries.get((token,), ()):
+                    if (category, term) not in exact:
+                        found.add((category, format_fuzzy(term, word)))
+            for first in (word, *near):
+                for tokens, matched in self._by_first.get(first, ()):
+                    if not self._follows(words, start, tokens):
+                        continue
+                    spelling = " ".join(words[start:start + len(tokens)])
+                    for category, term in matched:
+                        if (category, term) not in exact:
+                            found.add((category, format_fuzzy(term, spelling)))
+        return found
@@ -0,0 +1,198 @@
+"""Selectable HTML tree builders for parser.py.
+
+parser.py's extractors are written against the BeautifulSoup API. Building that
+tree with the stdlib html.parser is the slowest part of a parse, so the backend
+is now a choice:
+
+    html.parser  BeautifulSoup + stdlib parser (the historical default)
+    lxml         BeautifulSoup + lxml's C parser (needs `lxml`)
+    selectolax   selectolax's lexbor engine, wrapped in LexborNode (needs `selectolax`)
+
+LexborNode implements the slice of the bs4 Tag API the extractors and
+parser.PageContext use (get_text, select/select_one, find/find_all, get, name,
+...), so extractors run unchanged on every backend. Backends can disagree on
+malformed markup; `parser.py --parity <backend>` parses a sample with two
+backends and reports field-level differences before switching.
+"""
+from __future__ import annotations
+
+from typing import List, Optional
+
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    LexborHTMLParser = None
+
+try:
+    import lxml  # type: ignore  # noqa: F401
+    _HAVE_LXML = True
+except ImportError:  # pragma: no cover - optional dependency
+    _HAVE_LXML = False
+
+DEFAULT_BACKEND = "html.parser"
+BACKENDS = ("html.parser", "lxml", "selectolax")
+
+# bs4's get_text() skips the strings inside these (and comments); lexbor's text()
+# would include them, so they are stripped before a tree is handed out.
+_NON_TEXT_TAGS = ["script", "style", "template"]
+
+
+def available_backends() -> List[str]:
+    names = ["html.parser"]
+    if _HAVE_LXML:
+        names.append("lxml")
+    if LexborHTMLParser is not None:
+        names.append("selectolax")
+    return names
+
+
+def _classes(value: Optional[str]) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return value.split()
+
+
+class LexborNode:
+    """bs4-Tag-like wrapper around a selectolax lexbor node."""
+
+    __slots__ = ("node", "_document")
+
+    def __init__(self, node, document: bool = False):
+        self.node = node
+        self._document = document
+
+    def __bool__(self) -> bool:
+        return True
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, LexborNode) and self.node == other.node
+
+    def __hash__(self) -> int:
+        return hash(self.node)
+
+    def __repr__(self) -> str:
+        return f"<LexborNode {self.name}>"
+
+    @property
+    def name(self) -> str:
+        return self.node.tag
+
+    # -- attributes ---------------------------------------------------------
+    def get(self, attr: str, default=None):
+        attrs = self.node.attributes
+        if attr not in attrs:
+            return default
+        value = attrs[attr]
+        if attr == "class":
+            return _classes(value or "")
+        return "" if value is None else value
+
+    def __getitem__(self, attr: str):
+        value = self.get(attr)
+        if value is None:
+            raise KeyError(attr)
+        return value
+
+    def has_attr(self, attr: str) -> bool:
+        return attr in self.node.attributes
+
+    # -- text ---------------------------------------------------------------
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        if not separator and not strip:
+            return self.node.text(deep=True)
+        # bs4 semantics: join the individual strings, dropping empty ones when stripping.
+        strings = (node.text(deep=False) for node in self.node.traverse(include_text=True)
+                   if node.tag == "-text")
+        if strip:
+            strings = (text.strip() for text in strings)
+            strings = (text for text in strings if text)
+        return separator.join(strings)
+
+    @property
+    def string(self) -> Optional[str]:
+        """bs4 semantics: the lone string beneath a chain of single children."""
+        node = self.node
+        while True:
+            children = list(node.iter(include_text=True))
+            if len(children) != 1:
+                return None
+            child = children[0]
+            if child.tag == "-text":
+                return child.text(deep=False)
+            if child.tag == "-comment":
+                return child.comment_content
+            node = child
+
+    # -- navigation ---------------------------------------------------------
+    def _descendants(self):
+        walk = self.node.traverse(include_text=False)
+        if not self._document:
+            next(walk, None)  # traverse() starts with the node itself
+        for node in walk:
+            if node.tag not in ("-text", "-comment", "-document"):
+                yield LexborNode(node)
+
+    def find_all(self, name=None, string=None, class_=None, attrs=None) -> List["LexborNode"]:
+        found = []
+        for element in self._descendants():
+            if not _matches(element, name, string, class_, attrs):
+                continue
+            found.append(element)
+        return found
+
+    def find(self, name=None, string=None, class_=None, attrs=None) -> Optional["LexborNode"]:
+        for element in self._descendants():
+            if _matches(element, name, string, class_, attrs):
+                return element
+        return None
+
+    def select(self, selector: str) -> List["LexborNode"]:
+        return [LexborNode(node) for node in self.node.css(selector)]
+
+    def select_one(self, selector: str) -> Optional["LexborNode"]:
+        node = self.node.css_first(selector)
+        return None if node is None else LexborNode(node)
+
+
+def _matches(element: LexborNode, name, string, class_, attrs) -> bool:
+    if name not in (None, True):
+        names = [name] if isinstance(name, str) else name
+        if element.name not in names:
+            return False
+    if string is True and element.string is None:
+        return False
+    if class_ is not None:
+        classes = element.get("class") or []
+        candidates = classes + ([" ".join(classes)] if len(classes) > 1 else [])
+        if callable(class_):
+            # bs4 calls the function with each class (or None for a tag without one).
+            if not (any(class_(c) for c in candidates) if classes else class_(None)):
+                return False
+        elif class_ not in candidates:
+            return False
+    for attr, wanted in (attrs or {}).items():
+        if wanted is True:
+            if not element.has_attr(attr):
+                return False
+        elif element.get(attr) != wanted:
+            return False
+    return True
+
+
+def build_tree(html: str, backend: str = DEFAULT_BACKEND):
+    """Parse `html` with `backend`; the result supports the bs4 API the extractors use."""
+    if backend == "html.parser":
+        return BeautifulSoup(html, "html.parser")
+    if backend == "lxml":
+        if not _HAVE_LXML:
+            raise RuntimeError("lxml backend requested; install it (pip install lxml)")
+        return BeautifulSoup(html, "lxml")
+    if backend == "selectolax":
+        if LexborHTMLParser is None:
+            raise RuntimeError("selectolax backend requested; install it (pip install selectolax)")
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(_NON_TEXT_TAGS)
+        return LexborNode(tree.root, document=True)
+    raise ValueError(f"Unknown HTML backend {backend!r} (choose from {', '.join(BACKENDS)})")
@@ -0,0 +1,165 @@
+"""Capture-time pruning of raw product HTML.
+
+Product pages are stored whole, yet most of their bytes are markup that
+parser.py and parser_torzon.py never read: inline <script> and <style> bodies,
+SVG icons, <link> tags, comments, base64-inlined images and site-wide nav menus.
+prune_html() cuts those spans out of the raw HTML string with regexes and leaves
+every other byte untouched, so the pruned page is the original minus dead
+weight, not a re-serialized tree.
+
+What goes, and why it can't change a parsed field:
+
+  - <script>, <style>, comments: get_text() skips them and no selector targets them.
+  - <link> tags: void elements with no text.
+  - <svg> subtrees with no text of their own (icons).
+  - data: URIs in attributes, shortened to "data:," (the element stays).
+  - <nav> subtrees, only when they hold no digits (price, dosage, stock and
+    rating patterns all need one), no headings, tables, <center> or <meta>, and
+    no class or id the extractors look for (KEEP_MARKERS).
+
+The crawlers enable it with --prune-html; each record then also carries the
+size and sha256 of the page as fetched (`original_size`, `original_hash`).
+`--verify` parses a sample of captured pages both ways and lists every field
+that differs:
+
+    python3 src/html_pruner.py --verify data/raw/products_html_20*.json* [--sample 500]
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+from typing import Dict, List
+
+from html_store import content_hash
+
+# Substrings of class / id values that some extractor selects on (parser.py's
+# selector lists and parser_torzon's #description). A nav carrying any of them
+# is kept.
+KEEP_MARKERS = (
+    "title", "price", "amount", "dosage", "strength", "rating", "star", "review",
+    "description", "content", "summary", "stock", "quantity", "site", "brand",
+    "logo", "product", "drug", "mg",
+)
+
+_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+_SCRIPT_STYLE = re.compile(r"<(script|style)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_LINK = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+_SVG = re.compile(r"<svg\b[^>]*>.*?</svg\s*>", re.IGNORECASE | re.DOTALL)
+_NAV = re.compile(r"<nav\b[^>]*>.*?</nav\s*>", re.IGNORECASE | re.DOTALL)
+_DATA_URI = re.compile(r"(?<=[\"'(=])\s*data:[\w.+-]+/[\w.+-]+(?:;[\w=.+-]+)*,[^\"')\s>]{64,}", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+_NAV_KEEP_TAG = re.compile(r"<(?:h[1-6]|table|tr|center|meta|title)\b", re.IGNORECASE)
+_CLASS_OR_ID = re.compile(r"\b(?:class|id)\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+))", re.IGNORECASE)
+
+
+def _svg(match: "re.Match[str]") -> str:
+    # An svg with visible text (<text>, <title>) would show up in get_text().
+    return match.group(0) if _TAG.sub("", match.group(0)).strip() else ""
+
+
+def _nav(match: "re.Match[str]") -> str:
+    span = match.group(0)
+    if any(ch.isdigit() for ch in _TAG.sub("", span)) or _NAV_KEEP_TAG.search(span):
+        return span
+    for groups in _CLASS_OR_ID.findall(span):
+        value = "".join(groups).lower()
+        if any(marker in value for marker in KEEP_MARKERS):
+            return span
+    return ""
+
+
+def prune_html(html: str) -> str:
+    """`html` with the spans listed in the module docstring removed."""
+    if not html:
+        return html
+    html = _COMMENT.sub("", html)
+    html = _SCRIPT_STYLE.sub("", html)
+    html = _LINK.sub("", html)
+    html = _SVG.sub(_svg, html)
+    html = _DATA_URI.sub("data:,", html)
+    return _NAV.sub(_nav, html)
+
+
+def prune_record(record: Dict[str, object]) -> Dict[str, object]:
+    """Prune a captured record's html in place, recording what was fetched."""
+    html = record.get("html")
+    if isinstance(html, str) and html:
+        record["original_size"] = len(html.encode("utf-8"))
+        record["original_hash"] = content_hash(html)
+        record["html"] = prune_html(html)
+    return record
+
+
+# --------------------------------------------------------------------------- #
+# Verification
+# --------------------------------------------------------------------------- #
+
+def verify(records: List[dict]) -> dict:
+    """Parse every record as captured and pruned; report sizes and field diffs."""
+    # Imported here: parser.py pulls in bs4 and the parse pipeline, which capture
+    # itself doesn't need.
+    from parser import parse_product_html
+    from html_store import resolve_html
+
+    report = {"records": len(records), "bytes_before": 0, "bytes_after": 0,
+              "differing_records": 0, "fields": {}, "examples": []}
+    for record in records:
+        html = resolve_html(record)
+        pruned = prune_html(html)
+        report["bytes_before"] += len(html.encode("utf-8"))
+        report["bytes_after"] += len(pruned.encode("utf-8"))
+        a = parse_product_html(dict(record, html=html)) or {}
+        b = parse_product_html(dict(record, html=pruned)) or {}
+        differing = [name for name in dict.fromkeys([*a, *b]) if a.get(name) != b.get(name)]
+        if differing:
+            report["differing_records"] += 1
+        for name in differing:
+            report["fields"][name] = report["fields"].get(name, 0) + 1
+            report["examples"].append((record.get("product_url", ""), name, a.get(name), b.get(name)))
+    return report
+
+
+def print_verify_report(report: dict, max_examples: int = 20) -> None:
+    before, after = report["bytes_before"], report["bytes_after"]
+    saved = 1 - after / before if before else 0.0
+    print(f"Verified {report['records']} listings: {before:,} -> {after:,} bytes ({saved:.1%} smaller)")
+    if not report["differing_records"]:
+        print("  ✅ Every parsed field is identical on pruned HTML")
+        return
+    print(f"  ⚠️  {report['differing_records']} record(s) parse differently")
+    for name, count in sorted(report["fields"].items(), key=lambda item: -item[1]):
+        print(f"    {name:<18} {count}")
+    for url, name, a, b in report["examples"][:max_examples]:
+        print(f"  {url} [{name}]")
+        print(f"    original: {a!r}")
+        print(f"    pruned:   {b!r}")
+
+
+def main() -> None:
+    from merge_html_sessions import session_paths
+    from parser import iter_products_data, sample_listings
+
+    arg_parser = argparse.ArgumentParser(description="Check that pruning captured HTML leaves parsed fields unchanged.")
+    arg_parser.add_argument("--verify", nargs="+", required=True, metavar="SESSION",
+                            help="Session files (.json / .jsonl, globs allowed) to sample listings from")
+    arg_parser.add_argument("--sample", type=int, default=500, help="Listings to verify (default: 500)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Sampling seed (default: 0)")
+    args = arg_parser.parse_args()
+
+    paths = sorted({str(path) for pattern in args.verify for path in session_paths(pattern)})
+    if not paths:
+        raise SystemExit(f"No session files matched {args.verify}")
+
+    def records():
+        for path in paths:
+            yield from iter_products_data(path)[0]
+
+    report = verify(sample_listings(records(), args.sample, args.seed))
+    print_verify_report(report)
+    if report["differing_records"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Content-addressed, compressed store for raw product HTML.
+
+Every crawl session used to carry a full copy of each product page, so the same
+unchanged listing was stored once per session, uncompressed. HtmlStore keys each
+HTML body by the sha256 of its UTF-8 bytes and keeps it compressed (zstd when the
+optional `zstandard` package is installed, gzip otherwise) in append-only packed
+segment files:
+
+    data/raw/store/segment_000001.pack   compressed bodies, back to back
+    data/raw/store/index.jsonl           one line per body: hash -> segment/offset/length
+
+Sessions written with a store (SessionWriter(store=...), or the crawlers'
+--html-store flag) then carry only
+`(market, category_page, product_url, fetched_at, content_hash)`; re-fetching an
+unchanged page costs a hash lookup instead of another copy on disk. Merging moves
+only those small records around, and parser.py resolves `content_hash` back to
+HTML when it actually needs the page.
+
+Existing .json / .jsonl sessions can be converted; each gets a packed copy,
+<stem>.packed.jsonl, which --delete-source swaps in as <stem>.jsonl:
+
+    python3 src/html_store.py --pack data/raw/products_html_20*.json [--delete-source]
+    python3 src/html_store.py --stats
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = PROJECT_ROOT / "data"
+STORE_DIR = DATA_DIR / "raw" / "store"
+
+HASH_KEY = "content_hash"
+INDEX_NAME = "index.jsonl"
+SEGMENT_PATTERN = "segment_{:06d}.pack"
+# Start a new segment once the current one passes this size, so no single file
+# grows without bound (and old segments can be archived untouched).
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+# put() flushes on its own after this many new bodies (see HtmlStore.flush()).
+INDEX_FLUSH_EVERY = 1000
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+try:
+    import zstandard as _zstd  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    _zstd = None
+
+DEFAULT_CODEC = "zstd" if _zstd is not None else "gzip"
+
+
+class HtmlStoreError(Exception):
+    """A record's content_hash can't be resolved: unknown, truncated or corrupt blob."""
+
+
+class BlobRef(NamedTuple):
+    segment: int
+    offset: int
+    length: int
+    codec: str
+    size: int  # uncompressed byte length
+
+
+def content_hash(html: str) -> str:
+    """sha256 hex digest of the page's UTF-8 bytes (the store key)."""
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if _zstd is None:
+            raise RuntimeError("zstd codec requested; install 'zstandard' (pip install zstandard)")
+        return _zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unknown codec {codec!r}")
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if _zstd is None:
+            raise RuntimeError("store holds zstd blobs; install 'zstandard' (pip install zstandard)")
+        return _zstd.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    raise ValueError(f"Unknown codec {codec!r}")
+
+
+class HtmlStore:
+    """Append-only, deduplicating store of compressed HTML bodies.
+
+    The whole index (hash -> BlobRef) is loaded on open; it holds one small
+    entry per *unique* page, not per fetch. put()/get() are thread-safe.
+
+    A new body's index line is held back until flush() has synced the body to
+    its segment, so after a crash the index never points at bytes that didn't
+    reach the disk; entries that do run past the end of their segment anyway
+    (e.g. a store written before this rule) are dropped on load.
+    """
+
+    def __init__(self, root=STORE_DIR, codec: Optional[str] = None):
+        self.root = Path(root)
+        self.codec = codec or DEFAULT_CODEC
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / INDEX_NAME
+        self._index: Dict[str, BlobRef] = {}
+        self._lock = threading.Lock()
+        self._readers: Dict[int, object] = {}
+        self._writer = None
+        self._index_fh = None
+        self._pending_index: List[str] = []
+        self.hits = 0
+        self.writes = 0
+        self.dropped = 0
+        self._load_index()
+        segments = sorted(self.root.glob("segment_*.pack"))
+        self._segment = int(segments[-1].stem.split("_")[1]) if segments else 1
+
+    def _load_index(self) -> None:
+        if not self.index_path.exists():
+            return
+        segment_sizes: Dict[int, int] = {}
+        with self.index_path.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line from a crash; its blob is just orphaned
+                ref = BlobRef(row["segment"], row["offset"], row["length"], row["codec"], row.get("size", -1))
+                if ref.segment not in segment_sizes:
+                    path = self._segment_path(ref.segment)
+                    segment_sizes[ref.segment] = path.stat().st_size if path.exists() else 0
+                if ref.offset + ref.length > segment_sizes[ref.segment]:
+                    # The blob never fully reached the disk: forget it, so the next
+                    # put() of that page stores it again instead of deduping onto it.
+                    self.dropped += 1
+                    continue
+                self._index[row["hash"]] = ref
+        if self.dropped:
+            print(f"⚠️  {self.index_path}: dropped {self.dropped} entries whose blob is missing or truncated")
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _segment_path(self, number: int) -> Path:
+        return self.root / SEGMENT_PATTERN.format(number)
+
+    def _open_writer(self, incoming: int):
+        path = self._segment_path(self._segment)
+        if self._writer is None:
+            self._writer = path.open("ab")
+        if self._writer.tell() and self._writer.tell() + incoming > SEGMENT_MAX_BYTES:
+            self._writer.close()
+            self._segment += 1
+            self._writer = self._segment_path(self._segment).open("ab")
+        return self._writer
+
+    def put(self, html: str) -> str:
+        """Store `html` (if new) and return its content hash."""
+        raw = html.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            if digest in self._index:
+                self.hits += 1
+                return digest
+            blob = _compress(raw, self.codec)
+            writer = self._open_writer(len(blob))
+            offset = writer.tell()
+            writer.write(blob)
+            ref = BlobRef(self._segment, offset, len(blob), self.codec, len(raw))
+            self._pending_index.append(json.dumps({"hash": digest, **ref._asdict()}) + "\n")
+            self._index[digest] = ref
+            self.writes += 1
+            pending = len(self._pending_index)
+        if pending >= INDEX_FLUSH_EVERY:
+            self.flush()
+        return digest
+
+    def get(self, digest: str) -> str:
+        """Return the HTML stored under `digest` (KeyError if unknown)."""
+        ref = self._index[digest]
+        with self._lock:
+            if self._writer is not None and ref.segment == self._segment:
+                self._writer.flush()
+            fh = self._readers.get(ref.segment)
+            if fh is None:
+                fh = self._segment_path(ref.segment).open("rb")
+                self._readers[ref.segment] = fh
+            fh.seek(ref.offset)
+            blob = fh.read(ref.length)
+        return _decompress(blob, ref.codec).decode("utf-8")
+
+    def flush(self, fsync: bool = True) -> None:
+        """Flush segment + index writes. Blobs are flushed and fsynced before
+        their index lines are written at all, so a crash never leaves an index
+        entry pointing at bytes that aren't on disk. `fsync` only decides
+        whether the index file itself is synced too."""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+                if fsync or self._pending_index:
+                    os.fsync(self._writer.fileno())
+            if self._pending_index:
+                if self._index_fh is None:
+                    self._index_fh = self.index_path.open("a", encoding="utf-8")
+                self._index_fh.write("".join(self._pending_index))
+                self._pending_index = []
+            if self._index_fh is not None:
+                self._index_fh.flush()
+                if fsync:
+                    os.fsync(self._index_fh.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            for fh in [self._writer, self._index_fh, *self._readers.values()]:
+                if fh is not None:
+                    fh.close()
+            self._writer = self._index_fh = None
+            self._readers = {}
+
+    def stats(self) -> dict:
+        stored = sum(ref.length for ref in self._index.values())
+        raw = sum(ref.size for ref in self._index.values() if ref.size >= 0)
+        return {"bodies": len(self._index), "raw_bytes": raw, "stored_bytes": stored,
+                "segments": len(list(self.root.glob("segment_*.pack")))}
+
+
+_DEFAULT_STORES: Dict[Path, HtmlStore] = {}
+
+
+def open_store(root=STORE_DIR) -> HtmlStore:
+    """Process-wide shared HtmlStore for `root` (opened once, index loaded once)."""
+    root = Path(root).resolve()
+    store = _DEFAULT_STORES.get(root)
+    if store is None:
+        store = _DEFAULT_STORES[root] = HtmlStore(root)
+    return store
+
+
+def resolve_html(record: dict, store: Optional[HtmlStore] = None) -> str:
+    """Return a record's HTML, inline or via its content_hash.
+
+    Records from a store-backed session carry only `content_hash`; the default
+    store is opened lazily the first time one is seen. A hash the store can't
+    answer raises HtmlStoreError rather than passing for an empty page.
+    """
+    html = record.get("html")
+    if html:
+        return html
+    digest = record.get(HASH_KEY)
+    if not digest:
+        return ""
+    store = store or open_store()
+    try:
+        return store.get(digest)
+    except KeyError:
+        raise HtmlStoreError(f"content_hash {digest} is not in the HTML store at {store.root}") from None
+    except Exception as exc:  # truncated blob, corrupt bytes, missing codec
+        raise HtmlStoreError(f"content_hash {digest}: unreadable blob in {store.root}: {exc}") from exc
+
+
+def pack_session(path: Path, store: HtmlStore) -> Path:
+    """Rewrite one session file as a store-backed <stem>.packed.jsonl next to it.
+
+    Returns the new path. Neither the packed copy nor its temp file
+    (<stem>.packing) is picked up by merge_html_sessions.session_paths(), so the
+    source stays the only copy that gets merged. adopt_packed() (--delete-source)
+    swaps the packed copy in once it has been checked.
+    """
+    # Imported here: merge_html_sessions itself reads store-backed sessions.
+    from merge_html_sessions import iter_records
+    from session_writer import SESSION_EXT, SessionWriter
+
+    target = path.with_name(f"{path.stem}.packed{SESSION_EXT}")
+    tmp = path.with_name(f"{path.stem}.packing")
+    if tmp.exists():
+        tmp.unlink()
+    writer = SessionWriter(tmp, fsync_every=1000, store=store)
+    for record in iter_records(path):
+        writer.append(record)
+    writer.close(extra={"packed_from": path.name})
+    os.replace(tmp, target)
+    return target
+
+
+def adopt_packed(path: Path, packed: Path) -> Path:
+    """Replace session `path` with its packed copy, as <stem>.jsonl."""
+    from session_writer import SESSION_EXT
+
+    final = path.with_suffix(SESSION_EXT)
+    os.replace(packed, final)
+    if final != path:
+        path.unlink()
+    return final
+
+
+def _format_mb(n: int) -> str:
+    return f"{n / 1e6:.1f} MB"
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Content-addressed raw HTML store")
+    parser.add_argument("--store", type=Path, default=STORE_DIR,
+                        help=f"Store directory (default: {STORE_DIR})")
+    parser.add_argument("--pack", type=Path, nargs="+", default=None,
+                        help="Session file(s) to convert into store-backed .jsonl sessions")
+    parser.add_argument("--delete-source", action="store_true",
+                        help="With --pack: replace each source file with its packed copy "
+                             "(<stem>.jsonl) instead of leaving <stem>.packed.jsonl beside it")
+    parser.add_argument("--stats", action="store_true", help="Print store size / dedup stats")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    args = parse_args(argv)
+    store = HtmlStore(args.store)
+
+    for path in args.pack or []:
+        before = path.stat().st_size
+        target = pack_session(path, store)
+        if args.delete_source:
+            target = adopt_packed(path, target)
+        print(f"  {path.name} ({_format_mb(before)}) -> {target.name} "
+              f"({_format_mb(target.stat().st_size)}); store now {len(store)} bodies")
+    if args.pack:
+        print(f"Packed {len(args.pack)} session(s): {store.writes} new bodies, "
+              f"{store.hits} deduplicated")
+
+    if args.stats or not args.pack:
+        s = store.stats()
+        ratio = s["raw_bytes"] / s["stored_bytes"] if s["stored_bytes"] else 0.0
+        print(f"{args.store}: {s['bodies']} unique bodies in {s['segments']} segment(s), "
+              f"{_format_mb(s['raw_bytes'])} raw -> {_format_mb(s['stored_bytes'])} stored "
+              f"({ratio:.1f}x)")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Persistent inverted index over parsed listings, with a query CLI.
+
+Ad-hoc questions ("which markets list Cytotec 200mcg", "how many listings
+mention Postinor") used to mean editing the keyword file and re-running
+filter_medicines.py over every record. ListingIndex keeps positional postings
+for the words of each listing's title, description, review and dosage in a
+SQLite file, keyed by original_url, so a query reads only the postings of its
+own words.
+
+Words are the filter's: runs of \\w characters, lowercased. Each posting holds
+the word's positions within one field, so phrases match consecutive words of
+the same field. Indexing is incremental: files whose size and mtime are
+unchanged are skipped, and within a file only listings whose indexed text
+changed are rewritten.
+
+    python3 src/listing_index.py --add data/parsed/parsed_merged.json data/parsed/*.parsed.jsonl
+    python3 src/listing_index.py --query '"cytotec 200mcg"' --by-market
+    python3 src/listing_index.py --query postinor --count
+    python3 src/listing_index.py --query category:abortion_meds title:pill
+
+A query is a list of clauses, all of which must match:
+
+    word                 a word in any indexed field
+    "two words"          a phrase
+    title:word           restricted to one field (title, description, review, dosage)
+    title:"two words"
+    category:<name>      any term of that search_keywords.json category, each as a phrase
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from filter_medicines import TERM_GROUPS, load_products, load_term_groups, normalise_cell
+from html_store import content_hash
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_INDEX = PROJECT_ROOT / "data" / "listing_index.sqlite"
+DEFAULT_KEYWORDS = PROJECT_ROOT / "data" / "config" / "search_keywords.json"
+
+INDEXED_FIELDS: Tuple[str, ...] = ("listing_title", "description", "review", "dosage")
+FIELD_ALIASES = {"title": "listing_title"}
+
+# SQLite's default limit on bound parameters is 999 on older builds.
+_LOOKUP_CHUNK = 500
+
+_WORD = re.compile(r"\w+")
+_CLAUSE = re.compile(r'(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+
+# doc_id -> field number -> positions
+Postings = Dict[int, Dict[int, List[int]]]
+
+
+def tokenize(text: str) -> List[str]:
+    return [word.lower() for word in _WORD.findall(text)]
+
+
+class ListingIndex:
+    """SQLite-backed positional index: word -> (listing, field, positions)."""
+
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            " doc_id INTEGER PRIMARY KEY,"
+            " original_url TEXT NOT NULL UNIQUE,"
+            " fingerprint TEXT NOT NULL,"
+            " market_name TEXT,"
+            " listing_title TEXT,"
+            " source TEXT);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " word TEXT NOT NULL,"
+            " doc_id INTEGER NOT NULL,"
+            " field INTEGER NOT NULL,"
+            " positions TEXT NOT NULL,"
+            " PRIMARY KEY (word, doc_id, field)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);"
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL);"
+        )
+        self._conn.commit()
+
+    def __enter__(self) -> "ListingIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    # ------------------------------------------------------------------ #
+    # Indexing
+    # ------------------------------------------------------------------ #
+
+    def add_records(self, records: Iterable[Dict[str, object]], source: str = "") -> Dict[str, int]:
+        """Index `records`; listings whose indexed text is unchanged are skipped."""
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "no_url": 0}
+        for record in records:
+            url = normalise_cell(record.get("original_url", ""))
+            if not url:
+                counts["no_url"] += 1
+                continue
+            texts = [normalise_cell(record.get(name, "")) for name in INDEXED_FIELDS]
+            fingerprint = content_hash("\x00".join(texts))
+            row = self._conn.execute("SELECT doc_id, fingerprint FROM listings WHERE original_url = ?",
+                                     (url,)).fetchone()
+            if row and row[1] == fingerprint:
+                counts["unchanged"] += 1
+                continue
+            meta = (fingerprint, normalise_cell(record.get("market_name", "")),
+                    normalise_cell(record.get("listing_title", "")), source)
+            if row:
+                doc_id = row[0]
+                self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                self._conn.execute("UPDATE listings SET fingerprint = ?, market_name = ?, listing_title = ?,"
+                                   " source = ? WHERE doc_id = ?", (*meta, doc_id))
+                counts["updated"] += 1
+            else:
+                doc_id = self._conn.execute("INSERT INTO listings (original_url, fingerprint, market_name,"
+                                            " listing_title, source) VALUES (?, ?, ?, ?, ?)",
+                                            (url, *meta)).lastrowid
+                counts["added"] += 1
+            rows = []
+            for field, text in enumerate(texts):
+                positions: Dict[str, List[str]] = {}
+                for position, word in enumerate(tokenize(text)):
+                    positions.setdefault(word, []).append(str(position))
+                rows.extend((word, doc_id, field, " ".join(found)) for word, found in positions.items())
+            self._conn.executemany("INSERT INTO postings (word, doc_id, field, positions) VALUES (?, ?, ?, ?)",
+                                   rows)
+        self._conn.commit()
+        return counts
+
+    def add_file(self, path, force: bool = False) -> Optional[Dict[str, int]]:
+        """Index one parsed file (.json or .jsonl); None if it is unchanged since
+        it was last indexed."""
+        path = Path(path)
+        stat = path.stat()
+        key = str(path.resolve())
+        row = self._conn.execute("SELECT size, mtime_ns FROM sources WHERE path = ?", (key,)).fetchone()
+        if not force and row == (stat.st_size, stat.st_mtime_ns):
+            return None
+        counts = self.add_records(load_products(path), source=path.name)
+        self._conn.execute("INSERT OR REPLACE INTO sources (path, size, mtime_ns) VALUES (?, ?, ?)",
+                           (key, stat.st_size, stat.st_mtime_ns))
+        self._conn.commit()
+        return counts
+
+    # ------------------------------------------------------------------ #
+    # Queries
+    # ------------------------------------------------------------------ #
+
+    def _where(self, word: str, field: Optional[int]) -> Tuple[str, list]:
+        if field is None:
+            return "word = ?", [word]
+        return "word = ? AND field = ?", [word, field]
+
+    def docs(self, word: str, field: Optional[int] = None) -> Set[int]:
+        where, params = self._where(word, field)
+        return {doc_id for (doc_id,) in self._conn.execute(f"SELECT doc_id FROM postings WHERE {where}", params)}
+
+    def frequency(self, word: str, field: Optional[int] = None) -> int:
+        where, params = self._where(word, field)
+        return self._conn.execute(f"SELECT COUNT(*) FROM postings WHERE {where}", params).fetchone()[0]
+
+    def postings(self, word: str, field: Optional[int] = None, doc_ids: Optional[Set[int]] = None) -> Postings:
+        """Positions of `word`, optionally only within `doc_ids`."""
+        where, params = self._where(word, field)
+        if doc_ids is None:
+            batches = [("", [])]
+        else:
+            ids = sorted(doc_ids)
+            batches = [(f" AND doc_id IN ({','.join('?' * len(ids[i:i + _LOOKUP_CHUNK]))})",
+                        ids[i:i + _LOOKUP_CHUNK]) for i in range(0, len(ids), _LOOKUP_CHUNK)]
+        found: Postings = {}
+        for restrict, ids in batches:
+            rows = self._conn.execute(f"SELECT doc_id, field, positions FROM postings WHERE {where}{restrict}",
+                                      params + ids)
+            for doc_id, field_no, positions in rows:
+                found.setdefault(doc_id, {})[field_no] = [int(p) for p in positions.split()]
+        return found
+
+    def phrase(self, words: Sequence[str], field: Optional[int] = None) -> Set[int]:
+        """Listings holding `words` as consecutive words of one field."""
+        if not words:
+            return set()
+        if len(words) == 1:
+            return self.docs(words[0], field)
+        # Start from the rarest word; the others are only read for the listings it leaves.
+        order = sorted(set(words), key=lambda word: self.frequency(word, field))
+        candidates: Optional[Set[int]] = None
+        lists: Dict[str, Postings] = {}
+        for word in order:
+            lists[word] = self.postings(word, field, candidates)
+            candidates = set(lists[word]) if candidates is None else candidates & lists[word].keys()
+            if not candidates:
+                return set()
+        found: Set[int] = set()
+        for doc_id in candidates:
+            for field_no, starts in lists[words[0]][doc_id].items():
+                positions = set(starts)
+                for offset, word in enumerate(words[1:], start=1):
+                    following = lists[word][doc_id].get(field_no, ())
+                    positions &= {position - offset for position in following}
+                    if not positions:
+                        break
+                if positions:
+                    found.add(doc_id)
+                    break
+        return found
+
+    def listings(self, doc_ids: Iterable[int]) -> List[Tuple[str, str, str]]:
+        """(market_name, listing_title, original_url) for `doc_ids`, sorted."""
+        found = []
+        ids = list(doc_ids)
+        for start in range(0, len(ids), _LOOKUP_CHUNK):
+            chunk = ids[start:start + _LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            found.extend(self._conn.execute(
+                f"SELECT market_name, listing_title, original_url FROM listings WHERE doc_id IN ({marks})", chunk))
+        return sorted(found)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "listings": self._conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0],
+            "words": self._conn.execute("SELECT COUNT(DISTINCT word) FROM postings").fetchone()[0],
+            "postings": self._conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0],
+            "files": self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0],
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _field_number(name: str) -> int:
+    name = FIELD_ALIASES.get(name, name)
+    if name not in INDEXED_FIELDS:
+        raise ValueError(f"unknown field {name!r}; choose from title, {', '.join(INDEXED_FIELDS[1:])}")
+    return INDEXED_FIELDS.index(name)
+
+
+def run_query(index: ListingIndex, query: str, term_groups: Dict[str, Sequence[str]] = TERM_GROUPS) -> Set[int]:
+    """doc_ids matching every clause of `query` (syntax in the module docstring)."""
+    result: Optional[Set[int]] = None
+    for prefix, quoted, bare in _CLAUSE.findall(query):
+        text = quoted if quoted else bare
+        if prefix == "category":
+            if text not in term_groups:
+                raise ValueError(f"unknown category {text!r}; choose from {', '.join(term_groups)}")
+            docs: Set[int] = set()
+            for term in term_groups[text]:
+                docs |= index.phrase(tokenize(" ".join(re.split(r"[\s\-]+", term))))
+        else:
+            field = _field_number(prefix) if prefix else None
+            docs = index.phrase(tokenize(text), field)
+        result = docs if result is None else result & docs
+        if not result:
+            return set()
+    return result or set()
+
+
+def expand_paths(patterns: Sequence[str]) -> List[str]:
+    return sorted({path for pattern in patterns for path in (glob.glob(pattern) or [pattern])})
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build and query the inverted index over parsed listings.")
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX, help=f"Index file (default: {DEFAULT_INDEX})")
+    parser.add_argument("--add", nargs="+", metavar="PARSED", default=None,
+                        help="Parsed files (.json / .jsonl, globs allowed) to index; unchanged files are skipped")
+    parser.add_argument("--force", action="store_true", help="Re-read --add files even if unchanged")
+    parser.add_argument("--query", "-q", default=None, help="Query to run (see the module docstring)")
+    parser.add_argument("--count", action="store_true", help="Only print the number of matching listings")
+    parser.add_argument("--by-market", action="store_true", help="Print matching listings per market")
+    parser.add_argument("--limit", type=int, default=50, help="Listings to print (default: 50, 0 for all)")
+    parser.add_argument("--keywords", "-k", type=Path, default=DEFAULT_KEYWORDS,
+                        help="Keyword groups JSON for category: queries (default: built-in TERM_GROUPS if missing)")
+    parser.add_argument("--stats", action="store_true", help="Print index size")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    args = parse_args(argv)
+    with ListingIndex(args.index) as index:
+        for path in expand_paths(args.add or []):
+            counts = index.add_file(path, force=args.force)
+            if counts is None:
+                print(f"  {path}: unchanged, skipped")
+            else:
+                print(f"  {path}: {counts['added']} added, {counts['updated']} updated, "
+                      f"{counts['unchanged']} unchanged, {counts['no_url']} without original_url")
+
+        if args.query:
+            term_groups = load_term_groups(args.keywords) if args.keywords.exists() else TERM_GROUPS
+            started = time.perf_counter()
+            try:
+                doc_ids = run_query(index, args.query, term_groups)
+            except ValueError as exc:
+                raise SystemExit(f"Bad query: {exc}")
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"{len(doc_ids)} listing(s) match {args.query!r} ({elapsed:.1f} ms)")
+            if not args.count:
+                listings = index.listings(doc_ids)
+                if args.by_market:
+                    per_market: Dict[str, int] = {}
+                    for market, _, _ in listings:
+                        per_market[market or "(unknown)"] = per_market.get(market or "(unknown)", 0) + 1
+                    for market, count in sorted(per_market.items(), key=lambda item: (-item[1], item[0])):
+                        print(f"  {market:<30} {count}")
+                else:
+                    shown = listings if args.limit <= 0 else listings[:args.limit]
+                    for market, title, url in shown:
+                        print(f"  [{market}] {title}\n      {url}")
+                    if len(shown) < len(listings):
+                        print(f"  ... {len(listings) - len(shown)} more (--limit 0 to show all)")
+
+        if args.stats or not (args.add or args.query):
+            stats = index.stats()
+            print(f"{index.path}: {stats['listings']} listings, {stats['words']} distinct words, "
+                  f"{stats['postings']} postings from {stats['files']} file(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Benchmark evaluate_llm.py's batched mode (--batch-size) against single-item calls.
+
+Sends the same seeded sample of listings to the LLM server once per listing, then
+K per request for each K in --batch-sizes, and reports for every mode the
+listings/sec, the requests sent (batches plus the listings re-asked alone) and
+how often its verdicts agree with the single-item ones: same llm_relevant, same
+llm_category, and both. The verdict cache is neither read nor written, and the
+response_format is negotiated once up front, so every mode pays for the same
+work. Results are written as JSON next to parser_bench.py's.
+
+    python3 src/llm_bench.py --sample 100 --batch-sizes 4 8 16
+    python3 src/llm_bench.py -c 4 --base-url http://localhost:8080/v1 --model qwen2.5-7b-instruct
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from evaluate_llm import (
+    DEFAULT_BASE_URL,
+    DEFAULT_INPUTS,
+    DEFAULT_MODEL,
+    _normalise_verdict,
+    build_user_message,
+    check_server,
+    load_records,
+    negotiate_response_format,
+    submit_calls,
+)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_RESULTS = PROJECT_ROOT / "data" / "bench" / "llm_batch.json"
+
+RESULTS_VERSION = 1
+# Disagreeing listings kept per mode in the results file.
+MAX_DISAGREEMENTS = 20
+
+
+def sample_records(records: List[dict], size: int, seed: int = 0) -> List[dict]:
+    """A seeded sample of `size` records in input order (all of them if size <= 0)."""
+    if size <= 0 or size >= len(records):
+        return list(records)
+    picked = sorted(random.Random(seed).sample(range(len(records)), size))
+    return [records[i] for i in picked]
+
+
+def run_mode(records: List[dict], base_url: str, model: str, max_desc: int, timeout: int,
+             concurrency: int = 1, batch_size: int = 1) -> dict:
+    """Evaluate `records` like evaluate_llm.py --no-cache would; returns the
+    normalised verdicts, the wall time and the re-queried count."""
+    user_msgs = [build_user_message(record, max_desc) for record in records]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = [call.result() for call in submit_calls(executor, base_url, model, user_msgs,
+                                                          timeout, batch_size)]
+    seconds = time.perf_counter() - started
+    verdicts = [_normalise_verdict(raw) for raw, _ in results]
+    requeried = sum(1 for _, retried in results if retried)
+    requests = (math.ceil(len(records) / batch_size) + requeried) if batch_size > 1 else len(records)
+    return {
+        "batch_size": batch_size,
+        "seconds": round(seconds, 3),
+        "listings_per_sec": round(len(records) / seconds, 3) if seconds else 0.0,
+        "requests": requests,
+        "requeried": requeried,
+        "undecided": sum(1 for verdict in verdicts if verdict["llm_relevant"] is None),
+        "verdicts": verdicts,
+    }
+
+
+def agreement(records: List[dict], reference: List[dict], verdicts: List[dict]) -> dict:
+    """Share of listings whose verdict matches the reference one."""
+    same_relevant = same_category = same_both = 0
+    disagreements = []
+    for record, ref, verdict in zip(records, reference, verdicts):
+        relevant = ref["llm_relevant"] == verdict["llm_relevant"]
+        category = ref["llm_category"] == verdict["llm_category"]
+        same_relevant += relevant
+        same_category += category
+        same_both += relevant and category
+        if not (relevant and category) and len(disagreements) < MAX_DISAGREEMENTS:
+            disagreements.append({
+                "listing_title": record.get("listing_title", ""),
+                "single": [ref["llm_relevant"], ref["llm_category"]],
+                "batched": [verdict["llm_relevant"], verdict["llm_category"]],
+            })
+    total = len(reference) or 1
+    return {"relevant": round(same_relevant / total, 4), "category": round(same_category / total, 4),
+            "both": round(same_both / total, 4), "disagreements": disagreements}
+
+
+def print_results(results: dict) -> None:
+    single = results["modes"][0]
+    print(f"{results['listings']} listings, model {results['model']} @ {results['base_url']}, "
+          f"concurrency {results['concurrency']}, response_format {results['response_format']}")
+    print(f"  {'mode':<10} {'listings/s':>10} {'speedup':>8} {'requests':>9} {'re-asked':>9} "
+          f"{'undecided':>9} {'relevant':>9} {'category':>9} {'both':>7}")
+    for mode in results["modes"]:
+        agree = mode.get("agreement")
+        speedup = mode["listings_per_sec"] / single["listings_per_sec"] if single["listings_per_sec"] else 0.0
+        label = "single" if mode["batch_size"] == 1 else f"batch {mode['batch_size']}"
+        shares = (f"{agree['relevant']:>9.1%} {agree['category']:>9.1%} {agree['both']:>7.1%}"
+                  if agree else f"{'-':>9} {'-':>9} {'-':>7}")
+        print(f"  {label:<10} {mode['listings_per_sec']:>10.2f} {speedup:>7.2f}x {mode['requests']:>9} "
+              f"{mode['requeried']:>9} {mode['undecided']:>9} {shares}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(
+        description="Compare evaluate_llm.py's batched prompts with single-item calls.")
+    arg_parser.add_argument("--input", "-i", type=Path, nargs="+", default=DEFAULT_INPUTS,
+                            help="Filtered listings JSON files to sample from (default: evaluate_llm.py's)")
+    arg_parser.add_argument("--sample", type=int, default=100,
+                            help="Listings sampled from the inputs (default: 100; 0 = all)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Sampling seed (default: 0)")
+    arg_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8],
+                            help="Batch sizes to compare with single-item calls (default: 4 8)")
+    arg_parser.add_argument("--base-url", default=DEFAULT_BASE_URL,
+                            help=f"OpenAI-compatible API base (default: {DEFAULT_BASE_URL})")
+    arg_parser.add_argument("--model", default=DEFAULT_MODEL, help=f"Model id (default: {DEFAULT_MODEL})")
+    arg_parser.add_argument("--concurrency", "-c", type=int, default=1,
+                            help="Requests kept in flight in every mode (default: 1)")
+    arg_parser.add_argument("--max-desc-chars", type=int, default=800, help="Truncate description to N chars")
+    arg_parser.add_argument("--timeout", type=int, default=120, help="Per-request timeout in seconds")
+    arg_parser.add_argument("--output", "-o", type=Path, default=DEFAULT_RESULTS,
+                            help=f"Results JSON (default: {DEFAULT_RESULTS})")
+    args = arg_parser.parse_args(argv)
+
+    records: List[dict] = []
+    for path in args.input:
+        if path.exists():
+            records.extend(load_records(path))
+        else:
+            print(f"  skip (missing): {path}")
+    records = sample_records(records, args.sample, args.seed)
+    if not records:
+        raise SystemExit("No records found in any input file; nothing to benchmark.")
+
+    check_server(args.base_url, args.model)
+    response_format = negotiate_response_format(args.base_url, args.model, args.timeout)
+    modes: List[Dict[str, object]] = []
+    for batch_size in [1] + sorted(set(k for k in args.batch_sizes if k > 1)):
+        label = "single-item" if batch_size == 1 else f"batches of {batch_size}"
+        print(f"Evaluating {len(records)} listings, {label}...")
+        mode = run_mode(records, args.base_url, args.model, args.max_desc_chars, args.timeout,
+                        args.concurrency, batch_size)
+        if modes:
+            mode["agreement"] = agreement(records, modes[0]["verdicts"], mode["verdicts"])
+        modes.append(mode)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "base_url": args.base_url,
+        "model": args.model,
+        "response_format": response_format,
+        "concurrency": max(1, args.concurrency),
+        "listings": len(records),
+        "modes": [{key: value for key, value in mode.items() if key != "verdicts"} for mode in modes],
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("w", encoding="utf-8") as fh:
+        json.dump(results, fh, ensure_ascii=False, indent=2)
+    print_results(results)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,84 @@
 """Merge per-session raw HTML crawl files and drop duplicate products.
 
-Each crawl session writes its own data/products_html_<timestamp>.json (see
-scrape_simple.py). This tool unions all of those, keeping a single record per
-product_url -- the one with the newest fetched_at -- so the downstream parse +
-filter stages only see each listing once.
-
-Files are loaded one at a time and only the surviving (deduped) records are held
-in memory, so peak memory is roughly "unique records" rather than "all files at
-once". Individual session files can still be hundreds of MB; if a single file is
-too large to json.load, install ijson and the loader will stream it instead.
+Each crawl session writes its own data/raw/products_html_<timestamp>.jsonl (see
+scrape_simple.py / session_writer.py; older sessions are .json arrays). This tool
+unions all of those, keeping a single record per product_url -- the one with the
+newest fetched_at -- so the downstream parse + filter stages only see each
+listing once.
+
+The merge runs in two passes so peak memory scales with the number of URLs, not
+with total HTML bytes:
+
+  1. Index: each session file is scanned record by record (JSONL line by line,
+     .json arrays through an mmap) and only
+     product_url -> (file, byte offset, length, fetched_at, content hash) of the
+     current winner is kept; the record itself is dropped straight away.
+  2. Copy: the winning records' bytes are copied from their source offsets into
+     the merged JSON array, file by file in offset order, without decoding or
+     re-serializing them.
+
+Next to the output goes an offset index (products_html_merged.idx: URL and
+content hash -> byte span, read by merged_corpus.MergedCorpus). With
+--incremental (or an explicit --manifest) a manifest is kept too: size, mtime
+and sha256 of each merged file, plus the survivor index. Only session files not
+in the manifest are indexed and the output is rebuilt from the stored offsets;
+if any previously-merged file changed or vanished, or the output was edited, the
+run falls back to a full rebuild. A plain merge neither reads nor writes the
+manifest, so it never pays for hashing the sessions.
 """
 from __future__ import annotations
 
 import argparse
 import glob
+import hashlib
 import json
+import mmap
 import os
+import re
+import time
 from pathlib import Path
-from typing import Dict, Iterator, List
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from merged_corpus import CorpusIndexBuilder, index_path_for, record_hash
+from session_writer import SESSION_EXT, is_footer, iter_jsonl
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 
-# Match the timestamped session files (products_html_20260604_133729.json, ...)
-# without picking up the legacy un-timestamped products_html.json.
-DEFAULT_GLOB = str(DATA_DIR / "raw" / "products_html_20*.json")
+# Match the timestamped session files (products_html_20260604_133729.json and the
+# streamed products_html_20260701_101500.jsonl) without picking up the legacy
+# un-timestamped products_html.json.
+DEFAULT_GLOB = str(DATA_DIR / "raw" / "products_html_20*.json*")
+SESSION_SUFFIXES = (".json", SESSION_EXT)
 DEFAULT_OUTPUT = DATA_DIR / "merged" / "products_html_merged.json"
 
 DEDUP_KEY = "product_url"
 RECENCY_KEY = "fetched_at"
+NO_URL_PREFIX = "__no_url__"
+
+# Bump when the manifest layout changes; an old manifest then forces a rebuild.
+MANIFEST_VERSION = 3
 
 # Files larger than this are streamed with ijson rather than json.load, to keep
 # peak memory bounded on machines without much free RAM.
 STREAM_THRESHOLD_BYTES = 150 * 1024 * 1024  # 150 MB
 
+# Survivor index entry: (file id, byte offset, byte length, fetched_at, content
+# hash). The hash rides along so pass 2 can write the offset index without
+# decoding the records it copies.
+Span = Tuple[int, int, int, object, Optional[str]]
+
+
+class TruncatedSessionError(ValueError):
+    """A session file ends in the middle of a record (crawl interrupted mid-write)."""
+
+
 # Truncated files (interrupted crawls) raise these while parsing; ijson has its
 # own error type, referenced here without making ijson a hard import.
-_PARSE_ERRORS: tuple = (json.JSONDecodeError,)
+_PARSE_ERRORS: tuple = (json.JSONDecodeError, TruncatedSessionError)
 try:
     from ijson.common import IncompleteJSONError as _StreamError
-    _PARSE_ERRORS = (json.JSONDecodeError, _StreamError)
+    _PARSE_ERRORS = (json.JSONDecodeError, TruncatedSessionError, _StreamError)
 except ImportError:  # pragma: no cover
     pass
 
@@ -70,9 +109,14 @@ def _iter_streaming(path: Path) -> Iterator[dict]:
 def iter_records(path: Path) -> Iterator[dict]:
     """Yield product dicts from one session file.
 
-    Large files (> STREAM_THRESHOLD_BYTES) are streamed with ijson to keep peak
-    memory bounded; small ones use a plain json.load.
+    JSONL sessions are read one line at a time. Large JSON arrays
+    (> STREAM_THRESHOLD_BYTES) are streamed with ijson to keep peak memory
+    bounded; small ones use a plain json.load.
     """
+    if path.suffix == SESSION_EXT:
+        yield from iter_jsonl(path)
+        return
+
     if path.stat().st_size > STREAM_THRESHOLD_BYTES:
         yield from _iter_streaming(path)
         return
@@ -86,43 +130,317 @@ def iter_records(path: Path) -> Iterator[dict]:
             yield item
 
 
-def merge(paths: List[Path]) -> Dict[str, dict]:
-    """Union records across files, keeping the newest per product_url."""
-    survivors: Dict[str, dict] = {}
+# --------------------------------------------------------------------------- #
+# Byte spans: where each record lives inside its session file
+# --------------------------------------------------------------------------- #
+
+# Structural characters outside string literals, and the two characters that can
+# end a run of string content (the closing quote or an escape).
+_STRUCTURE_RE = re.compile(rb'[\[\]{}"]')
+_STRING_STOP_RE = re.compile(rb'["\\]')
+
+
+def _iter_array_spans(buf) -> Iterator[Tuple[int, int]]:
+    """Yield (offset, length) of each top-level object in a JSON array buffer.
+
+    Only structure outside strings is inspected -- the regexes jump from one
+    quote/bracket to the next -- so multi-MB HTML strings are skipped at C speed.
+    """
+    pos = 0
+    depth = 0
+    start = 0
+    while True:
+        m = _STRUCTURE_RE.search(buf, pos)
+        if m is None:
+            if depth:
+                raise TruncatedSessionError("file ends inside the JSON array")
+            return
+        char = m.group()
+        pos = m.end()
+        if char == b'"':
+            while True:
+                stop = _STRING_STOP_RE.search(buf, pos)
+                if stop is None:
+                    raise TruncatedSessionError("file ends inside a string")
+                if stop.group() == b"\\":
+                    pos = stop.end() + 1  # skip the escaped character
+                    continue
+                pos = stop.end()
+                break
+        elif char in (b"[", b"{"):
+            if depth == 1 and char == b"{":
+                start = m.start()
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1 and char == b"}":
+                yield start, pos - start
+            elif depth <= 0:
+                return
+
+
+def iter_spans(path: Path) -> Iterator[Tuple[int, int, dict]]:
+    """Yield (offset, length, record) for each product record in a session file.
+
+    Each record is decoded from its own byte span and can be dropped right away;
+    JSON arrays are scanned through an mmap, JSONL line by line. A truncated file
+    yields its intact records and then raises one of _PARSE_ERRORS.
+    """
+    if path.suffix == SESSION_EXT:
+        with path.open("rb") as fh:
+            offset = 0
+            for line in fh:
+                body = line.rstrip(b"\r\n")
+                if body.strip():
+                    try:
+                        record = json.loads(body)
+                    except json.JSONDecodeError:
+                        if not line.endswith(b"\n"):
+                            raise TruncatedSessionError("torn final line")
+                        raise
+                    if isinstance(record, dict) and not is_footer(record):
+                        yield offset, len(body), record
+                offset += len(line)
+        return
+
+    if path.stat().st_size == 0:
+        return
+    with path.open("rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for offset, length in _iter_array_spans(buf):
+            record = json.loads(buf[offset:offset + length])
+            if isinstance(record, dict):
+                yield offset, length, record
+
+
+# --------------------------------------------------------------------------- #
+# Pass 1: product_url -> span index.  Pass 2: copy the winning spans.
+# --------------------------------------------------------------------------- #
+
+def build_index(
+    paths: List[Path],
+    file_ids: Dict[Path, int],
+    index: Optional[Dict[str, Span]] = None,
+) -> Dict[str, Span]:
+    """Index the newest record per product_url as (file id, offset, length, fetched_at,
+    content hash).
+
+    `index` (e.g. restored from a merge manifest) is updated in place, so an
+    incremental run only scans new files. Ties on fetched_at go to the later record.
+    """
+    index = {} if index is None else index
     no_url = 0
     for path in paths:
+        file_id = file_ids[path]
         seen_in_file = 0
-        kept_before = len(survivors)
+        kept_before = len(index)
         truncated = False
         try:
-            for record in iter_records(path):
+            for offset, length, record in iter_spans(path):
                 seen_in_file += 1
                 url = record.get(DEDUP_KEY)
+                fetched_at = record.get(RECENCY_KEY)
                 if not url:
-                    # No dedup key -- keep it under a synthetic unique key so it
-                    # isn't silently dropped.
+                    # No dedup key -- keep it under a synthetic key (stable across
+                    # runs) so it isn't silently dropped.
                     no_url += 1
-                    survivors[f"__no_url__{no_url}"] = record
+                    index[f"{NO_URL_PREFIX}{path.name}:{offset}"] = \
+                        (file_id, offset, length, fetched_at, record_hash(record))
                     continue
-                existing = survivors.get(url)
-                if existing is None or _coerce_recency(record.get(RECENCY_KEY)) >= _coerce_recency(
-                    existing.get(RECENCY_KEY)
-                ):
-                    survivors[url] = record
+                existing = index.get(url)
+                if existing is None or _coerce_recency(fetched_at) >= _coerce_recency(existing[3]):
+                    index[url] = (file_id, offset, length, fetched_at, record_hash(record))
         except _PARSE_ERRORS as exc:
             # A crawl interrupted mid-write leaves a truncated file. Keep the
             # records salvaged before the break and move on.
             truncated = True
             print(f"  WARNING: {path.name} is truncated ({exc}); kept {seen_in_file} salvaged record(s)")
-        added = len(survivors) - kept_before
+        added = len(index) - kept_before
         suffix = " [TRUNCATED]" if truncated else ""
         print(
             f"  {path.name}: read {seen_in_file}, "
-            f"net-new unique {added} (running total {len(survivors)}){suffix}"
+            f"net-new unique {added} (running total {len(index)}){suffix}"
         )
     if no_url:
         print(f"  note: {no_url} record(s) had no {DEDUP_KEY} and were kept as-is")
-    return survivors
+    return index
+
+
+def write_merged(index: Dict[str, Span], sources: Dict[int, Path], output: Path) -> int:
+    """Copy each winning record's bytes into `output` as a JSON array.
+
+    Spans are read file by file in offset order (sequential I/O, one record in
+    memory at a time) and nothing is re-serialized or decoded. The file is
+    swapped in atomically (temp file + os.replace), followed by its sidecar
+    offset index (see merged_corpus.py), built from the URLs and hashes pass 1
+    stored in `index`. Returns how many records were written.
+    """
+    by_file: Dict[int, List[Tuple[int, int, Optional[str], Optional[str]]]] = {}
+    for key, (file_id, offset, length, _, digest) in index.items():
+        url = None if key.startswith(NO_URL_PREFIX) else key
+        by_file.setdefault(file_id, []).append((offset, length, url, digest))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(output.name + ".tmp")
+    count = 0
+    corpus_index = CorpusIndexBuilder()
+    with tmp.open("wb") as out:
+        for file_id in sorted(by_file):
+            with sources[file_id].open("rb") as src:
+                for offset, length, url, digest in sorted(by_file[file_id], key=lambda span: span[0]):
+                    src.seek(offset)
+                    body = src.read(length)
+                    out.write(b",\n" if count else b"[\n")
+                    corpus_index.add_span(out.tell(), length, url, digest)
+                    out.write(body)
+                    count += 1
+        out.write(b"\n]" if count else b"[]")
+    os.replace(tmp, output)
+    corpus_index.save(output, index_path_for(output))
+    return count
+
+
+# --------------------------------------------------------------------------- #
+# Manifest: already-merged files + the survivor index, for incremental runs
+# --------------------------------------------------------------------------- #
+
+def default_manifest_path(output: Path) -> Path:
+    return output.with_name(f"{output.stem}.manifest.json")
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_entry(path: Path, file_id: int, previous: Optional[dict] = None) -> dict:
+    """Manifest entry for `path`; the sha256 of `previous` is reused while size and
+    mtime still match it, so only new or touched files are hashed."""
+    st = path.stat()
+    if previous and previous.get("sha256") and st.st_size == previous.get("size") \
+            and st.st_mtime_ns == previous.get("mtime_ns"):
+        digest = previous["sha256"]
+    else:
+        digest = _file_sha256(path)
+    return {"id": file_id, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+
+
+def _unchanged(path: Path, entry: dict) -> bool:
+    """True if `path` still matches its manifest entry (hash only re-checked when
+    size/mtime moved, e.g. after a copy that preserved the content)."""
+    st = path.stat()
+    if st.st_size != entry.get("size"):
+        return False
+    if st.st_mtime_ns == entry.get("mtime_ns"):
+        return True
+    if _file_sha256(path) != entry.get("sha256"):
+        return False
+    # Same content under a new mtime: record it so the manifest refresh reuses the hash.
+    entry["mtime_ns"] = st.st_mtime_ns
+    return True
+
+
+def load_manifest(path: Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def save_manifest(path: Path, files: Dict[str, dict], index: Dict[str, Span], output: Path,
+                  records: int) -> None:
+    st = output.stat()
+    payload = {
+        "version": MANIFEST_VERSION,
+        "output": {"path": str(output.resolve()), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                   "records": records},
+        "files": files,
+        "survivors": {key: list(span) for key, span in index.items()},
+        "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def stale_reason(manifest: Optional[dict], paths: List[Path], output: Path) -> Optional[str]:
+    """Why `manifest` can't be used for an incremental run (None = it can).
+
+    Any previously-merged file that changed or disappeared may have contributed
+    survivors (and byte offsets) that are no longer valid, so only *new* files
+    can be folded in.
+    """
+    if manifest is None:
+        return "no manifest"
+    if manifest.get("version") != MANIFEST_VERSION:
+        return "manifest version changed"
+    recorded = manifest.get("output") or {}
+    if not output.exists():
+        return "merged output missing"
+    st = output.stat()
+    if recorded.get("path") != str(output.resolve()) or st.st_size != recorded.get("size") \
+            or st.st_mtime_ns != recorded.get("mtime_ns"):
+        return "merged output was modified outside the merge"
+    current = {str(p.resolve()) for p in paths}
+    for name, entry in (manifest.get("files") or {}).items():
+        if name not in current:
+            return f"{Path(name).name} is no longer in the input set"
+        if not _unchanged(Path(name), entry):
+            return f"{Path(name).name} changed since the last merge"
+    return None
+
+
+def merge_full(paths: List[Path], output: Path, manifest_path: Optional[Path] = None) -> int:
+    """Index and copy every session; the manifest (and with it the hashing of every
+    session) is only written when `manifest_path` is given."""
+    file_ids = {path: n for n, path in enumerate(paths)}
+    index = build_index(paths, file_ids)
+    count = write_merged(index, dict(enumerate(paths)), output)
+    if manifest_path is not None:
+        files = {str(p.resolve()): _file_entry(p, n) for p, n in file_ids.items()}
+        save_manifest(manifest_path, files, index, output, count)
+    return count
+
+
+def merge_incremental(paths: List[Path], output: Path, manifest_path: Path) -> int:
+    """Index only new session files, then rebuild the output from stored offsets.
+
+    Falls back to a full rebuild when the manifest is missing or stale.
+    """
+    manifest = load_manifest(manifest_path)
+    reason = stale_reason(manifest, paths, output)
+    if reason is not None:
+        print(f"  incremental: {reason} -> full rebuild")
+        return merge_full(paths, output, manifest_path)
+
+    files: Dict[str, dict] = manifest["files"]
+    index: Dict[str, Span] = {key: tuple(span) for key, span in manifest["survivors"].items()}
+    new_paths = [p for p in paths if str(p.resolve()) not in files]
+    if not new_paths:
+        print(f"  incremental: all {len(paths)} file(s) already merged; nothing to do")
+        # Refresh mtimes that moved without a content change.
+        files = {name: _file_entry(Path(name), entry["id"], entry) for name, entry in files.items()}
+        count = manifest["output"].get("records", len(index))
+        save_manifest(manifest_path, files, index, output, count)
+        return count
+
+    print(f"  incremental: {len(files)} file(s) already merged, indexing {len(new_paths)} new")
+    next_id = max((entry["id"] for entry in files.values()), default=-1) + 1
+    file_ids = {path: next_id + n for n, path in enumerate(new_paths)}
+    build_index(new_paths, file_ids, index)
+    for path, file_id in file_ids.items():
+        files[str(path.resolve())] = _file_entry(path, file_id)
+
+    count = write_merged(index, {entry["id"]: Path(name) for name, entry in files.items()}, output)
+    save_manifest(manifest_path, files, index, output, count)
+    return count
 
 
 def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
@@ -144,12 +462,33 @@ def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
         action="store_true",
         help="Also include the un-timestamped data/products_html.json",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only index session files not yet merged (per the manifest) and rebuild the "
+        "output from stored offsets; falls back to a full rebuild if the manifest is stale",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=None,
+        help="Merge manifest path; giving one also writes it on a full merge "
+        "(default with --incremental: <output stem>.manifest.json next to the output)",
+    )
     return parser.parse_args(argv)
 
 
+def session_paths(pattern: str = DEFAULT_GLOB) -> List[Path]:
+    """Session files matching `pattern`, sorted: plain .json/.jsonl files only, so
+    sidecars and temp files next to them (.idx, an older .index.json,
+    .packed.jsonl, .jsonl.tmp) are never merged as sessions."""
+    paths = (Path(p) for p in sorted(glob.glob(pattern)))
+    return [path for path in paths if len(path.suffixes) == 1 and path.suffix in SESSION_SUFFIXES]
+
+
 def main(argv: List[str] | None = None) -> None:
     args = parse_args(argv)
-    paths = [Path(p) for p in sorted(glob.glob(args.glob))]
+    paths = session_paths(args.glob)
     if args.include_legacy:
         legacy = DATA_DIR / "raw" / "products_html.json"
         if legacy.exists():
@@ -158,15 +497,13 @@ def main(argv: List[str] | None = None) -> None:
         raise SystemExit(f"No session files matched {args.glob!r}")
 
     print(f"Merging {len(paths)} session file(s):")
-    survivors = merge(paths)
-    records = list(survivors.values())
-
-    args.output.parent.mkdir(parents=True, exist_ok=True)
-    with args.output.open("w", encoding="utf-8") as fh:
-        json.dump(records, fh, ensure_ascii=False, indent=2)
+    if args.incremental:
+        count = merge_incremental(paths, args.output, args.manifest or default_manifest_path(args.output))
+    else:
+        count = merge_full(paths, args.output, args.manifest)
 
     print(
-        f"\nWrote {len(records)} unique products to {args.output} "
+        f"\nWrote {count} unique products to {args.output} "
         f"({os.path.getsize(args.output) / 1e6:.1f} MB)"
     )
 
@@ -0,0 +1,225 @@
+"""Random-access reader for the merged products_html corpus.
+
+merge_html_sessions.py writes data/merged/products_html_merged.json plus a sidecar
+products_html_merged.idx (JSON) that records where every product sits in it:
+
+    {"version": 1, "source": {"size": ..., "mtime_ns": ...},
+     "records": [[offset, length], ...],      # every record, in file order
+     "urls":    {product_url: record number},
+     "hashes":  {content_hash: record number}}
+
+MergedCorpus memory-maps the merged file and decodes only the record asked for, so
+fetching one listing by URL no longer means json.load-ing the whole corpus:
+
+    with MergedCorpus() as corpus:
+        record = corpus.get("http://.../product/123")
+        for record in corpus.shard(2, 8):   # worker 2 of 8, a contiguous slice
+            ...
+
+If the sidecar is missing or out of date (the file was rewritten by something
+else), it is rebuilt with one scan of the file. Any .json array or .jsonl session
+can be opened the same way; its sidecar is named so that the raw-session glob
+(products_html_20*.json*) never mistakes it for a session.
+
+    python3 src/merged_corpus.py --url http://.../product/123
+    python3 src/merged_corpus.py --hash <sha256> --html
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from html_store import HASH_KEY, content_hash, resolve_html
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_CORPUS = PROJECT_ROOT / "data" / "merged" / "products_html_merged.json"
+
+INDEX_VERSION = 1
+
+
+def index_path_for(path: Path) -> Path:
+    # Not "<stem>.index.json": next to a raw session that would match the merge glob.
+    return path.with_name(f"{path.stem}.idx")
+
+
+def record_hash(record: dict) -> Optional[str]:
+    """content_hash of a record: stored for store-backed records, else of its html."""
+    digest = record.get(HASH_KEY)
+    if digest:
+        return digest
+    html = record.get("html")
+    return content_hash(html) if html else None
+
+
+class CorpusIndexBuilder:
+    """Collects (offset, length, record) as records are written, then saves the sidecar.
+    Writers that already know each record's URL and hash (merge_html_sessions.py
+    carries them from its first pass) use add_span() and skip decoding the record."""
+
+    def __init__(self):
+        self.records: List[Tuple[int, int]] = []
+        self.urls: Dict[str, int] = {}
+        self.hashes: Dict[str, int] = {}
+
+    def add(self, offset: int, length: int, record: dict) -> None:
+        self.add_span(offset, length, record.get("product_url"), record_hash(record))
+
+    def add_span(self, offset: int, length: int, url: Optional[str], digest: Optional[str]) -> None:
+        number = len(self.records)
+        self.records.append((offset, length))
+        if url:
+            self.urls[url] = number
+        if digest:
+            self.hashes.setdefault(digest, number)
+
+    def save(self, source: Path, index_path: Optional[Path] = None) -> Path:
+        index_path = index_path or index_path_for(source)
+        st = source.stat()
+        payload = {
+            "version": INDEX_VERSION,
+            "source": {"size": st.st_size, "mtime_ns": st.st_mtime_ns},
+            "records": self.records,
+            "urls": self.urls,
+            "hashes": self.hashes,
+        }
+        tmp = index_path.with_name(index_path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump(payload, fh, ensure_ascii=False)
+        os.replace(tmp, index_path)
+        return index_path
+
+
+def rebuild_index(path: Path, index_path: Optional[Path] = None) -> Path:
+    """Scan `path` once and (re)write its sidecar index."""
+    # Imported here: merge_html_sessions imports this module for CorpusIndexBuilder.
+    from merge_html_sessions import iter_spans
+
+    builder = CorpusIndexBuilder()
+    for offset, length, record in iter_spans(path):
+        builder.add(offset, length, record)
+    return builder.save(path, index_path)
+
+
+def _load_index(path: Path, index_path: Path) -> Optional[dict]:
+    if not index_path.exists():
+        return None
+    try:
+        with index_path.open("r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        return None
+    st = path.stat()
+    source = data.get("source") or {}
+    if data.get("version") != INDEX_VERSION or source.get("size") != st.st_size \
+            or source.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return data
+
+
+class MergedCorpus:
+    """Memory-mapped, index-backed view of a merged corpus (or any session file)."""
+
+    def __init__(self, path=DEFAULT_CORPUS, index_path=None):
+        self.path = Path(path)
+        self.index_path = Path(index_path) if index_path else index_path_for(self.path)
+        data = _load_index(self.path, self.index_path)
+        if data is None:
+            rebuild_index(self.path, self.index_path)
+            data = _load_index(self.path, self.index_path)
+        self._records: List[List[int]] = data["records"]
+        self._urls: Dict[str, int] = data["urls"]
+        self._hashes: Dict[str, int] = data["hashes"]
+        self._fh = self.path.open("rb")
+        # mmap refuses empty files; an empty corpus simply has no records.
+        self._buf = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if self._records else b""
+
+    def __enter__(self) -> "MergedCorpus":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._fh.close()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._urls
+
+    def raw(self, number: int) -> bytes:
+        """Bytes of record `number` exactly as they appear in the file."""
+        offset, length = self._records[number]
+        return self._buf[offset:offset + length]
+
+    def record(self, number: int) -> dict:
+        return json.loads(self.raw(number))
+
+    def get(self, url: str) -> Optional[dict]:
+        """The record for `url`, or None."""
+        number = self._urls.get(url)
+        return None if number is None else self.record(number)
+
+    def get_by_hash(self, digest: str) -> Optional[dict]:
+        """The first record whose page has this content_hash, or None."""
+        number = self._hashes.get(digest)
+        return None if number is None else self.record(number)
+
+    def urls(self) -> Iterator[str]:
+        return iter(self._urls)
+
+    def __iter__(self) -> Iterator[dict]:
+        for number in range(len(self._records)):
+            yield self.record(number)
+
+    def shard_range(self, index: int, count: int) -> range:
+        """Record numbers of shard `index` of `count` (contiguous, so reads stay sequential)."""
+        if not 0 <= index < count:
+            raise ValueError(f"shard index {index} out of range for {count} shard(s)")
+        total = len(self._records)
+        return range(total * index // count, total * (index + 1) // count)
+
+    def shard(self, index: int, count: int) -> Iterator[dict]:
+        for number in self.shard_range(index, count):
+            yield self.record(number)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Look up records in the merged products_html corpus")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS,
+                        help=f"Merged corpus (default: {DEFAULT_CORPUS})")
+    lookup = parser.add_mutually_exclusive_group()
+    lookup.add_argument("--url", help="Print the record for this product_url")
+    lookup.add_argument("--hash", help="Print the record with this content_hash")
+    parser.add_argument("--html", action="store_true", help="Print only the record's HTML")
+    parser.add_argument("--rebuild-index", action="store_true", help="Rescan the corpus and rewrite its index")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    if args.rebuild_index:
+        print(f"Wrote {rebuild_index(args.corpus)}")
+    with MergedCorpus(args.corpus) as corpus:
+        if not (args.url or args.hash):
+            print(f"{args.corpus}: {len(corpus)} records, {len(corpus._urls)} URLs, "
+                  f"{len(corpus._hashes)} distinct pages")
+            return
+        record = corpus.get(args.url) if args.url else corpus.get_by_hash(args.hash)
+        if record is None:
+            raise SystemExit(f"Not in {args.corpus.name}: {args.url or args.hash}")
+        if args.html:
+            print(resolve_html(record))
+        else:
+            print(json.dumps(record, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Persistent cache of parsed product fields, keyed by page content and parser version.
+
+Nearly every page in the merged corpus was parsed identically on the previous
+run. ParseCache stores the extracted fields of each page under
+(content_hash, parser ruleset version) in a small SQLite file, so a rerun only
+parses pages it has not seen, or every page once the ruleset changes (see
+parser.ruleset_version(), derived from the extractor source code).
+
+Only the extracted fields are cached; per-record metadata (original_url,
+category_page, fetched_at) is always taken from the record being parsed, so the
+same page fetched under two URLs or at two times still gets correct metadata.
+
+    python3 src/parse_cache.py --stats
+    python3 src/parse_cache.py --prune <version>   # drop entries of other versions
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_CACHE = PROJECT_ROOT / "data" / "parse_cache.sqlite"
+
+# SQLite's default limit on bound parameters is 999 on older builds.
+_LOOKUP_CHUNK = 500
+
+
+class ParseCache:
+    """SQLite-backed map (content_hash, version) -> parsed fields dict."""
+
+    def __init__(self, path=DEFAULT_CACHE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parsed ("
+            " content_hash TEXT NOT NULL,"
+            " version TEXT NOT NULL,"
+            " fields TEXT NOT NULL,"
+            " PRIMARY KEY (content_hash, version))"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self) -> "ParseCache":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def get_many(self, digests: Iterable[str], version: str) -> Dict[str, dict]:
+        """Cached fields for every digest that has an entry under `version`."""
+        wanted = list(dict.fromkeys(digests))
+        found: Dict[str, dict] = {}
+        for start in range(0, len(wanted), _LOOKUP_CHUNK):
+            chunk = wanted[start:start + _LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT content_hash, fields FROM parsed WHERE version = ? AND content_hash IN ({marks})",
+                [version, *chunk],
+            )
+            for digest, fields in rows:
+                found[digest] = json.loads(fields)
+        self.hits += len(found)
+        self.misses += len(wanted) - len(found)
+        return found
+
+    def put_many(self, entries: List[Tuple[str, dict]], version: str) -> None:
+        if not entries:
+            return
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO parsed (content_hash, version, fields) VALUES (?, ?, ?)",
+            [(digest, version, json.dumps(fields, ensure_ascii=False)) for digest, fields in entries],
+        )
+        self._conn.commit()
+
+    def prune(self, keep_version: str) -> int:
+        """Delete entries written by any other parser version; returns how many."""
+        cur = self._conn.execute("DELETE FROM parsed WHERE version != ?", (keep_version,))
+        self._conn.commit()
+        self._conn.execute("VACUUM")
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn.execute("SELECT version, COUNT(*) FROM parsed GROUP BY version")
+        return dict(rows.fetchall())
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Inspect or prune the parser.py parse cache")
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE,
+                        help=f"Cache file (default: {DEFAULT_CACHE})")
+    parser.add_argument("--prune", metavar="VERSION", default=None,
+                        help="Delete entries of every parser version except VERSION")
+    parser.add_argument("--stats", action="store_true", help="Print entries per parser version")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    args = parse_args(argv)
+    with ParseCache(args.cache) as cache:
+        if args.prune:
+            print(f"Removed {cache.prune(args.prune)} stale entries")
+        if args.stats or not args.prune:
+            for version, count in sorted(cache.stats().items()):
+                print(f"  {version}: {count} pages")
+
+
+if __name__ == "__main__":
+    main()
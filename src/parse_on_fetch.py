@@ -0,0 +1,125 @@
+"""Parse product pages while the crawl is still fetching them.
+
+Without this, parsing waits for the crawl to end and then for a merge and a full
+parser.py run, although the crawl itself spends nearly all its time waiting on
+Tor. ParseOnFetch hands every fetched record to a background process pool the
+moment the crawler saves it, so the CPU-bound parse overlaps the network-bound
+fetches and the crawl finishes with its parsed output already written.
+
+Both crawlers enable it with --parse-on-fetch. SessionWriter calls submit() for
+each record it writes (its `on_append` hook), so the crawl loops are unchanged.
+Parsed records stream to a JSONL sidecar named after the session:
+
+    data/raw/products_html_20260701_101500.jsonl
+    data/parsed/products_html_20260701_101500.parsed.jsonl
+
+The sidecar uses the session file layout (one record per line, a footer with
+parsed / skipped / failed counts), so iter_jsonl() reads it and a crashed crawl
+still leaves every parsed line intact. Lines are in completion order, not fetch
+order. Records come from parser.parse_record(), exactly as in a parser.py run,
+with the learned selector order frozen at the start of the crawl.
+"""
+from __future__ import annotations
+
+import signal
+import threading
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Optional
+
+from termcolor import colored
+
+from html_backends import DEFAULT_BACKEND
+from parser import CHUNKS_IN_FLIGHT, SELECTOR_LEARNER, _init_worker, _parse_task, is_product_url
+from session_writer import SESSION_EXT, SessionWriter
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+PARSED_DIR = PROJECT_ROOT / "data" / "parsed"
+PARSED_SUFFIX = ".parsed" + SESSION_EXT
+
+DEFAULT_PARSE_WORKERS = 2
+
+
+def parsed_path_for(session_path) -> Path:
+    """data/parsed/<session stem>.parsed.jsonl (kept out of data/raw, so the
+    merge glob never picks it up as a crawl session)."""
+    return PARSED_DIR / (Path(session_path).stem + PARSED_SUFFIX)
+
+
+def _init_fetch_worker(preferred, winners):
+    # Ctrl-C stops the crawl, not the parse pool: close() drains what was fetched.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(preferred, winners)
+
+
+class ParseOnFetch:
+    """Background parse pool fed one scraped record at a time.
+
+    submit() is called from the crawler's main thread; results are written from
+    the pool's result thread, the only thread that touches the sidecar writer
+    until close(). At most `max_pending` pages are in flight; past that, submit()
+    blocks, so a slow parse throttles the crawl instead of piling pages up in memory.
+    """
+
+    def __init__(self, path, workers: int = DEFAULT_PARSE_WORKERS, backend: str = DEFAULT_BACKEND,
+                 max_pending: Optional[int] = None, learn: bool = True):
+        self.path = Path(path)
+        self.backend = backend
+        self.learn = learn
+        if learn:
+            SELECTOR_LEARNER.load()
+        self.writer = SessionWriter(self.path)
+        self.parsed = 0
+        self.skipped = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        workers = max(1, workers)
+        self._slots = threading.BoundedSemaphore(max_pending or workers * CHUNKS_IN_FLIGHT)
+        self._pool = Pool(processes=workers, initializer=_init_fetch_worker,
+                          initargs=(SELECTOR_LEARNER.preferred, SELECTOR_LEARNER.winners))
+        self.closed = False
+
+    def submit(self, record: dict) -> None:
+        """Queue one scraped record for parsing (non-listing pages are counted and dropped)."""
+        if self.closed:
+            raise ValueError(f"ParseOnFetch for {self.path} is closed")
+        if not is_product_url(record.get("product_url", "")):
+            with self._lock:
+                self.skipped += 1
+            return
+        self._slots.acquire()
+        self._pool.apply_async(_parse_task, (record, self.backend),
+                               callback=self._done, error_callback=self._error)
+
+    def _done(self, result) -> None:
+        status, parsed_data, wins = result
+        with self._lock:
+            SELECTOR_LEARNER.merge(wins)
+            if status == "parsed":
+                self.writer.append(parsed_data)
+                self.parsed += 1
+            elif status == "skipped":
+                self.skipped += 1
+            else:
+                self.failed += 1
+        self._slots.release()
+
+    def _error(self, exc: BaseException) -> None:
+        with self._lock:
+            self.failed += 1
+        self._slots.release()
+
+    def close(self, status: str = "complete") -> None:
+        """Wait for every queued page, then write the sidecar footer and the
+        learned selector stats."""
+        if self.closed:
+            return
+        self.closed = True
+        self._pool.close()
+        self._pool.join()
+        self.writer.close(status=status, extra={"parsed": self.parsed, "skipped": self.skipped,
+                                                "failed": self.failed})
+        if self.learn:
+            SELECTOR_LEARNER.save()
+        print(colored(f"🧩 Parse-on-fetch: {self.parsed} parsed, {self.skipped} non-listing, "
+                      f"{self.failed} failed -> {self.path}", "cyan"))
@@ -24,13 +24,35 @@ TODO
 """
 
 import argparse
+import hashlib
+import inspect
 import json
 import re
 import os
+import random
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
 from urllib.parse import urlparse, parse_qs
-from bs4 import BeautifulSoup
+from typing import Callable, Dict, Optional, Tuple
 from termcolor import colored
 
+import parser_torzon
+from html_backends import BACKENDS, DEFAULT_BACKEND, available_backends, build_tree
+from html_store import HtmlStoreError, resolve_html
+from merge_html_sessions import _PARSE_ERRORS, iter_spans
+from merged_corpus import MergedCorpus, index_path_for, record_hash
+from parse_cache import DEFAULT_CACHE, ParseCache
+from prefilter import DEFAULT_KEYWORDS, KeywordPrefilter, pruned_path_for, save_pruned
+from selector_learner import DEFAULT_STATS, SelectorLearner
+
+# Learned per-host selector order for the first-match cascades (see
+# selector_learner.py). main() loads it; worker processes get a frozen copy.
+SELECTOR_LEARNER = SelectorLearner()
+
 
 def clean_text(text):
     """Clean and normalize text content"""
@@ -46,15 +68,165 @@ def clean_text(text):
     return text.strip()
 
 
+# Selectors simple enough to answer from PageContext's one-walk indexes.
+_CLASS_SELECTOR = re.compile(r'^\.([A-Za-z_][\w-]*)$')
+_CLASS_CONTAINS_SELECTOR = re.compile(r'^\[class\*="([^"]+)"\]$')
+_TAG_SELECTOR = re.compile(r'^[a-z][a-z0-9]*$')
+
+
+class PageContext:
+    """Per-page view shared by every extractor, built once in parse_product_html.
+
+    The extractors used to re-walk the whole tree for each lookup (two full
+    get_text() calls, <title> found twice, dozens of select() cascades).
+    PageContext indexes every element by tag and class in ONE walk and memoizes
+    the full text, the <title> text, the table rows and every selector result,
+    so a page is traversed a small, fixed number of times. Lookups it can't
+    answer from the indexes fall through to soupsieve and are memoized too.
+    """
+
+    def __init__(self, soup, host=None, audit=False):
+        self.soup = soup
+        self.host = host
+        # Audited pages ignore the learned selectors (see selector_learner.py).
+        self.audit = audit
+        # Distinct CSS selectors evaluated against this page (memo hits don't count).
+        self.lookups = 0
+        self._memo = {}
+        self._by_tag = None
+        self._by_class = None
+
+    def _cached(self, key, compute):
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = compute()
+            return value
+
+    def _index(self):
+        if self._by_tag is None:
+            by_tag, by_class = {}, {}
+            for element in self.elements:
+                by_tag.setdefault(element.name, []).append(element)
+                for cls in element.get('class') or ():
+                    by_class.setdefault(cls, []).append(element)
+            self._by_tag, self._by_class = by_tag, by_class
+
+    @property
+    def elements(self):
+        """Every tag in document order."""
+        return self._cached('elements', lambda: self.soup.find_all(True))
+
+    def tags(self, name):
+        self._index()
+        return self._by_tag.get(name, [])
+
+    def with_class(self, cls):
+        self._index()
+        return self._by_class.get(cls, [])
+
+    @property
+    def text(self):
+        """soup.get_text() of the whole page."""
+        return self._cached('text', self.soup.get_text)
+
+    @property
+    def title_tag(self):
+        titles = self.tags('title')
+        return titles[0] if titles else None
+
+    @property
+    def title_text(self):
+        """Cleaned <title> text ("" when there is none)."""
+        return self._cached('title_text',
+                            lambda: clean_text(self.title_tag.get_text()) if self.title_tag else "")
+
+    @property
+    def table_rows(self):
+        """Cells (td/th) of every <tr> of every <table>, in the order the tables are walked."""
+        def rows():
+            return [row.find_all(['td', 'th'])
+                    for table in self.tags('table') for row in table.find_all('tr')]
+        return self._cached('table_rows', rows)
+
+    def meta(self, attr, value):
+        """First <meta> whose `attr` equals `value` (e.g. property="og:site_name")."""
+        for element in self.tags('meta'):
+            if element.get(attr) == value:
+                return element
+        return None
+
+    def with_attr(self, attr):
+        """Every tag carrying `attr` (e.g. data-stock)."""
+        return self._cached(('attr', attr), lambda: [el for el in self.elements if el.has_attr(attr)])
+
+    def select(self, selector):
+        def compute():
+            self.lookups += 1
+            match = _CLASS_SELECTOR.match(selector)
+            if match:
+                return self.with_class(match.group(1))
+            match = _CLASS_CONTAINS_SELECTOR.match(selector)
+            if match:
+                needle = match.group(1)
+                return [el for el in self.elements
+                        if el.get('class') and needle in " ".join(el.get('class'))]
+            if _TAG_SELECTOR.match(selector):
+                return self.tags(selector)
+            return self.soup.select(selector)
+        return self._cached(('select', selector), compute)
+
+    def first_match(self, name, selectors, value):
+        """First truthy value(element) over `selectors`, recording the winner of
+        cascade `name` for this page's host.
+
+        The host's learned selector, if it has one, is tried first and a hit ends
+        the cascade; a miss (or an audited page) runs the fixed order.
+        """
+        learned = None if self.audit else SELECTOR_LEARNER.learned(self.host, name, selectors)
+        if learned is not None:
+            found = self._selector_value(learned, value)
+            if found:
+                SELECTOR_LEARNER.record(self.host, name, learned)
+                return found
+        for selector in selectors:
+            if selector == learned:
+                continue
+            found = self._selector_value(selector, value)
+            if found:
+                SELECTOR_LEARNER.record(self.host, name, selector)
+                return found
+        return None
+
+    def _selector_value(self, selector, value):
+        element = self.select_one(selector)
+        return value(element) if element is not None else None
+
+    def select_one(self, selector):
+        def compute():
+            if ('select', selector) in self._memo or _CLASS_SELECTOR.match(selector) \
+                    or _CLASS_CONTAINS_SELECTOR.match(selector) or _TAG_SELECTOR.match(selector):
+                found = self.select(selector)
+                return found[0] if found else None
+            self.lookups += 1
+            return self.soup.select_one(selector)
+        return self._cached(('select_one', selector), compute)
+
+
+def page_context(page):
+    """Extractors accept either a BeautifulSoup tree or a shared PageContext."""
+    return page if isinstance(page, PageContext) else PageContext(page)
+
+
 def extract_market_name(soup):
     """Extract the actual marketplace name from HTML title or other elements"""
     if not soup:
         return ""
+    ctx = page_context(soup)
     
     # Try to extract from title tag first
-    title = soup.find('title')
-    if title:
-        title_text = clean_text(title.get_text())
+    if ctx.title_tag:
+        title_text = ctx.title_text
         
         # Pattern for X Wave Market: "Product Name - THE X WAVE MARKET"
         if ' - THE X WAVE MARKET' in title_text:
@@ -94,7 +266,7 @@ def extract_market_name(soup):
                     return marketplace
     
     # Try meta tags as fallback
-    meta_site = soup.find('meta', attrs={'property': 'og:site_name'})
+    meta_site = ctx.meta('property', 'og:site_name')
     if meta_site and meta_site.get('content'):
         return clean_text(meta_site['content'])
     
@@ -108,14 +280,23 @@ def extract_market_name(soup):
         'h1[class*="brand"]'
     ]
     
-    for selector in site_selectors:
-        element = soup.select_one(selector)
-        if element:
-            text = clean_text(element.get_text())
-            if text and len(text) < 50:  # Reasonable length for site name
-                return text
-    
-    return ""
+    def site_name(element):
+        text = clean_text(element.get_text())
+        return text if text and len(text) < 50 else None  # Reasonable length for site name
+
+    return ctx.first_match("market_name.site", site_selectors, site_name) or ""
+
+
+# The product-name <h1> of the WooCommerce family of markets, most specific first.
+WOO_TITLE_SELECTORS = [
+    'h1.product_title.entry-title',
+    'h1.product-title.product_title.entry-title',
+    'h1.product_title',
+    'h1.product-title',
+    'h1.entry-title.product-title',
+    'h1.entry-title',
+    'h1[class*="product"][class*="title"]',
+]
 
 
 def extract_listing_title(soup):
@@ -127,8 +308,8 @@ def extract_listing_title(soup):
     SHADOWGATE, E-Market, Maria Shop, BestShop, ...) they matched a vendor or
     sidebar link instead of the real product title.
     """
-    title_tag = soup.find('title')
-    title_text = clean_text(title_tag.get_text()) if title_tag else ""
+    ctx = page_context(soup)
+    title_text = ctx.title_text
 
     # 1. Drug Hub: the product page <h1> is a "Shopping Cart" modal, so the real
     #    listing title only lives in <title> as "Drug Hub - <product>".
@@ -154,7 +335,7 @@ def extract_listing_title(soup):
 
     # 2. Black Ops: custom template, title in a dedicated div (no h1). Checked
     #    before the generic title splitters because the title contains hyphens.
-    blackops = soup.select_one('.product_pg_r_title')
+    blackops = ctx.select_one('.product_pg_r_title')
     if blackops:
         text = clean_text(blackops.get_text())
         if text:
@@ -165,25 +346,13 @@ def extract_listing_title(soup):
     #    Dispensary, Apex Chemicals, Grace Med Store, Moon Market (Docs) and
     #    Dark Market -- they all render the product name in the <h1> that
     #    carries the ``product_title`` class.
-    woo_selectors = [
-        'h1.product_title.entry-title',
-        'h1.product-title.product_title.entry-title',
-        'h1.product_title',
-        'h1.product-title',
-        'h1.entry-title.product-title',
-        'h1.entry-title',
-        'h1[class*="product"][class*="title"]',
-    ]
-    for selector in woo_selectors:
-        element = soup.select_one(selector)
-        if element:
-            text = clean_text(element.get_text())
-            if text:
-                return text
+    text = ctx.first_match("listing_title.woo", WOO_TITLE_SELECTORS, lambda element: clean_text(element.get_text()))
+    if text:
+        return text
 
     # 4. TorZon: custom PHP market with no product_title h1. The product name is
     #    the lone <h5> inside the centered product cell.
-    torzon = soup.select_one('center h5')
+    torzon = ctx.select_one('center h5')
     if torzon:
         text = clean_text(torzon.get_text())
         if text:
@@ -200,26 +369,29 @@ def extract_listing_title(soup):
         'title'
     ]
 
-    for selector in selectors:
-        element = soup.select_one(selector)
-        if element:
-            text = clean_text(element.get_text())
-            if text and len(text) > 3:  # Avoid very short titles
-                # Clean up common title patterns
-                text = re.sub(r'\s*-\s*.*$', '', text)  # Remove everything after dash
-                text = re.sub(r'\s*\|.*$', '', text)    # Remove everything after pipe
-                text = re.sub(r'\s*Buy\s*', '', text, flags=re.IGNORECASE)  # Remove "Buy" prefix
-                return clean_text(text)
+    def long_enough(element):
+        text = clean_text(element.get_text())
+        return text if text and len(text) > 3 else None  # Avoid very short titles
+
+    text = ctx.first_match("listing_title.generic", selectors, long_enough)
+    if text:
+        # Clean up common title patterns
+        text = re.sub(r'\s*-\s*.*$', '', text)  # Remove everything after dash
+        text = re.sub(r'\s*\|.*$', '', text)    # Remove everything after pipe
+        text = re.sub(r'\s*Buy\s*', '', text, flags=re.IGNORECASE)  # Remove "Buy" prefix
+        return clean_text(text)
 
     return ""
 
 
 def extract_price(soup):
     """Extract price information from various possible selectors"""
+    ctx = page_context(soup)
     prices = []
     
     # Priority 1: Look in summary section first (for X Wave Market and similar WooCommerce sites)
-    summary = soup.find(class_='summary')
+    summaries = ctx.with_class('summary')
+    summary = summaries[0] if summaries else None
     if summary:
         summary_price = summary.find(class_=lambda x: x and 'price' in str(x).lower())
         if summary_price:
@@ -250,7 +422,7 @@ def extract_price(soup):
     ]
     
     for selector in selectors:
-        elements = soup.select(selector)
+        elements = ctx.select(selector)
         for element in elements:
             text = clean_text(element.get_text())
             if text and '$' in text:
@@ -281,23 +453,20 @@ def extract_price(soup):
 
 def extract_dosage(soup):
     """Extract dosage information from tables and text"""
+    ctx = page_context(soup)
     dosage_info = []
     
     # Look for dosage in tables
-    tables = soup.find_all('table')
-    for table in tables:
-        rows = table.find_all('tr')
-        for row in rows:
-            cells = row.find_all(['td', 'th'])
-            if len(cells) >= 2:
-                for i, cell in enumerate(cells):
-                    text = clean_text(cell.get_text())
-                    # Look for dosage patterns
-                    if re.search(r'\d+\s*mg', text, re.IGNORECASE) or re.search(r'\d+\s*ml', text, re.IGNORECASE):
-                        dosage_info.append(text)
+    for cells in ctx.table_rows:
+        if len(cells) >= 2:
+            for i, cell in enumerate(cells):
+                text = clean_text(cell.get_text())
+                # Look for dosage patterns
+                if re.search(r'\d+\s*mg', text, re.IGNORECASE) or re.search(r'\d+\s*ml', text, re.IGNORECASE):
+                    dosage_info.append(text)
     
     # Look for dosage in text content
-    text_content = soup.get_text()
+    text_content = ctx.text
     dosage_matches = re.findall(r'\d+\s*mg|\d+\s*ml|\d+\s*grams?|\d+\s*g', text_content, re.IGNORECASE)
     dosage_info.extend(dosage_matches)
     
@@ -311,7 +480,7 @@ def extract_dosage(soup):
     ]
     
     for selector in dosage_selectors:
-        elements = soup.select(selector)
+        elements = ctx.select(selector)
         for element in elements:
             text = clean_text(element.get_text())
             if text:
@@ -336,16 +505,14 @@ def extract_rating(soup):
         '[class*="star"]'
     ]
     
-    for selector in rating_selectors:
-        element = soup.select_one(selector)
-        if element:
-            text = clean_text(element.get_text())
-            # Look for rating patterns like "4.5/5" or "4.5 stars"
-            rating_match = re.search(r'(\d+\.?\d*)\s*/\s*5|(\d+\.?\d*)\s*stars?', text, re.IGNORECASE)
-            if rating_match:
-                return rating_match.group(1) or rating_match.group(2)
-    
-    return ""
+    def rating(element):
+        text = clean_text(element.get_text())
+        # Look for rating patterns like "4.5/5" or "4.5 stars"
+        rating_match = re.search(r'(\d+\.?\d*)\s*/\s*5|(\d+\.?\d*)\s*stars?', text, re.IGNORECASE)
+        return (rating_match.group(1) or rating_match.group(2)) if rating_match else None
+
+    ctx = page_context(soup)
+    return ctx.first_match("rating", rating_selectors, rating) or ""
 
 
 def extract_reviews(soup):
@@ -358,10 +525,11 @@ def extract_reviews(soup):
         '[class*="review"]'
     ]
     
+    ctx = page_context(soup)
     reviews = []
     
     for selector in review_selectors:
-        elements = soup.select(selector)
+        elements = ctx.select(selector)
         for element in elements:
             # Look for individual review text
             review_texts = element.find_all(['p', 'div', 'span'], string=True)
@@ -381,7 +549,8 @@ def extract_description(soup):
     # Black Ops keeps the description body in .product_pg_r_text. Check it first
     # with a low length gate -- these blurbs (active ingredient / manufacturer /
     # package) are short but are exactly what the keyword filter needs.
-    blackops_desc = soup.select_one('.product_pg_r_text')
+    ctx = page_context(soup)
+    blackops_desc = ctx.select_one('.product_pg_r_text')
     if blackops_desc:
         text = clean_text(blackops_desc.get_text())
         if text and len(text) > 10:
@@ -397,18 +566,17 @@ def extract_description(soup):
         '[class*="description"]'
     ]
     
-    for selector in description_selectors:
-        element = soup.select_one(selector)
-        if element:
-            text = clean_text(element.get_text())
-            if text and len(text) > 50:  # Only meaningful descriptions
-                # Limit description length
-                if len(text) > 500:
-                    text = text[:500] + "..."
-                return text
+    def meaningful(element):
+        text = clean_text(element.get_text())
+        return text if text and len(text) > 50 else None  # Only meaningful descriptions
+
+    text = ctx.first_match("description", description_selectors, meaningful)
+    if text:
+        # Limit description length
+        return text[:500] + "..." if len(text) > 500 else text
     
     # Fallback: look for meta description
-    meta_desc = soup.find('meta', attrs={'name': 'description'})
+    meta_desc = ctx.meta('name', 'description')
     if meta_desc and meta_desc.get('content'):
         text = clean_text(meta_desc['content'])
         if text and len(text) > 20:
@@ -421,6 +589,7 @@ def extract_number_in_stocks(soup):
     """Extract the number of items in stock from various possible locations"""
     if not soup:
         return ""
+    ctx = page_context(soup)
     
     # Pattern 1: Look for text patterns like "20000 in stock", "20000 in-stock", etc.
     # Common patterns: "NUMBER in stock", "NUMBER available", "Stock: NUMBER", etc.
@@ -434,7 +603,7 @@ def extract_number_in_stocks(soup):
     ]
     
     # Get all text content
-    text_content = soup.get_text()
+    text_content = ctx.text
     
     for pattern in stock_patterns:
         match = re.search(pattern, text_content, re.IGNORECASE)
@@ -456,7 +625,7 @@ def extract_number_in_stocks(soup):
     ]
     
     for selector in stock_selectors:
-        elements = soup.select(selector)
+        elements = ctx.select(selector)
         for element in elements:
             text = clean_text(element.get_text())
             if text:
@@ -478,14 +647,14 @@ def extract_number_in_stocks(soup):
                             return num_clean
     
     # Pattern 3: Check for data attributes that might contain stock info
-    stock_attrs = soup.find_all(attrs={'data-stock': True})
+    stock_attrs = ctx.with_attr('data-stock')
     if stock_attrs:
         for elem in stock_attrs:
             stock_value = elem.get('data-stock', '')
             if stock_value and stock_value.isdigit():
                 return stock_value
     
-    stock_attrs = soup.find_all(attrs={'data-quantity': True})
+    stock_attrs = ctx.with_attr('data-quantity')
     if stock_attrs:
         for elem in stock_attrs:
             quantity_value = elem.get('data-quantity', '')
@@ -495,6 +664,151 @@ def extract_number_in_stocks(soup):
     return ""
 
 
+# --------------------------------------------------------------------------- #
+# Market plans: per-market overrides and extra fields
+# --------------------------------------------------------------------------- #
+
+# Output fields in order, with the generic extractor that fills each one.
+GENERIC_EXTRACTORS = (
+    ("market_name", extract_market_name),
+    ("listing_title", extract_listing_title),
+    ("price", extract_price),
+    ("dosage", extract_dosage),
+    ("rating", extract_rating),
+    ("review", extract_reviews),
+    ("description", extract_description),
+    ("number_in_stocks", extract_number_in_stocks),
+)
+
+
+@dataclass(frozen=True)
+class MarketPlan:
+    """How to parse one known market.
+
+    `matches(url, ctx)` recognizes the market from its URL shape or page
+    signature (pages from a host listed in data/market_hosts.json skip the check).
+    `fields` overrides the generic extractor for individual output fields; every
+    other field still uses the generic cascade. `extra(ctx)` adds market-only
+    fields (e.g. TorZon's shipping columns), named in `extra_fields` so a
+    projection that doesn't ask for them can skip the call.
+
+    Only an override that replaces a whole cascade saves selector work: on the
+    bench's synthetic TorZon page the plan evaluates 11 CSS selectors where the
+    generic extractors evaluate 53 (parser_torzon.py walks the tree with find()). Every other plan mostly names the market (profile
+    and parser_bench.py report per plan). Its pages still run the generic price,
+    dosage, rating, review, description and stock cascades, whose selectors all
+    feed the result. Pages from unknown hosts pay no extra selectors for the
+    matches() checks, since the selectors those look up are memoized and reused
+    by extract_listing_title().
+    """
+    name: str
+    matches: Callable
+    fields: Dict[str, Callable] = field(default_factory=dict)
+    extra: Optional[Callable] = None
+    extra_fields: Tuple[str, ...] = ()
+
+
+MARKET_PLANS = []
+MARKET_HOSTS_FILE = Path(__file__).resolve().parents[1] / "data" / "market_hosts.json"
+
+
+def register_market(plan):
+    MARKET_PLANS.append(plan)
+    return plan
+
+
+def _load_market_hosts():
+    """Optional {"<host>": "<plan name>"} map for markets whose address is known."""
+    if not MARKET_HOSTS_FILE.exists():
+        return {}
+    with open(MARKET_HOSTS_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+MARKET_HOSTS = _load_market_hosts()
+
+
+def match_market(url, ctx):
+    """The MarketPlan for a page, or None to run the generic cascade."""
+    name = MARKET_HOSTS.get(urlparse(url or '').hostname or '')
+    for plan in MARKET_PLANS:
+        if plan.name == name or (name is None and plan.matches(url, ctx)):
+            return plan
+    return None
+
+
+def _market_is_torzon(url, ctx):
+    parsed = urlparse(url or '')
+    if parsed.path.endswith('products.php') and parse_qs(parsed.query).get('action') == ['view']:
+        return True
+    # TorZon's own <title>: "TorZon Market", alone or as the site part at either end
+    # ("TorZon Market - <page>", "<page> | TorZon"). Other sites merely mentioning
+    # TorZon in a title ("TorZon vs Abacus review") don't qualify.
+    return re.match(r'^torzon(?: market)?(?:\s*[-|:].*)?$|^.*[-|:]\s*torzon(?: market)?$',
+                    ctx.title_text.strip(), re.IGNORECASE) is not None
+
+
+def _market_black_ops_name(ctx):
+    title = ctx.title_text
+    if title.endswith('- Black Ops') or ' - Black Ops' in title:
+        return "Black Ops"
+    return extract_market_name(ctx)
+
+
+def _market_torzon_fields(ctx):
+    ship_from, ship_to = parser_torzon.extract_ship_from_to(ctx.soup)
+    return {
+        "category": parser_torzon.extract_category(ctx.soup),
+        "ship_from": ship_from,
+        "ship_to": ship_to,
+    }
+
+
+# The listing title of Drug Hub, Osiris, Abacus, Black Ops and the WooCommerce
+# family needs no override: extract_listing_title() checks their templates first,
+# in the same order these plans are matched in.
+register_market(MarketPlan(
+    name="Drug Hub",
+    matches=lambda url, ctx: ctx.title_text.startswith('Drug Hub - '),
+    fields={"market_name": lambda ctx: "Drug Hub"},
+))
+register_market(MarketPlan(
+    name="Osiris",
+    matches=lambda url, ctx: ctx.title_text.startswith('Osiris -'),
+    fields={"market_name": lambda ctx: "Osiris"},
+))
+register_market(MarketPlan(
+    name="Abacus",
+    matches=lambda url, ctx: ' | Abacus Market' in ctx.title_text,
+))
+register_market(MarketPlan(
+    name="Black Ops",
+    matches=lambda url, ctx: ctx.title_text.endswith('- Black Ops') or ' - Black Ops' in ctx.title_text
+    or ctx.select_one('.product_pg_r_title') is not None,
+    fields={"market_name": _market_black_ops_name},
+))
+# TorZon takes parser_torzon.py's extractors (which used to be a separate run) for
+# the fields it has one for; dosage, review and number_in_stocks, which it
+# leaves blank, still come from the generic extractors.
+register_market(MarketPlan(
+    name="TorZon",
+    matches=_market_is_torzon,
+    fields={
+        "market_name": lambda ctx: "TorZon Market",
+        "listing_title": lambda ctx: parser_torzon.extract_title(ctx.soup),
+        "price": lambda ctx: parser_torzon.extract_price(ctx.soup),
+        "rating": lambda ctx: parser_torzon.extract_rating(ctx.soup),
+        "description": lambda ctx: parser_torzon.extract_description(ctx.soup),
+    },
+    extra=_market_torzon_fields,
+    extra_fields=("category", "ship_from", "ship_to"),
+))
+register_market(MarketPlan(
+    name="WooCommerce",
+    matches=lambda url, ctx: any(ctx.select_one(selector) for selector in WOO_TITLE_SELECTORS),
+))
+
+
 def is_product_url(url):
     """Return True only for individual product/listing detail pages.
 
@@ -555,29 +869,152 @@ def is_product_url(url):
     return False
 
 
-def parse_product_html(product_data):
-    """Parse a single product's HTML and extract all relevant information"""
+# Bump when parsing behaviour changes somewhere ruleset_version() can't see (e.g. a
+# BeautifulSoup upgrade or a helper outside this module). Edits to the extractor
+# functions themselves are picked up automatically.
+PARSER_RULESET_VERSION = 1
+
+# Record-level fields copied from the scraped record rather than extracted from
+# the HTML (never cached -- see parse_cache.py).
+METADATA_FIELDS = ("original_url", "category_page", "fetched_at")
+
+# Every field parse_product_html() can return, i.e. what a projection may ask for.
+PARSED_FIELDS = tuple(name for name, _ in GENERIC_EXTRACTORS) \
+    + tuple(dict.fromkeys(name for plan in MARKET_PLANS for name in plan.extra_fields)) + METADATA_FIELDS
+
+# Named projections for --fields: what each downstream stage actually reads.
+FIELD_SETS = {
+    # build_category_share.py's denominator: distinct original_url.
+    "denominator": ("original_url",),
+    # filter_medicines.py: the keyword haystack, deduped by original_url.
+    "filter": ("listing_title", "description", "review", "original_url"),
+}
+
+
+def resolve_fields(spec):
+    """Field projection from a --fields value: comma-separated field names and/or
+    FIELD_SETS names. Returns a tuple in PARSED_FIELDS order; raises ValueError
+    for an unknown name."""
+    wanted = set()
+    for name in (part.strip() for part in spec.split(',')):
+        if not name:
+            continue
+        if name in FIELD_SETS:
+            wanted.update(FIELD_SETS[name])
+        elif name in PARSED_FIELDS:
+            wanted.add(name)
+        else:
+            raise ValueError(f"unknown field {name!r} (fields: {', '.join(PARSED_FIELDS)}; "
+                             f"sets: {', '.join(FIELD_SETS)})")
+    if not wanted:
+        raise ValueError("empty field projection")
+    return tuple(name for name in PARSED_FIELDS if name in wanted)
+
+
+def _ruleset_functions():
+    """Every function (and module) whose code decides the parsed fields."""
+    names = sorted(name for name in globals() if name.startswith(("extract_", "_market_")))
+    return [clean_text, PageContext, parse_product_html, match_market, parser_torzon] \
+        + [globals()[name] for name in names]
+
+
+def _market_plans_source():
+    source = inspect.getsource(inspect.getmodule(MarketPlan))
+    start = source.index("register_market(MarketPlan(")
+    return source[start:source.index("def is_product_url", start)]
+
+
+_RULESET_VERSION = None
+
+
+def ruleset_version(backend=DEFAULT_BACKEND):
+    """Parser version for the parse cache: the declared PARSER_RULESET_VERSION plus
+    a hash of the extractor source, so editing e.g. extract_price invalidates every
+    entry parsed by the old code and nothing else. Non-default HTML backends get
+    their own entries (they can disagree on malformed markup). The learned
+    selector order is left out: it only skips selectors that never match on
+    the host (see selector_learner.py), so it doesn't change what is parsed."""
+    global _RULESET_VERSION
+    if _RULESET_VERSION is None:
+        digest = hashlib.sha1()
+        for func in _ruleset_functions():
+            digest.update(inspect.getsource(func).encode("utf-8"))
+        # The plan table itself (lambdas included) and the host map decide dispatch.
+        digest.update(_market_plans_source().encode("utf-8"))
+        digest.update(json.dumps(MARKET_HOSTS, sort_keys=True).encode("utf-8"))
+        _RULESET_VERSION = f"{PARSER_RULESET_VERSION}-{digest.hexdigest()[:12]}"
+    if backend != DEFAULT_BACKEND:
+        return f"{_RULESET_VERSION}+{backend}"
+    return _RULESET_VERSION
+
+
+def _stage_label(plan, name, generic):
+    """Profile label for the callable that fills `name`: the extract_* function,
+    or the market plan's override."""
+    if plan and name in plan.fields:
+        return f"{plan.name}:{name}"
+    return generic.__name__
+
+
+def parse_product_html(product_data, backend=DEFAULT_BACKEND, fields=None, profile=None):
+    """Parse a single product's HTML and extract all relevant information.
+
+    `fields` (see resolve_fields()) limits the result to those fields and skips
+    every extractor whose output isn't wanted; a projection of metadata fields
+    only doesn't build a tree at all. `profile`, if a dict, receives the matched
+    plan's name ("market", None for the generic cascade), the seconds spent per
+    stage ("stages": build_tree, match_market, each extractor) and the number of
+    CSS selectors evaluated ("lookups"); this is what parser_bench.py reports.
+    """
+    wanted = None if fields is None else set(fields)
+    if profile is not None:
+        profile.update(market=None, stages={}, lookups=0)
     try:
-        html = product_data.get('html', '')
+        # Store-backed sessions carry a content_hash instead of inline html.
+        html = resolve_html(product_data)
         if not html:
             return None
-        
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        parsed_data = {
-            "market_name": extract_market_name(soup),
-            "listing_title": extract_listing_title(soup),
-            "price": extract_price(soup),
-            "dosage": extract_dosage(soup),
-            "rating": extract_rating(soup),
-            "review": extract_reviews(soup),
-            "description": extract_description(soup),
-            "number_in_stocks": extract_number_in_stocks(soup),
-            "original_url": product_data.get('product_url', ''),
+
+        url = product_data.get('product_url', '')
+        parsed_data = {}
+        if wanted is None or not wanted.issubset(METADATA_FIELDS):
+            stages = profile["stages"] if profile is not None else None
+            started = time.perf_counter()
+            soup = build_tree(html, backend)
+            # One shared context, so the extractors reuse each other's tree walks.
+            ctx = PageContext(soup, host=urlparse(url).hostname, audit=SELECTOR_LEARNER.audits(url))
+            if stages is not None:
+                stages["build_tree"] = time.perf_counter() - started
+
+            # Known markets go straight to their own selectors; unknown ones get the
+            # generic cascade for every field.
+            started = time.perf_counter()
+            plan = match_market(url, ctx)
+            if stages is not None:
+                stages["match_market"] = time.perf_counter() - started
+                profile["market"] = plan.name if plan else None
+            overrides = plan.fields if plan else {}
+            for name, generic in GENERIC_EXTRACTORS:
+                if wanted is None or name in wanted:
+                    started = time.perf_counter()
+                    parsed_data[name] = overrides.get(name, generic)(ctx)
+                    if stages is not None:
+                        stages[_stage_label(plan, name, generic)] = time.perf_counter() - started
+            if plan and plan.extra and (wanted is None or wanted.intersection(plan.extra_fields)):
+                started = time.perf_counter()
+                parsed_data.update((name, value) for name, value in plan.extra(ctx).items()
+                                   if wanted is None or name in wanted)
+                if stages is not None:
+                    stages[f"{plan.name}:extra"] = time.perf_counter() - started
+            if profile is not None:
+                profile["lookups"] = ctx.lookups
+        metadata = {
+            "original_url": url,
             "category_page": product_data.get('category_page', ''),
             "fetched_at": product_data.get('fetched_at', '')
         }
-        
+        parsed_data.update((name, value) for name, value in metadata.items() if wanted is None or name in wanted)
+
         return parsed_data
         
     except Exception as e:
@@ -585,31 +1022,270 @@ def parse_product_html(product_data):
         return None
 
 
-def load_products_data(filename="products_html.json"):
-    """Load the scraped products data"""
-    if not os.path.exists(filename):
-        print(colored(f"❌ {filename} not found!", "red"))
-        return []
-    
+def prefilter_record(product_data, prefilter):
+    """`product_data` with its html resolved, or None if the prefilter rules it out.
+
+    Pages with no HTML are passed through so they still count as failed parses,
+    and so are pages whose stored HTML can't be read (parse_product_html()
+    reports those).
+    """
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            print(colored(f"✅ Loaded {len(data)} products from {filename}", "green"))
-            return data
-    except Exception as e:
-        print(colored(f"❌ Error loading {filename}: {e}", "red"))
-        return []
+        html = resolve_html(product_data)
+    except HtmlStoreError:
+        return product_data
+    if html and not prefilter.could_match(html):
+        return None
+    return dict(product_data, html=html)
+
+
+def parse_record(product_data, backend=DEFAULT_BACKEND, prefilter=None, fields=None):
+    """Classify and parse one scraped record:
+    ("skipped" | "pruned" | "parsed" | "failed", parsed_or_None).
+
+    "pruned" means a KeywordPrefilter was given and the page can't match it; its
+    second element is the product_url, so the caller can still count the listing.
+    Module-level (and free of shared state) so worker processes can run it.
+    """
+    # Skip non-listing pages (add-to-cart redirects, category/shop indexes
+    # and vendor storefronts) -- they carry no real product title.
+    url = product_data.get('product_url', '')
+    if not is_product_url(url):
+        return "skipped", None
+    if prefilter is not None:
+        product_data = prefilter_record(product_data, prefilter)
+        if product_data is None:
+            return "pruned", url
+    parsed_data = parse_product_html(product_data, backend, fields)
+    if parsed_data is not None:
+        return "parsed", parsed_data
+    return "failed", None
+
+
+# Records handed to a worker at a time: big enough to amortize IPC, small enough
+# that results keep flowing back in order.
+DEFAULT_CHUNKSIZE = 16
+# Chunks in flight per worker. Pool.imap would otherwise drain the whole input
+# iterator into its task queue up front, i.e. load the entire corpus.
+CHUNKS_IN_FLIGHT = 4
+
+
+def _parse_task(product_data, backend=DEFAULT_BACKEND, prefilter=None, fields=None):
+    """parse_record() plus the selector wins it produced (shipped back from workers)."""
+    status, parsed_data = parse_record(product_data, backend, prefilter, fields)
+    return status, parsed_data, SELECTOR_LEARNER.take_pending()
+
+
+def _init_worker(preferred, winners):
+    SELECTOR_LEARNER.set_preferred(preferred, winners)
+
+
+def _parse_batch(batch, pool, chunksize, cache, backend=DEFAULT_BACKEND, prefilter=None, fields=None):
+    """parse_record() results for one batch, answering what it can from `cache`.
+
+    Cache lookups and writes happen here in the main process; only cache misses
+    are sent to the workers. With a cache the prefilter runs here too, ahead of
+    the lookup, so the output doesn't depend on what happens to be cached.
+    A projection (`fields`) is answered from full cache entries, but its own
+    partial results are never written back.
+    """
+    results = [None] * len(batch)
+    digests = {}
+    if cache is not None:
+        version = ruleset_version(backend)
+        for i, product_data in enumerate(batch):
+            url = product_data.get('product_url', '')
+            if not is_product_url(url):
+                results[i] = ("skipped", None)
+                continue
+            if prefilter is not None:
+                if prefilter_record(product_data, prefilter) is None:
+                    results[i] = ("pruned", url)
+                    continue
+            digest = record_hash(product_data)
+            if digest:
+                digests[i] = digest
+        cached = cache.get_many(digests.values(), version)
+        for i, digest in digests.items():
+            if digest in cached:
+                parsed_data = dict(cached[digest])
+                parsed_data.update({
+                    "original_url": batch[i].get('product_url', ''),
+                    "category_page": batch[i].get('category_page', ''),
+                    "fetched_at": batch[i].get('fetched_at', ''),
+                })
+                if fields is not None:
+                    parsed_data = {k: v for k, v in parsed_data.items() if k in fields}
+                results[i] = ("parsed", parsed_data)
+
+    todo = [i for i, result in enumerate(results) if result is None]
+    pending = [batch[i] for i in todo]
+    task = partial(_parse_task, backend=backend, prefilter=None if cache is not None else prefilter,
+                   fields=fields)
+    if pool is not None:
+        parsed = pool.imap(task, pending, chunksize=chunksize)
+    else:
+        parsed = map(task, pending)
+
+    new_entries = []
+    for i, (status, parsed_data, wins) in zip(todo, parsed):
+        SELECTOR_LEARNER.merge(wins)
+        result = results[i] = (status, parsed_data)
+        if cache is not None and fields is None and result[0] == "parsed" and i in digests:
+            extracted = {k: v for k, v in result[1].items() if k not in METADATA_FIELDS}
+            new_entries.append((digests[i], extracted))
+    if new_entries:
+        cache.put_many(new_entries, ruleset_version(backend))
+    return results
+
+
+def iter_parse_results(products_data, workers=1, chunksize=None, cache=None, backend=DEFAULT_BACKEND,
+                       prefilter=None, fields=None):
+    """Yield parse_record() results in input order, optionally across a process pool.
+
+    `products_data` may be any iterable (e.g. a lazy file reader); it is consumed
+    in bounded batches so only a few chunks are ever in memory. With a ParseCache,
+    pages already parsed by the current ruleset_version() are not parsed again.
+    With a KeywordPrefilter, listings that can't match it come back as "pruned".
+    `fields` projects every parsed record (see parse_product_html()).
+    """
+    if workers <= 1 and cache is None:
+        for product_data in products_data:
+            yield parse_record(product_data, backend, prefilter, fields)
+        return
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+    batch_size = max(1, workers) * chunksize * CHUNKS_IN_FLIGHT
+    records = iter(products_data)
+    pool = Pool(processes=workers, initializer=_init_worker,
+                initargs=(SELECTOR_LEARNER.preferred, SELECTOR_LEARNER.winners)) if workers > 1 else None
+    try:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                return
+            yield from _parse_batch(batch, pool, chunksize, cache, backend, prefilter, fields)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def sample_listings(products_data, size, seed=0):
+    """Uniform sample of `size` listing records from a (lazy) iterable, holding
+    only the sample in memory (reservoir sampling)."""
+    rng = random.Random(seed)
+    sample = []
+    seen = 0
+    for product_data in products_data:
+        if not is_product_url(product_data.get('product_url', '')):
+            continue
+        seen += 1
+        if len(sample) < size:
+            sample.append(product_data)
+        else:
+            slot = rng.randrange(seen)
+            if slot < size:
+                sample[slot] = product_data
+    return sample
+
+
+def compare_backends(records, backend_a, backend_b):
+    """Parse `records` with two HTML backends and report field-level differences.
+
+    Returns {"records", "differing_records", "fields": {field: n_differences},
+    "examples": [(url, field, value_a, value_b), ...], "seconds": {backend: s}}.
+    """
+    report = {"records": len(records), "differing_records": 0, "fields": {}, "examples": [],
+              "seconds": {backend_a: 0.0, backend_b: 0.0}}
+    for product_data in records:
+        parsed = {}
+        for backend in (backend_a, backend_b):
+            started = time.perf_counter()
+            parsed[backend] = parse_product_html(product_data, backend) or {}
+            report["seconds"][backend] += time.perf_counter() - started
+        a, b = parsed[backend_a], parsed[backend_b]
+        differing = [field for field in dict.fromkeys([*a, *b]) if a.get(field) != b.get(field)]
+        if differing:
+            report["differing_records"] += 1
+        for field in differing:
+            report["fields"][field] = report["fields"].get(field, 0) + 1
+            report["examples"].append((product_data.get('product_url', ''), field, a.get(field), b.get(field)))
+    return report
+
+
+def print_parity_report(report, backend_a, backend_b, max_examples=20):
+    print(colored(f"\n🔬 Parity: {backend_a} vs {backend_b} on {report['records']} sampled listings", "cyan", attrs=['bold']))
+    for backend in (backend_a, backend_b):
+        secs = report["seconds"][backend]
+        rate = report["records"] / secs if secs else 0.0
+        print(colored(f"   {backend:<12} {secs:7.2f}s  ({rate:.1f} pages/s)", "white"))
+    if not report["differing_records"]:
+        print(colored("   ✅ Every field matched", "green"))
+        return
+    print(colored(f"   ⚠️  {report['differing_records']} record(s) differ", "yellow"))
+    for field, count in sorted(report["fields"].items(), key=lambda item: -item[1]):
+        print(colored(f"     {field:<18} {count}", "yellow"))
+    for url, field, a, b in report["examples"][:max_examples]:
+        print(colored(f"   {url} [{field}]", "white"))
+        print(f"     {backend_a}: {a!r}")
+        print(f"     {backend_b}: {b!r}")
+
+
+def iter_products_data(filename):
+    """Lazily yield scraped records from a JSON array or JSONL session.
+
+    Returns (records, total); total is only known when the file has a valid offset
+    index (merged_corpus.py), otherwise None. JSON arrays are scanned record by
+    record through an mmap, so memory stays around one page no matter the corpus
+    size. A truncated file yields its intact records, then a warning.
+    """
+    if os.path.exists(index_path_for(Path(filename))):
+        corpus = MergedCorpus(filename)
+        return _iter_corpus(corpus), len(corpus)
+    return _iter_file(filename), None
+
 
+def _iter_corpus(corpus):
+    with corpus:
+        yield from corpus
 
-def save_parsed_data(parsed_products, filename="../data/parsed_drugs.json"):
-    """Save the parsed drug data to a new JSON file"""
+
+def _iter_file(filename):
+    count = 0
     try:
+        for _, _, record in iter_spans(Path(filename)):
+            count += 1
+            yield record
+    except _PARSE_ERRORS as e:
+        print(colored(f"\n⚠️  {filename} is truncated ({e}); stopping after {count} records", "yellow"))
+
+
+class ParsedWriter:
+    """Write parsed records to a JSON array as they arrive.
+
+    The bytes match json.dump(records, indent=2); the file is written to a temp
+    path and swapped in on close(), so an aborted run never leaves half a file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
         os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(parsed_products, f, ensure_ascii=False, indent=2)
-        print(colored(f"✅ Saved {len(parsed_products)} parsed products to {filename}", "green"))
-    except Exception as e:
-        print(colored(f"❌ Error saving to {filename}: {e}", "red"))
+        self._tmp = filename + ".tmp"
+        self._fh = open(self._tmp, 'w', encoding='utf-8')
+        self.count = 0
+
+    def write(self, record):
+        body = json.dumps(record, ensure_ascii=False, indent=2)
+        self._fh.write(",\n" if self.count else "[\n")
+        self._fh.write("\n".join("  " + line for line in body.split("\n")))
+        self.count += 1
+
+    def close(self):
+        self._fh.write("\n]" if self.count else "[]")
+        self._fh.close()
+        os.replace(self._tmp, self.filename)
+
+    def abort(self):
+        self._fh.close()
+        os.remove(self._tmp)
 
 
 def main():
@@ -620,55 +1296,153 @@ def main():
 
     arg_parser = argparse.ArgumentParser(description="Parse scraped product HTML into structured records.")
     arg_parser.add_argument("--input", "-i", default=default_input,
-                            help=f"Path to the (merged) products_html JSON (default: {default_input})")
+                            help=f"Path to the (merged) products_html JSON, or a .jsonl crawl session (default: {default_input})")
     arg_parser.add_argument("--output", "-o", default=default_output,
                             help=f"Destination for parsed records (default: {default_output})")
+    arg_parser.add_argument("--url", default=None,
+                            help="Parse only this product_url (looked up via the corpus offset index) "
+                                 "and print the result instead of saving")
+    arg_parser.add_argument("--workers", "-w", type=int, default=1,
+                            help="Parse in N worker processes (default: 1, in-process)")
+    arg_parser.add_argument("--chunksize", type=int, default=None,
+                            help=f"Records per work unit sent to a worker (default: {DEFAULT_CHUNKSIZE})")
+    arg_parser.add_argument("--cache", default=str(DEFAULT_CACHE),
+                            help=f"Parse cache keyed by page hash + parser version (default: {DEFAULT_CACHE})")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="Parse every page, ignoring (and not updating) the parse cache")
+    arg_parser.add_argument("--prune-cache", action="store_true",
+                            help="After the run, drop cache entries left by older parser versions")
+    arg_parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                            help=f"HTML tree builder (default: {DEFAULT_BACKEND}; "
+                                 f"available here: {', '.join(available_backends())})")
+    arg_parser.add_argument("--parity", choices=BACKENDS, default=None, metavar="BACKEND",
+                            help="Instead of parsing, compare --backend against BACKEND field by field "
+                                 "on a sample of listings and report the differences")
+    arg_parser.add_argument("--sample", type=int, default=200,
+                            help="Listings sampled for --parity (default: 200)")
+    arg_parser.add_argument("--selector-stats", default=str(DEFAULT_STATS),
+                            help=f"Learned per-host selector order (default: {DEFAULT_STATS})")
+    arg_parser.add_argument("--no-learn", action="store_true",
+                            help="Use the fixed selector order and don't update the selector stats")
+    arg_parser.add_argument("--prefilter", action="store_true",
+                            help="Only parse listings whose raw text could match the filter_medicines "
+                                 "keywords; the pruned URLs are listed in <output>.prefiltered.json")
+    arg_parser.add_argument("--fuzzy", action="store_true",
+                            help="With --prefilter: also keep listings that could only match misspelled "
+                                 "keywords, for filter_medicines.py --fuzzy")
+    arg_parser.add_argument("--fields", default=None,
+                            help="Only compute these output fields, comma-separated; names from "
+                                 f"{', '.join(PARSED_FIELDS)} or the sets {', '.join(FIELD_SETS)} "
+                                 "(e.g. --fields filter). Default: every field")
+    arg_parser.add_argument("--keywords", "-k", default=str(DEFAULT_KEYWORDS),
+                            help="Keyword groups JSON for --prefilter (default: built-in TERM_GROUPS if missing)")
     args = arg_parser.parse_args()
+    fields = None
+    if args.fields:
+        try:
+            fields = resolve_fields(args.fields)
+        except ValueError as e:
+            arg_parser.error(f"--fields: {e}")
+
+    SELECTOR_LEARNER.path = Path(args.selector_stats)
+    if not args.no_learn:
+        SELECTOR_LEARNER.load()
+
+    if args.parity:
+        products_data, _ = iter_products_data(args.input)
+        sample = sample_listings(products_data, args.sample)
+        print_parity_report(compare_backends(sample, args.backend, args.parity), args.backend, args.parity)
+        return
+
+    if args.url:
+        # Debugging one extractor: seek straight to the listing instead of loading everything.
+        with MergedCorpus(args.input) as corpus:
+            product_data = corpus.get(args.url)
+        if product_data is None:
+            print(colored(f"❌ {args.url} not found in {args.input}", "red"))
+            return
+        print(json.dumps(parse_product_html(product_data, args.backend, fields), ensure_ascii=False, indent=2))
+        return
 
     print(colored("🚀 Starting HTML Parser for Drug Data", "cyan", attrs=['bold']))
 
-    # Load the scraped data
-    products_data = load_products_data(args.input)
-    if not products_data:
-        print(colored("❌ No data to parse. Exiting.", "red"))
+    # Records are read lazily and parsed results written as they come back, so
+    # neither the raw corpus nor the parsed list is ever held in memory.
+    if not os.path.exists(args.input):
+        print(colored(f"❌ {args.input} not found!", "red"))
         return
-    
-    parsed_products = []
+    products_data, total = iter_products_data(args.input)
+
+    cache = None if args.no_cache else ParseCache(args.cache)
+    prefilter = KeywordPrefilter.from_keywords(Path(args.keywords), fuzzy=args.fuzzy) if args.prefilter else None
+    writer = ParsedWriter(args.output)
     failed_count = 0
     skipped_count = 0
+    pruned_urls = []
+    seen = 0
 
-    print(colored(f"\n📊 Processing {len(products_data)} products...", "cyan"))
-
-    for i, product_data in enumerate(products_data, 1):
-        print(colored(f"  [{i}/{len(products_data)}] Processing...", "white"), end=" ")
-
-        # Skip non-listing pages (add-to-cart redirects, category/shop indexes
-        # and vendor storefronts) -- they carry no real product title.
-        if not is_product_url(product_data.get('product_url', '')):
-            skipped_count += 1
-            print(colored("⏭️  (non-listing)", "yellow"))
-            continue
-
-        parsed_data = parse_product_html(product_data)
+    workers = max(1, args.workers)
+    suffix = f" in {workers} worker processes" if workers > 1 else ""
+    print(colored(f"\n📊 Processing {total if total is not None else 'all'} products{suffix}...", "cyan"))
+    if fields is not None:
+        print(colored(f"   Fields: {', '.join(fields)}", "cyan"))
 
-        if parsed_data:
-            parsed_products.append(parsed_data)
-            print(colored("✅", "green"))
-        else:
-            failed_count += 1
-            print(colored("❌", "red"))
-    
-    # Save the parsed data
-    print(colored(f"\n{'='*80}", "cyan"))
-    print(colored(f"💾 SAVING RESULTS", "cyan", attrs=['bold']))
-    print(colored(f"{'='*80}", "cyan"))
-    
-    save_parsed_data(parsed_products, args.output)
+    try:
+        results = iter_parse_results(products_data, workers, args.chunksize, cache, args.backend, prefilter,
+                                     fields)
+        for i, (status, parsed_data) in enumerate(results, 1):
+            seen = i
+            progress = f"{i}/{total}" if total is not None else f"{i}"
+            print(colored(f"  [{progress}] Processing...", "white"), end=" ")
+
+            if status == "skipped":
+                skipped_count += 1
+                print(colored("⏭️  (non-listing)", "yellow"))
+            elif status == "pruned":
+                pruned_urls.append(parsed_data)
+                print(colored("🔎 (no keyword)", "white"))
+            elif status == "parsed":
+                writer.write(parsed_data)
+                print(colored("✅", "green"))
+            else:
+                failed_count += 1
+                print(colored("❌", "red"))
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if cache is not None:
+            cache_hits, cache_misses = cache.hits, cache.misses
+            if args.prune_cache:
+                cache.prune(ruleset_version(args.backend))
+            cache.close()
+
+    if not seen:
+        writer.abort()
+        print(colored("❌ No data to parse. Exiting.", "red"))
+        return
+    writer.close()
+    # The sidecar keeps build_category_share.py's denominator exact; a full parse
+    # removes any stale one so pruned URLs aren't counted twice.
+    pruned_file = pruned_path_for(args.output)
+    if prefilter is not None:
+        save_pruned(args.output, pruned_urls, writer.count, fuzzy=args.fuzzy)
+    elif pruned_file.exists():
+        pruned_file.unlink()
+    if not args.no_learn:
+        SELECTOR_LEARNER.merge(SELECTOR_LEARNER.take_pending())
+        SELECTOR_LEARNER.save()
 
     print(colored(f"\n✅ Parsing complete!", "green", attrs=['bold']))
-    print(colored(f"   Successfully parsed: {len(parsed_products)} products", "green"))
+    print(colored(f"   Successfully parsed: {writer.count} products", "green"))
     print(colored(f"   Skipped (non-listing pages): {skipped_count}", "yellow"))
     print(colored(f"   Failed to parse: {failed_count} products", "red" if failed_count > 0 else "green"))
+    if prefilter is not None:
+        print(colored(f"   Pruned by keyword prefilter: {len(pruned_urls)} "
+                      f"(listings in denominator: {writer.count + len(pruned_urls)}, see {pruned_file.name})", "cyan"))
+    if cache is not None:
+        print(colored(f"   Parse cache ({ruleset_version(args.backend)}): {cache_hits} reused, "
+                      f"{cache_misses} parsed fresh", "cyan"))
     print(colored(f"   Saved to: {args.output}", "green"))
 
 
@@ -0,0 +1,334 @@
+"""Offline benchmark for parser.py's extractors.
+
+Runs parse_product_html() over a fixed page corpus and reports pages/sec, p50/p95
+per-page latency, the CSS selectors evaluated per page and the time spent
+building the tree, dispatching to a market plan and in each field extractor,
+broken down by market. Results are written as
+JSON so two runs (before/after an extractor change) can be diffed.
+
+The corpus is frozen on first use into data/bench/corpus.jsonl: a seeded sample
+of listings from the raw crawl sessions (data/raw/products_html_20*.json*) plus
+one synthetic page per market template, so every MarketPlan is exercised even
+when the raw sample misses a market. Nothing touches the network.
+
+    python3 src/parser_bench.py --build-corpus [--sample 300]   # (re)freeze the corpus
+    python3 src/parser_bench.py -o data/bench/before.json       # run it
+    python3 src/parser_bench.py --compare data/bench/before.json data/bench/after.json
+
+Stage timings come from parse_product_html() itself (its `profile` hook), so
+the profiled pass is the real parser, not a copy of its dispatch.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import parser as page_parser
+from html_backends import BACKENDS, DEFAULT_BACKEND
+from html_store import resolve_html
+from merge_html_sessions import DEFAULT_GLOB, session_paths
+from session_writer import iter_jsonl
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+BENCH_DIR = PROJECT_ROOT / "data" / "bench"
+DEFAULT_CORPUS = BENCH_DIR / "corpus.jsonl"
+DEFAULT_RESULTS = BENCH_DIR / "results.json"
+
+RESULTS_VERSION = 1
+GENERIC_MARKET = "generic"
+# --compare flags a timing that got slower by more than this fraction.
+DEFAULT_THRESHOLD = 0.10
+# ...unless both timings are below this (sub-0.05 ms stages are timer noise).
+MIN_COMPARED_MS = 0.05
+
+
+# --------------------------------------------------------------------------- #
+# Synthetic pages, one per market template
+# --------------------------------------------------------------------------- #
+
+_FILLER = "".join(
+    f'<li class="menu-item"><a href="/category/{i}/">Category {i}</a></li>' for i in range(60)
+)
+_REVIEWS = "".join(
+    f'<div class="review"><p>Review {i}: arrived in discreet packaging after ten days, works as described.</p></div>'
+    for i in range(8)
+)
+_TABLE = ('<table><tr><th>Strength</th><td>200 mg</td></tr><tr><th>Quantity</th><td>30 tabs</td></tr>'
+          '<tr><th>Stock</th><td>120 in stock</td></tr></table>')
+
+
+def _page(title, body):
+    return (f"<html><head><title>{title}</title><meta name=\"description\" content=\"Misoprostol 200mcg "
+            f"tablets, discreet shipping worldwide.\"></head><body><nav><ul>{_FILLER}</ul></nav>"
+            f"{body}{_TABLE}{_REVIEWS}</body></html>")
+
+
+SYNTHETIC_PAGES = [
+    ("http://drughub.example.onion/listing/1001/misoprostol",
+     _page("Drug Hub - Misoprostol 200mcg x 28",
+           '<div class="product-description">Misoprostol 200mcg, 28 tablets per pack, '
+           'sealed blister packs from a licensed manufacturer.</div><span class="price">$45.00</span>')),
+    ("http://osiris.example.onion/product/6c1f-misoprostol",
+     _page("Osiris - Product - Mifepristone 200mg",
+           '<div class="description">Mifepristone 200mg single tablet, original packaging, '
+           'shipped from EU with tracking.</div><div class="price">$60.00</div>')),
+    ("http://abacus.example.onion/item/9d2e-levonorgestrel",
+     _page("Levonorgestrel 1.5mg | Abacus Market",
+           '<h1>About Vendor</h1><div class="product-description">Levonorgestrel 1.5mg emergency '
+           'contraceptive, one tablet, sealed.</div><span class="price">$20.00</span>')),
+    ("http://blackops.example.onion/product/cytotec-200",
+     _page("Product «Cytotec 200mcg» - Black Ops",
+           '<div class="product_pg_r_title">Cytotec 200mcg x 30</div>'
+           '<div class="product_pg_r_text">Active ingredient: misoprostol. Manufacturer: Pfizer.</div>'
+           '<div class="price">$75.00</div>')),
+    ("http://torzon.example.onion/products.php?action=view&id=42",
+     _page("TorZon Market",
+           '<center><font style="font-size: 18px">Yasmin 3mg/0.03mg 84 tabs</font></center>'
+           '<table><tr><td>Shipping</td><td>Germany -> WorldWide</td></tr>'
+           '<tr><td>Category</td><td>Pharmacy</td></tr></table><p>USD 39.90</p>')),
+    ("http://woo.example.onion/product/mifepristone-misoprostol-kit/",
+     _page("Mifepristone &amp; Misoprostol Kit – Grace Med Store",
+           '<div class="summary"><h1 class="product_title entry-title">Mifepristone &amp; Misoprostol Kit</h1>'
+           '<p class="price"><span class="woocommerce-Price-amount amount">$120.00</span></p>'
+           '<div class="woocommerce-product-details__short-description">Complete kit: one mifepristone '
+           '200mg and four misoprostol 200mcg tablets.</div><p class="stock in-stock">35 in stock</p></div>'
+           '<div class="woocommerce-product-rating">Rated 4.8 / 5</div>')),
+    ("http://unknown.example.onion/shop/norethisterone-5mg/",
+     _page("Buy Norethisterone 5mg | Some Shop",
+           '<h1 class="product-name">Norethisterone 5mg x 30</h1><div class="product-price">$25.00</div>'
+           '<div class="entry-content">Norethisterone 5mg tablets used to delay periods and treat '
+           'irregular bleeding, 30 tablets per box.</div><div class="rating">4.5 stars</div>')),
+]
+
+
+def synthetic_records() -> List[dict]:
+    return [{"market": "synthetic", "category_page": "", "product_url": url, "fetched_at": 0, "html": html}
+            for url, html in SYNTHETIC_PAGES]
+
+
+# --------------------------------------------------------------------------- #
+# Corpus
+# --------------------------------------------------------------------------- #
+
+def _iter_sessions(pattern: str) -> Iterable[dict]:
+    for path in session_paths(pattern):
+        records, _ = page_parser.iter_products_data(str(path))
+        yield from records
+
+
+def build_corpus(path: Path, pattern: str = DEFAULT_GLOB, size: int = 300, seed: int = 0) -> int:
+    """Freeze a seeded sample of raw listings plus the synthetic pages into `path`.
+
+    HTML is inlined (store-backed records are resolved), so the corpus stays
+    valid even if the HTML store is pruned later.
+    """
+    sample = page_parser.sample_listings(_iter_sessions(pattern), size, seed)
+    records = [dict(record, html=resolve_html(record)) for record in sample] + synthetic_records()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        for record in records:
+            if record.get("html"):
+                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+    tmp.replace(path)
+    return len(records)
+
+
+def load_corpus(path: Path) -> List[dict]:
+    return [record for record in iter_jsonl(path) if record.get("html")]
+
+
+# --------------------------------------------------------------------------- #
+# Measurement
+# --------------------------------------------------------------------------- #
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _latency(values_s: List[float]) -> Dict[str, float]:
+    ms = [v * 1000 for v in values_s]
+    return {"p50_ms": round(_percentile(ms, 50), 3), "p95_ms": round(_percentile(ms, 95), 3),
+            "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0}
+
+
+def profile_page(record: dict, backend: str = DEFAULT_BACKEND):
+    """Parse one record with parse_product_html()'s own stage timings; returns
+    (market, {stage: seconds}, CSS selectors evaluated, parsed fields)."""
+    profile: Dict[str, object] = {}
+    parsed = page_parser.parse_product_html(record, backend, profile=profile)
+    return (profile.get("market") or GENERIC_MARKET, profile.get("stages", {}), profile.get("lookups", 0),
+            parsed)
+
+
+def run_benchmark(records: List[dict], backend: str = DEFAULT_BACKEND, repeat: int = 3) -> dict:
+    """Time parse_product_html() over `records` (`repeat` passes, best pass per
+    page) and profile each page's stages once."""
+    listings = [r for r in records if page_parser.is_product_url(r.get("product_url", ""))]
+
+    # Warm-up pass: imports, regex compilation and the soupsieve cache.
+    for record in listings[:5]:
+        page_parser.parse_product_html(record, backend)
+
+    best = [float("inf")] * len(listings)
+    wall = []
+    for _ in range(max(1, repeat)):
+        pass_started = time.perf_counter()
+        for i, record in enumerate(listings):
+            started = time.perf_counter()
+            page_parser.parse_product_html(record, backend)
+            best[i] = min(best[i], time.perf_counter() - started)
+        wall.append(time.perf_counter() - pass_started)
+
+    markets: Dict[str, dict] = {}
+    totals: Dict[str, float] = {}
+    for i, record in enumerate(listings):
+        market, stages, lookups, _ = profile_page(record, backend)
+        entry = markets.setdefault(market, {"pages": 0, "latencies": [], "stages": {}, "lookups": 0})
+        entry["pages"] += 1
+        entry["lookups"] += lookups
+        entry["latencies"].append(best[i])
+        for stage, seconds in stages.items():
+            entry["stages"][stage] = entry["stages"].get(stage, 0.0) + seconds
+            totals[stage] = totals.get(stage, 0.0) + seconds
+
+    fastest = min(wall) if wall else 0.0
+    return {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "parser_version": page_parser.ruleset_version(backend),
+        "backend": backend,
+        "pages": len(listings),
+        "repeat": max(1, repeat),
+        "pages_per_sec": round(len(listings) / fastest, 2) if fastest else 0.0,
+        "latency": _latency(best),
+        "stages_ms": {stage: round(seconds * 1000, 3)
+                      for stage, seconds in sorted(totals.items(), key=lambda item: -item[1])},
+        "markets": {
+            market: {
+                "pages": entry["pages"],
+                "latency": _latency(entry["latencies"]),
+                "lookups_per_page": round(entry["lookups"] / entry["pages"], 2),
+                "stages_ms": {stage: round(seconds * 1000, 3)
+                              for stage, seconds in sorted(entry["stages"].items(), key=lambda item: -item[1])},
+            }
+            for market, entry in sorted(markets.items())
+        },
+    }
+
+
+# --------------------------------------------------------------------------- #
+# Reporting
+# --------------------------------------------------------------------------- #
+
+def print_results(results: dict) -> None:
+    latency = results["latency"]
+    print(f"{results['pages']} pages, backend {results['backend']}, parser {results['parser_version']}")
+    print(f"  {results['pages_per_sec']:.1f} pages/s   p50 {latency['p50_ms']:.2f} ms   "
+          f"p95 {latency['p95_ms']:.2f} ms")
+    for market, entry in results["markets"].items():
+        print(f"\n  {market} ({entry['pages']} pages, p50 {entry['latency']['p50_ms']:.2f} ms, "
+              f"p95 {entry['latency']['p95_ms']:.2f} ms, {entry['lookups_per_page']:.1f} selectors/page)")
+        for stage, ms in entry["stages_ms"].items():
+            print(f"    {stage:<34} {ms:10.2f} ms  ({ms / entry['pages']:.3f} ms/page)")
+
+
+def _delta(before: float, after: float) -> Optional[float]:
+    return (after - before) / before if before else None
+
+
+def compare_results(before: dict, after: dict, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Print a before/after table and return the metrics that regressed by more than `threshold`."""
+    regressions = []
+
+    def row(label, old, new, higher_is_better=False):
+        change = _delta(old, new)
+        worse = change is not None and (-change if higher_is_better else change) > threshold \
+            and (higher_is_better or max(old, new) >= MIN_COMPARED_MS)
+        if worse:
+            regressions.append(label)
+        shown = f"{change:+.1%}" if change is not None else "n/a"
+        print(f"  {label:<46} {old:>10.2f} {new:>10.2f} {shown:>8}{'  ⚠️' if worse else ''}")
+
+    print(f"  {'metric':<46} {'before':>10} {'after':>10} {'change':>8}")
+    row("pages/s", before["pages_per_sec"], after["pages_per_sec"], higher_is_better=True)
+    row("p50 ms", before["latency"]["p50_ms"], after["latency"]["p50_ms"])
+    row("p95 ms", before["latency"]["p95_ms"], after["latency"]["p95_ms"])
+    for market in sorted(set(before["markets"]) & set(after["markets"])):
+        old, new = before["markets"][market], after["markets"][market]
+        row(f"{market} p50 ms", old["latency"]["p50_ms"], new["latency"]["p50_ms"])
+        if "lookups_per_page" in old and "lookups_per_page" in new:
+            row(f"{market} selectors/page", old["lookups_per_page"], new["lookups_per_page"])
+        for stage in old["stages_ms"]:
+            if stage in new["stages_ms"]:
+                row(f"{market} {stage} ms/page", old["stages_ms"][stage] / old["pages"],
+                    new["stages_ms"][stage] / new["pages"])
+    return regressions
+
+
+def _load_results(path: Path) -> dict:
+    with path.open("r", encoding="utf-8") as fh:
+        data = json.load(fh)
+    if data.get("version") != RESULTS_VERSION:
+        raise SystemExit(f"{path}: unsupported results version {data.get('version')!r}")
+    return data
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description="Benchmark parser.py's extractors on a fixed offline corpus.")
+    arg_parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS,
+                            help=f"Frozen benchmark corpus, JSONL (default: {DEFAULT_CORPUS})")
+    arg_parser.add_argument("--build-corpus", action="store_true",
+                            help="(Re)build the corpus from the raw sessions before running")
+    arg_parser.add_argument("--glob", default=DEFAULT_GLOB,
+                            help=f"Raw sessions to sample from (default: {DEFAULT_GLOB})")
+    arg_parser.add_argument("--sample", type=int, default=300,
+                            help="Raw listings sampled into the corpus (default: 300)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Sampling seed (default: 0)")
+    arg_parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                            help=f"HTML tree builder (default: {DEFAULT_BACKEND})")
+    arg_parser.add_argument("--repeat", type=int, default=3,
+                            help="Timed passes over the corpus; each page keeps its best time (default: 3)")
+    arg_parser.add_argument("--output", "-o", type=Path, default=DEFAULT_RESULTS,
+                            help=f"Results JSON (default: {DEFAULT_RESULTS})")
+    arg_parser.add_argument("--compare", type=Path, nargs=2, metavar=("BEFORE", "AFTER"),
+                            help="Diff two results files instead of running; exits 1 on a regression")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help=f"Slowdown reported as a regression by --compare (default: {DEFAULT_THRESHOLD})")
+    args = arg_parser.parse_args(argv)
+
+    if args.compare:
+        regressions = compare_results(_load_results(args.compare[0]), _load_results(args.compare[1]),
+                                      args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        return
+
+    if args.build_corpus or not args.corpus.exists():
+        count = build_corpus(args.corpus, args.glob, args.sample, args.seed)
+        print(f"Froze {count} pages into {args.corpus}")
+
+    # The learned selector order would make timings depend on past runs.
+    page_parser.SELECTOR_LEARNER.set_preferred({})
+    results = run_benchmark(load_corpus(args.corpus), args.backend, args.repeat)
+    results["corpus"] = str(args.corpus)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("w", encoding="utf-8") as fh:
+        json.dump(results, fh, ensure_ascii=False, indent=2)
+    print_results(results)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
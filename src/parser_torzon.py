@@ -3,6 +3,10 @@
 Reads TorZon product HTML blobs from data/torzone-html.json and writes
 normalized records to data/parsed-torzone.json. Extracts shipping info that the
 generic parser misses.
+
+parser.py's market registry (MarketPlan "TorZon") now calls these extractors for
+TorZon pages in the main parse run, so this script is only needed for the
+standalone torzone-html.json dump.
 """
 from __future__ import annotations
 
@@ -0,0 +1,209 @@
+"""Raw-text keyword prefilter run ahead of parser.py's full HTML parse.
+
+Only a small fraction of parsed listings ever survive filter_medicines.py, yet
+every page used to pay for a full tree build plus every extractor. The
+prefilter strips the tags from the raw HTML with a few regexes and looks for
+the filter's keywords in what is left (a plain substring test on each term's
+first token, then the term's regex only where that hits); a page whose text
+cannot contain any term is never parsed.
+
+It errs on the side of letting pages through. filter_medicines matches on the
+listing title, description and review, which are all page text, <title> text
+or a <meta content="..."> value. The prefilter looks at two views of that text
+(tags removed, and tags replaced by a space, so a term split by inline markup
+and a term that only ends at an element boundary are both seen) and drops the
+trailing word boundary (descriptions are cut at 500 characters). A page it
+lets through is parsed normally and still has to pass filter_medicines.
+
+Exact terms only, by default: a page whose only hits are misspellings is
+pruned, so filter_medicines.py --fuzzy would find nothing new in the output.
+With fuzzy=True (parser.py --prefilter --fuzzy) the prefilter also keeps every
+page with a word that fuzzy_terms.FuzzyTermIndex puts near a term token; every
+fuzzy hit needs such a word. The one such hit it can miss is a word cut short
+by the 500-character description limit. The sidecar records which mode pruned
+the output, and filter_medicines.py --fuzzy warns about a non-fuzzy one.
+
+The parsed output then only holds pages that could match, but
+build_category_share.py needs every listing in its denominator. parser.py
+therefore writes the URLs of the pruned listings next to the output
+(parsed_merged.json -> parsed_merged.prefiltered.json), and
+build_category_share.py counts them along with the parsed records:
+
+    {"version": 1, "parsed": <records in the output>, "pruned": <n>, "fuzzy": false, "urls": [...]}
+
+    python3 src/parser.py --prefilter                # parse only pages that could match
+    python3 src/prefilter.py --input data/merged/products_html_merged.json   # hit rate only
+"""
+from __future__ import annotations
+
+import argparse
+import html as html_lib
+import json
+import os
+import re
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from filter_medicines import TERM_GROUPS, build_matcher, load_term_groups
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_KEYWORDS = PROJECT_ROOT / "data" / "config" / "search_keywords.json"
+
+# get_text() skips <script>/<style> bodies and comments, so they can't match either.
+_INVISIBLE = re.compile(r"<script\b.*?</script\s*>|<style\b.*?</style\s*>|<!--.*?-->",
+                        re.IGNORECASE | re.DOTALL)
+_META_CONTENT = re.compile(r"<meta\b[^>]*?\bcontent\s*=\s*(?:\"([^\"]*)\"|'([^']*)')", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+_WORD_CHAR = re.compile(r"\w")
+_WORD = re.compile(r"\w+")
+
+
+def page_text(html: str) -> str:
+    """Cheap stand-in for the text the extractors can see: both tag-stripped views
+    plus every <meta content> value, entity-decoded."""
+    visible = _INVISIBLE.sub("", html)
+    meta = " ".join(a or b for a, b in _META_CONTENT.findall(visible))
+    joined = _TAG.sub("", visible)
+    spaced = _TAG.sub(" ", visible)
+    return html_lib.unescape(f"{joined}\n{spaced}\n{meta}")
+
+
+def build_prefilter_patterns(term_groups: Dict[str, Sequence[str]] = TERM_GROUPS) -> Dict[str, re.Pattern[str]]:
+    """{first token: pattern} over every term, in filter_medicines.build_patterns'
+    token form but lowercased and without the \b anchors (see the module docstring).
+
+    Terms sharing a first token share one pattern that starts with that token as
+    a literal, which lets the regex engine skip ahead with a fast substring scan;
+    a leading \b would make it try every position of the page instead. The
+    leading boundary is checked per match instead.
+    """
+    tails: Dict[str, set] = {}
+    for terms in term_groups.values():
+        for term in terms:
+            tokens = [token.lower() for token in re.split(r"[\s\-]+", term) if token]
+            if tokens:
+                tails.setdefault(tokens[0], set()).add("".join(r"\W*" + re.escape(token) for token in tokens[1:]))
+    return {
+        first: re.compile(re.escape(first) + "(?:" + "|".join(sorted(group, key=lambda tail: (-len(tail), tail))) + ")")
+        for first, group in tails.items()
+    }
+
+
+def _matches_at_word_start(pattern: re.Pattern[str], text: str) -> bool:
+    """pattern.search(text) with a leading \b, checked by hand (see above)."""
+    match = pattern.search(text)
+    while match:
+        pos = match.start()
+        before = pos > 0 and _WORD_CHAR.match(text, pos - 1) is not None
+        if before != (_WORD_CHAR.match(text, pos) is not None):
+            return True
+        match = pattern.search(text, pos + 1)
+    return False
+
+
+class KeywordPrefilter:
+    """Decides from raw HTML whether a page could pass filter_medicines."""
+
+    def __init__(self, term_groups: Dict[str, Sequence[str]] = TERM_GROUPS, fuzzy: bool = False):
+        self.patterns = build_prefilter_patterns(term_groups)
+        self.fuzzy = build_matcher(term_groups, fuzzy=True).fuzzy if fuzzy else None
+
+    @classmethod
+    def from_keywords(cls, path: Optional[Path] = DEFAULT_KEYWORDS, fuzzy: bool = False) -> "KeywordPrefilter":
+        """Same keyword source as filter_medicines.main(): the JSON file if present,
+        else the built-in TERM_GROUPS."""
+        if path and Path(path).exists():
+            return cls(load_term_groups(Path(path)), fuzzy=fuzzy)
+        return cls(fuzzy=fuzzy)
+
+    def could_match(self, html: str) -> bool:
+        if not html:
+            return False
+        text = page_text(html).lower()
+        # Scanning the page once per term is what made the naive version slow:
+        # instead, look each first token up among the page's sorted words (the
+        # token has to start a word) and only run the regexes of the hits.
+        words = sorted(set(_WORD.findall(text)))
+        for first, pattern in self.patterns.items():
+            if _WORD.fullmatch(first):
+                i = bisect_left(words, first)
+                if i == len(words) or not words[i].startswith(first):
+                    continue
+            elif first not in text:
+                continue
+            if _matches_at_word_start(pattern, text):
+                return True
+        if self.fuzzy is not None:
+            return any(self.fuzzy.near_tokens(word) for word in words)
+        return False
+
+
+PRUNED_VERSION = 1
+
+
+def pruned_path_for(parsed_path) -> Path:
+    """Sidecar listing the pruned URLs of a parsed output file."""
+    parsed_path = Path(parsed_path)
+    return parsed_path.with_name(parsed_path.stem + ".prefiltered.json")
+
+
+def save_pruned(parsed_path, urls: List[str], parsed: int, fuzzy: bool = False) -> Path:
+    path = pruned_path_for(parsed_path)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        json.dump({"version": PRUNED_VERSION, "parsed": parsed, "pruned": len(urls), "fuzzy": fuzzy,
+                   "urls": urls}, fh, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+def load_pruned_urls(parsed_path) -> List[str]:
+    """URLs pruned from `parsed_path` by the prefilter ([] for a full parse)."""
+    path = pruned_path_for(parsed_path)
+    if not path.exists():
+        return []
+    with path.open("r", encoding="utf-8") as fh:
+        data = json.load(fh)
+    if data.get("version") != PRUNED_VERSION:
+        raise ValueError(f"{path}: unsupported prefilter sidecar version {data.get('version')!r}")
+    return [str(url) for url in data.get("urls", [])]
+
+
+def prefiltered_fuzzy(parsed_path) -> Optional[bool]:
+    """Whether `parsed_path` was prefiltered with fuzzy matching (None: not prefiltered)."""
+    path = pruned_path_for(parsed_path)
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as fh:
+        return bool(json.load(fh).get("fuzzy", False))
+
+
+def main() -> None:
+    # Imported here: parser.py imports this module.
+    from parser import is_product_url, iter_products_data
+    from html_store import resolve_html
+
+    arg_parser = argparse.ArgumentParser(description="Report how many listings pass the keyword prefilter.")
+    arg_parser.add_argument("--input", "-i", required=True, help="Merged products_html JSON or a .jsonl session")
+    arg_parser.add_argument("--keywords", "-k", type=Path, default=DEFAULT_KEYWORDS,
+                            help="Keyword groups JSON (default: built-in TERM_GROUPS if missing)")
+    arg_parser.add_argument("--fuzzy", action="store_true",
+                            help="Also pass pages that could only match misspelled terms")
+    args = arg_parser.parse_args()
+
+    prefilter = KeywordPrefilter.from_keywords(args.keywords, fuzzy=args.fuzzy)
+    records, _ = iter_products_data(args.input)
+    listings = passed = 0
+    for record in records:
+        if not is_product_url(record.get("product_url", "")):
+            continue
+        listings += 1
+        if prefilter.could_match(resolve_html(record)):
+            passed += 1
+    share = passed / listings if listings else 0.0
+    print(f"{passed}/{listings} listings pass the prefilter ({share:.1%})")
+
+
+if __name__ == "__main__":
+    main()
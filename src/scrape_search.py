@@ -24,8 +24,9 @@ Supported markets (see MARKETS registry):
   - abacus  : /search?adv=on&s_terms=<term>&...     ; count in "Found N results." text
   - wethenorth: /items.php?q=<term>                 ; NO result count → gate on product links
 
-Output is written in the SAME raw record format and `products_html_<timestamp>.json`
-naming as scrape_simple.py, so the existing pipeline picks it up with no changes:
+Output is written in the SAME raw record format and `products_html_<timestamp>.jsonl`
+naming as scrape_simple.py (streamed one record per line, see session_writer.py),
+so the existing pipeline picks it up with no changes:
 
     python3 src/scrape_search.py --market all --manual --socks --socks-port 9150 --insecure
     python3 src/merge_html_sessions.py
@@ -37,7 +38,7 @@ FORUM mode (--forum, see FORUMS registry; Dread first):
   Same per-term crawl loop, but for a forum's keyword search. It reads the result
   count, follows each matched comment's conversation (post) link, and fetches that
   page. Output is routed to forum-specific files (NOT the product pipeline):
-    - data/raw/forum_posts_<timestamp>.json      : raw HTML of each conversation
+    - data/raw/forum_posts_<timestamp>.jsonl     : raw HTML of each conversation
     - data/raw/forum_search_report_<timestamp>.json : per-term {count, conversation_urls, category}
 
     python3 src/scrape_search.py --forum dread --manual --socks --socks-port 9150 --insecure
@@ -73,9 +74,12 @@ from scrape_simple import (
     fetch_page_html_browser,
     extract_product_links,
     scrape_product_page,
-    save_products_html,
     _looks_like_captcha,
 )
+from html_pruner import prune_record
+from html_store import STORE_DIR, HtmlStore
+from parse_on_fetch import DEFAULT_PARSE_WORKERS, ParseOnFetch, parsed_path_for
+from session_writer import DEFAULT_FSYNC_EVERY, SESSION_EXT, SessionWriter
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -694,8 +698,11 @@ def crawl_search_term(driver, session, market, term, args, scraped_urls, all_pro
                     "fetched_at": int(time.time()),
                     "html": html,
                 } if html else None
+                if data and args.prune_html:
+                    prune_record(data)
             else:
-                data = scrape_product_page(session, p_url, search_page_url, market.host)
+                data = scrape_product_page(session, p_url, search_page_url, market.host,
+                                           prune=args.prune_html)
             time.sleep(args.delay + random.uniform(0, 1))
             return p_url, data
 
@@ -846,6 +853,20 @@ def parse_args():
                         help="Fetch product pages through the browser instead of the requests "
                              "session (forces sequential). Use for markets that drop the requests "
                              "session; some markets enable this by default.")
+    parser.add_argument("--fsync-every", type=int, default=DEFAULT_FSYNC_EVERY,
+                        help="Flush + fsync the session file after this many pages "
+                             f"(default: {DEFAULT_FSYNC_EVERY})")
+    parser.add_argument("--html-store", action="store_true",
+                        help=f"Keep page HTML in the compressed, deduplicating store ({STORE_DIR}) "
+                             "and write only its content_hash to the session file")
+    parser.add_argument("--parse-on-fetch", action="store_true",
+                        help="Parse each product page in background processes as soon as it is saved, "
+                             "streaming records to data/parsed/<session>.parsed.jsonl")
+    parser.add_argument("--parse-workers", type=int, default=DEFAULT_PARSE_WORKERS,
+                        help=f"Parse processes for --parse-on-fetch (default: {DEFAULT_PARSE_WORKERS})")
+    parser.add_argument("--prune-html", action="store_true",
+                        help="Drop scripts, styles, SVG icons, base64 images and plain nav menus from "
+                             "each product page before saving it (check with html_pruner.py --verify)")
     # Search-specific
     parser.add_argument("--keywords", type=Path, default=KEYWORDS_FILE,
                         help=f"Keywords JSON (default: {KEYWORDS_FILE})")
@@ -907,8 +928,8 @@ def main():
 
     run_timestamp = time.strftime("%Y%m%d_%H%M%S")
     html_base = FORUM_POSTS_FILE if forum_mode else PRODUCTS_HTML_FILE
-    base_name, ext = os.path.splitext(html_base)
-    output_file = f"{base_name}_{run_timestamp}{ext or '.json'}"
+    base_name, _ = os.path.splitext(html_base)
+    output_file = f"{base_name}_{run_timestamp}{SESSION_EXT}"
     report_base, report_ext = os.path.splitext(FORUM_REPORT_FILE)
     report_file = f"{report_base}_{run_timestamp}{report_ext or '.json'}"
     # Forum runs accumulate one report row per term; None for market runs.
@@ -923,7 +944,14 @@ def main():
         print(colored("   WARNING: TLS verification disabled (--insecure)", "yellow"))
 
     driver = None
-    all_products = []
+    # Streams each fetched page straight to disk; behaves like the list it replaced.
+    html_store = HtmlStore() if args.html_store else None
+    # Parsed as they arrive, in background processes, when --parse-on-fetch is set.
+    parse_stage = ParseOnFetch(parsed_path_for(output_file), workers=args.parse_workers) \
+        if args.parse_on_fetch else None
+    all_products = SessionWriter(output_file, fsync_every=args.fsync_every, store=html_store,
+                                 on_append=parse_stage.submit if parse_stage else None)
+    session_status = "error"
     scraped_urls = set()  # shared dedup across markets (hosts differ, so no collisions)
     capped = False
 
@@ -1007,7 +1035,7 @@ def main():
         print(colored(f"\n{'='*80}", "cyan"))
         print(colored("💾 SAVING RESULTS", "cyan", attrs=["bold"]))
         print(colored(f"{'='*80}", "cyan"))
-        save_products_html(all_products, output_file, overwrite=True)
+        session_status = "complete"
         save_report()
         print(colored("\n✅ Search crawl complete!", "green", attrs=["bold"]))
         noun = "conversation pages" if forum_mode else "products"
@@ -1015,16 +1043,23 @@ def main():
         print(colored(f"   Saved to: {output_file}", "green"))
 
     except KeyboardInterrupt:
+        session_status = "interrupted"
         print(colored("\n\n⚠️  Interrupted by user", "yellow"))
-        if all_products:
-            print(colored(f"💾 Saving {len(all_products)} pages collected so far...", "yellow"))
-            save_products_html(all_products, output_file, overwrite=True)
+        print(colored(f"💾 {len(all_products)} pages collected so far are already in {output_file}", "yellow"))
         save_report()
     except Exception as e:
         print(colored(f"\n❌ Error: {e}", "red"))
         import traceback
         traceback.print_exc()
     finally:
+        # Footer marks how the session ended; every page is already on disk.
+        all_products.close(status=session_status)
+        if parse_stage is not None:
+            parse_stage.close(status=session_status)
+        if html_store is not None:
+            print(colored(f"🗄️  HTML store: {html_store.writes} new page(s), "
+                          f"{html_store.hits} unchanged (deduplicated)", "cyan"))
+            html_store.close()
         if driver and not args.keep_browser_open:
             if args.manual:
                 try:
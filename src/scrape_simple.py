@@ -6,7 +6,8 @@ This scraper:
 1. Reads category URLs from pages_url.json
 2. Extracts all product listing URLs from each category page
 3. Fetches the raw HTML for each product page
-4. Saves everything to products_html.json (overwrites each time)
+4. Streams each page to products_html_<timestamp>.jsonl as it arrives
+   (see session_writer.py), so memory stays flat and a crash keeps what was fetched
 
 General-purpose: Works with any marketplace HTML structure.
 
@@ -43,6 +44,11 @@ from selenium.common.exceptions import TimeoutException, WebDriverException
 from bs4 import BeautifulSoup
 from termcolor import colored
 
+from html_pruner import prune_record
+from html_store import STORE_DIR, HtmlStore
+from parse_on_fetch import DEFAULT_PARSE_WORKERS, ParseOnFetch, parsed_path_for
+from session_writer import DEFAULT_FSYNC_EVERY, SESSION_EXT, SessionWriter
+
 
 # Configuration
 PROXY_HOST = "127.0.0.1"
@@ -77,19 +83,6 @@ def load_pages_urls():
         return []
 
 
-def save_products_html(products, output_path, overwrite=True):
-    """Save product HTML data to the specified JSON file"""
-    mode = 'w' if overwrite else 'a'
-
-    try:
-        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
-        with open(output_path, mode, encoding='utf-8') as f:
-            json.dump(products, f, ensure_ascii=False, indent=2)
-        print(colored(f"✅ Saved {len(products)} products to {output_path}", "green"))
-    except Exception as e:
-        print(colored(f"❌ Error saving to {output_path}: {e}", "red"))
-
-
 def extract_cookies(driver, do_quit=False):
     """Extract cookies from Selenium driver"""
     cookies = driver.get_cookies()
@@ -471,21 +464,26 @@ def page_url(template, n):
     return template.replace("{n}", str(n))
 
 
-def scrape_product_page(session, product_url, category_url, market_name):
-    """Scrape a single product page and return HTML data"""
+def scrape_product_page(session, product_url, category_url, market_name, prune=False):
+    """Scrape a single product page and return HTML data.
+
+    With prune=True the HTML is pruned before it is stored (see html_pruner.py)
+    and the record also carries the fetched page's original_size/original_hash.
+    """
     print(colored(f"  📦 Fetching: {product_url}", "blue"))
     
     html = fetch_page_html(session, product_url)
     if not html:
         return None
     
-    return {
+    record = {
         "market": market_name,
         "category_page": category_url,
         "product_url": product_url,
         "fetched_at": int(time.time()),
         "html": html
     }
+    return prune_record(record) if prune else record
 
 
 def main():
@@ -531,6 +529,20 @@ def main():
                        help='Fetch category/listing pages through the Selenium browser instead of '
                             'the requests session. Needed for markets (e.g. drughub) that bounce '
                             'deep ?page=N requests to the homepage over a plain requests session.')
+    parser.add_argument('--fsync-every', type=int, default=DEFAULT_FSYNC_EVERY,
+                       help='Flush + fsync the session file after this many products '
+                            f'(default: {DEFAULT_FSYNC_EVERY}). 1 = never lose a fetched page on a crash.')
+    parser.add_argument('--html-store', action='store_true',
+                       help=f'Keep page HTML in the compressed, deduplicating store ({STORE_DIR}) '
+                            'and write only its content_hash to the session file')
+    parser.add_argument('--parse-on-fetch', action='store_true',
+                       help='Parse each product page in background processes as soon as it is saved, '
+                            'streaming records to data/parsed/<session>.parsed.jsonl')
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                       help=f'Parse processes for --parse-on-fetch (default: {DEFAULT_PARSE_WORKERS})')
+    parser.add_argument('--prune-html', action='store_true',
+                       help='Drop scripts, styles, SVG icons, base64 images and plain nav menus from '
+                            'each product page before saving it (check with html_pruner.py --verify)')
 
     args = parser.parse_args()
     
@@ -547,14 +559,22 @@ def main():
         print(colored("   WARNING: TLS verification disabled (--insecure)", "yellow"))
 
     run_timestamp = time.strftime("%Y%m%d_%H%M%S")
-    base_name, ext = os.path.splitext(PRODUCTS_HTML_FILE)
-    output_file = f"{base_name}_{run_timestamp}{ext or '.json'}"
+    base_name, _ = os.path.splitext(PRODUCTS_HTML_FILE)
+    output_file = f"{base_name}_{run_timestamp}{SESSION_EXT}"
     print(colored(f"   Output file: {output_file}", "white"))
     
     # Initialize browser for CAPTCHA solving
     driver = None
     host_sessions = {}
-    all_products = []
+    # Each finished product is appended to disk immediately; only the count and
+    # the URL set stay in memory.
+    html_store = HtmlStore() if args.html_store else None
+    # Parsed as they arrive, in background processes, when --parse-on-fetch is set.
+    parse_stage = ParseOnFetch(parsed_path_for(output_file), workers=args.parse_workers) \
+        if args.parse_on_fetch else None
+    all_products = SessionWriter(output_file, fsync_every=args.fsync_every, store=html_store,
+                                 on_append=parse_stage.submit if parse_stage else None)
+    session_status = "error"
     scraped_urls = set()
     last_host = None
 
@@ -770,7 +790,8 @@ def main():
                 def fetch_one(item):
                     """Fetch one product page (runs in a worker thread)."""
                     p_url, p_host = item
-                    data = scrape_product_page(host_sessions[p_host], p_url, current_page, p_host)
+                    data = scrape_product_page(host_sessions[p_host], p_url, current_page, p_host,
+                                               prune=args.prune_html)
                     # Pace each worker so `--workers` concurrent streams stay polite.
                     time.sleep(args.delay + random.uniform(0, 1))
                     return p_url, data
@@ -800,22 +821,15 @@ def main():
             if args.max_products and len(all_products) >= args.max_products:
                 break
         
-        # Save all products to JSON (overwrite mode)
-        print(colored(f"\n{'='*80}", "cyan"))
-        print(colored(f"💾 SAVING RESULTS", "cyan", attrs=['bold']))
-        print(colored(f"{'='*80}", "cyan"))
-        
-        save_products_html(all_products, output_file, overwrite=True)
-        
+        session_status = "complete"
         print(colored(f"\n✅ Scraping complete!", "green", attrs=['bold']))
         print(colored(f"   Total products scraped: {len(all_products)}", "green"))
         print(colored(f"   Saved to: {output_file}", "green"))
         
     except KeyboardInterrupt:
+        session_status = "interrupted"
         print(colored("\n\n⚠️  Scraping interrupted by user", "yellow"))
-        if all_products:
-            print(colored(f"💾 Saving {len(all_products)} products collected so far...", "yellow"))
-            save_products_html(all_products, output_file, overwrite=True)
+        print(colored(f"💾 {len(all_products)} products collected so far are already in {output_file}", "yellow"))
     
     except Exception as e:
         print(colored(f"\n❌ Error: {e}", "red"))
@@ -823,6 +837,14 @@ def main():
         traceback.print_exc()
     
     finally:
+        # Footer marks how the session ended; every record is already on disk.
+        all_products.close(status=session_status)
+        if parse_stage is not None:
+            parse_stage.close(status=session_status)
+        if html_store is not None:
+            print(colored(f"🗄️  HTML store: {html_store.writes} new page(s), "
+                          f"{html_store.hits} unchanged (deduplicated)", "cyan"))
+            html_store.close()
         if driver and not args.keep_browser_open:
             if args.manual:
                 try:
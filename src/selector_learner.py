@@ -0,0 +1,148 @@
+"""Per-host learned selector order for parser.py's first-match cascades.
+
+Several extractors try a fixed list of CSS selectors and keep the first one that
+yields a value (listing title, description, rating, site name). On any given
+market the same selector wins nearly every time, so every page pays for the
+misses in front of it. SelectorLearner counts which selector won for each
+(host, cascade) and, on later runs, PageContext.first_match() tries a clear
+winner first and, when it hits, stops there.
+
+Selectors of a cascade can match the same page at once (an <h1> and a <title>
+both carry a title), so skipping the ones in front of the winner is only exact
+on hosts where they never match. A winner is therefore only used on a host
+where no selector in front of it has ever won: every recorded win of a later
+selector is a page on which all the earlier ones missed. To keep watching for
+the opposite, one page in AUDIT_EVERY (picked by URL, so the same pages in
+every run) ignores the learned selector and runs the fixed order; so does every
+page where the learned selector misses. The first time either sees a selector
+in front of the winner win, the host stops using it from the next run on.
+Results match the fixed order as long as that evidence holds; --no-learn turns
+the learner off.
+
+The order used during a run is frozen when the run starts (wins recorded during
+the run only take effect on the next one), so a run's output never depends on
+the number of worker processes or the order pages finish in.
+
+Stats live in data/parser_selector_stats.json:
+
+    {"version": 1, "hosts": {"<host>": {"<cascade>": {"<selector>": wins, ...}}}}
+"""
+from __future__ import annotations
+
+import json
+import os
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, FrozenSet, Optional, Sequence, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_STATS = PROJECT_ROOT / "data" / "parser_selector_stats.json"
+
+STATS_VERSION = 1
+# A selector is promoted once it has won this often and at least this share of
+# the host's wins for the cascade (and nothing in front of it ever won there).
+MIN_WINS = 20
+MIN_SHARE = 0.6
+# One page in this many runs every cascade in the fixed order.
+AUDIT_EVERY = 16
+
+Key = Tuple[str, str, str]  # (host, cascade, selector)
+
+
+class SelectorLearner:
+    def __init__(self, path=DEFAULT_STATS):
+        self.path = Path(path)
+        self.counts: Counter = Counter()
+        self.pending: Counter = Counter()
+        self.preferred: Dict[Tuple[str, str], str] = {}
+        # (host, cascade) -> every selector that has won it on that host.
+        self.winners: Dict[Tuple[str, str], FrozenSet[str]] = {}
+        self._learned: Dict[Tuple[str, str], Optional[str]] = {}
+
+    # -- persistence --------------------------------------------------------
+    def load(self) -> "SelectorLearner":
+        if self.path.exists():
+            try:
+                with self.path.open("r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except (OSError, json.JSONDecodeError):
+                data = {}
+            if data.get("version") == STATS_VERSION:
+                for host, cascades in data.get("hosts", {}).items():
+                    for cascade, wins in cascades.items():
+                        for selector, count in wins.items():
+                            self.counts[(host, cascade, selector)] += count
+        self.freeze()
+        return self
+
+    def save(self) -> None:
+        hosts: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for (host, cascade, selector), count in sorted(self.counts.items()):
+            hosts.setdefault(host, {}).setdefault(cascade, {})[selector] = count
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump({"version": STATS_VERSION, "hosts": hosts}, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    # -- learning -----------------------------------------------------------
+    def freeze(self) -> None:
+        """Recompute the preferred selector per (host, cascade) from the counts."""
+        totals: Counter = Counter()
+        best: Dict[Tuple[str, str], Tuple[int, str]] = {}
+        winners: Dict[Tuple[str, str], set] = {}
+        for (host, cascade, selector), count in self.counts.items():
+            totals[(host, cascade)] += count
+            winners.setdefault((host, cascade), set()).add(selector)
+            if count > best.get((host, cascade), (0, ""))[0]:
+                best[(host, cascade)] = (count, selector)
+        preferred = {
+            key: selector for key, (count, selector) in best.items()
+            if count >= MIN_WINS and count >= MIN_SHARE * totals[key]
+        }
+        self.set_preferred(preferred, {key: frozenset(winners[key]) for key in preferred})
+
+    def set_preferred(self, preferred: Dict[Tuple[str, str], str],
+                      winners: Optional[Dict[Tuple[str, str], FrozenSet[str]]] = None) -> None:
+        """Adopt a frozen order computed elsewhere (used by worker processes)."""
+        self.preferred = dict(preferred)
+        self.winners = dict(winners or {})
+        self._learned = {}
+
+    def learned(self, host: Optional[str], cascade: str, selectors: Sequence[str]) -> Optional[str]:
+        """This host's learned winner of `cascade`, if it isn't `selectors`' first one
+        anyway and no selector in front of it has ever won on the host."""
+        if not host:
+            return None
+        key = (host, cascade)
+        try:
+            return self._learned[key]
+        except KeyError:
+            pass
+        winner = self.preferred.get(key)
+        if winner is None or winner not in selectors or selectors[0] == winner:
+            winner = None
+        else:
+            seen = self.winners.get(key, frozenset())
+            if any(selector in seen for selector in selectors[:selectors.index(winner)]):
+                winner = None
+        self._learned[key] = winner
+        return winner
+
+    @staticmethod
+    def audits(url: Optional[str]) -> bool:
+        """True for the pages that run every cascade in the fixed order."""
+        return zlib.crc32((url or "").encode("utf-8")) % AUDIT_EVERY == 0
+
+    def record(self, host: Optional[str], cascade: str, selector: str) -> None:
+        if host:
+            self.pending[(host, cascade, selector)] += 1
+
+    def take_pending(self) -> Dict[Key, int]:
+        """Wins recorded since the last call (workers ship these to the main process)."""
+        pending, self.pending = dict(self.pending), Counter()
+        return pending
+
+    def merge(self, wins: Dict[Key, int]) -> None:
+        self.counts.update(wins)
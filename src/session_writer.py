@@ -0,0 +1,180 @@
+"""Streaming JSONL writer for crawl sessions.
+
+The crawlers used to keep every fetched page (full `html` string included) in an
+in-memory list and only dump it once the run finished or was Ctrl-C'd. A long
+drughub run therefore held hundreds of MB in RAM, and a real crash lost the whole
+session.
+
+SessionWriter appends each record as ONE JSON line the moment it is handed over,
+so crawler memory stays flat and a crash loses at most the last few records that
+had not been fsync'd yet. It behaves like the list it replaces (`append()` and
+`len()`), so the crawl loops need no restructuring.
+
+File layout (products_html_<timestamp>.jsonl):
+
+    {"market": ..., "category_page": ..., "product_url": ..., "fetched_at": ..., "html": ...}
+    {"market": ..., ...}
+    {"_session_footer": {"records": 2, "status": "complete", ...}}
+
+The footer line is only written by close(); a file without one came from a crawl
+that died mid-run (its records are still valid). Readers should use iter_jsonl(),
+which skips the footer and tolerates a truncated final line.
+
+Given an HtmlStore (html_store.py), the writer moves each record's `html` into the
+store and writes only its `content_hash`, so unchanged pages are never stored twice.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+SESSION_EXT = ".jsonl"
+FOOTER_KEY = "_session_footer"
+FORMAT_VERSION = 1
+
+# Durability cadence: flush + fsync after this many records, or after this many
+# seconds since the last sync, whichever comes first.
+DEFAULT_FSYNC_EVERY = 10
+DEFAULT_FSYNC_SECONDS = 30.0
+
+
+class SessionWriter:
+    """Append-only JSONL writer for one crawl session.
+
+    Drop-in for the `all_products` list the crawlers used to build: `append()`
+    writes the record straight to disk and `len()` reports how many were written.
+    With `store`, HTML bodies go to the content-addressed store instead of the line.
+    `on_append(record)` is called with each record (html included) once it has
+    been written, e.g. to feed a parse_on_fetch.ParseOnFetch pool.
+    """
+
+    def __init__(self, path, fsync_every: int = DEFAULT_FSYNC_EVERY,
+                 fsync_seconds: float = DEFAULT_FSYNC_SECONDS, store=None,
+                 on_append: Optional[Callable[[dict], None]] = None):
+        self.path = Path(path)
+        self.store = store
+        self.on_append = on_append
+        self.fsync_every = max(1, int(fsync_every))
+        self.fsync_seconds = fsync_seconds
+        self.started_at = int(time.time())
+        self.count = 0
+        self.closed = False
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = self.path.open("a", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "SessionWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not self.closed:
+            self.close(status="complete" if exc_type is None else "interrupted")
+
+    def append(self, record: dict) -> None:
+        """Write one record as a single JSON line."""
+        if self.closed:
+            raise ValueError(f"SessionWriter for {self.path} is closed")
+        line = record
+        if self.store is not None and record.get("html"):
+            line = dict(record)
+            line["content_hash"] = self.store.put(line.pop("html"))
+        self._fh.write(json.dumps(line, ensure_ascii=False))
+        self._fh.write("\n")
+        self.count += 1
+        self._unsynced += 1
+        if (self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_seconds):
+            self.flush()
+        if self.on_append is not None:
+            self.on_append(record)
+
+    def flush(self, fsync: bool = True) -> None:
+        """Push buffered lines to the OS (and to disk when `fsync`)."""
+        if self.closed:
+            return
+        if self.store is not None:
+            # Bodies first, so a synced line never references an unsynced blob.
+            self.store.flush(fsync=fsync)
+        self._fh.flush()
+        if fsync:
+            os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self, status: str = "complete", extra: Optional[dict] = None) -> None:
+        """Write the footer line, fsync and close the file.
+
+        `status` records how the run ended ("complete", "interrupted", "error") so
+        a later reader can tell a finished session from a cut-short one.
+        """
+        if self.closed:
+            return
+        footer = {
+            "records": self.count,
+            "status": status,
+            "started_at": self.started_at,
+            "finished_at": int(time.time()),
+            "format": FORMAT_VERSION,
+        }
+        if extra:
+            footer.update(extra)
+        self._fh.write(json.dumps({FOOTER_KEY: footer}, ensure_ascii=False))
+        self._fh.write("\n")
+        self.flush()
+        self._fh.close()
+        self.closed = True
+
+
+def is_footer(record: object) -> bool:
+    return isinstance(record, dict) and FOOTER_KEY in record and len(record) == 1
+
+
+def iter_jsonl(path) -> Iterator[dict]:
+    """Yield record dicts from a JSONL session file, one line at a time.
+
+    The footer line is skipped. A final line cut off by a crash (no trailing
+    newline, unparsable) ends the iteration quietly -- everything before it is
+    intact. Any other bad line raises json.JSONDecodeError like json.load would.
+    """
+    with Path(path).open("r", encoding="utf-8") as fh:
+        for line in fh:
+            stripped = line.strip()
+            if not stripped:
+                continue
+            try:
+                record = json.loads(stripped)
+            except json.JSONDecodeError:
+                if not line.endswith("\n"):
+                    return  # torn final write from a crashed crawl
+                raise
+            if is_footer(record):
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def read_footer(path) -> Optional[dict]:
+    """Return the session footer dict, or None if the session never closed cleanly."""
+    path = Path(path)
+    size = path.stat().st_size
+    if size == 0:
+        return None
+    # The footer is tiny and always last; only read the tail of the file.
+    with path.open("rb") as fh:
+        fh.seek(max(0, size - 4096))
+        tail = fh.read().decode("utf-8", errors="replace")
+    lines = [ln for ln in tail.splitlines() if ln.strip()]
+    if not lines:
+        return None
+    try:
+        record = json.loads(lines[-1])
+    except json.JSONDecodeError:
+        return None
+    return record[FOOTER_KEY] if is_footer(record) else None
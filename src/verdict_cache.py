@@ -0,0 +1,178 @@
+"""Persistent cache of evaluate_llm.py verdicts.
+
+evaluate_llm.py used to keep its verdicts in data/llm_cache.json and rewrite
+the whole pretty-printed file after every evaluated record: a run was O(n²) in
+cache size, and a kill mid-write could truncate the file. VerdictCache keeps
+them in SQLite in WAL mode instead, one row per verdict, keyed like
+evaluate_llm.cache_key() (model + listing content) with the model in a column
+of its own, so inserting a verdict appends a page to the write-ahead log
+whatever the cache size, and a killed run loses at most the verdict being written.
+
+The first run against an empty cache imports data/llm_cache.json if it exists.
+Keys from the JSON cache already hash in their model, so they keep hitting;
+their model column is left empty ("") because the JSON never recorded it,
+unless --model is given to an explicit import.
+
+The same file remembers which response_format each server (base URL + model)
+accepted, so evaluate_llm.py doesn't re-probe it on every run.
+
+    python3 src/verdict_cache.py --stats
+    python3 src/verdict_cache.py --import data/llm_cache.json [--model qwen2.5-7b-instruct-1m]
+    python3 src/verdict_cache.py --model qwen2.5-7b-instruct-1m --dump   # that model's verdicts as JSON
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_CACHE = PROJECT_ROOT / "data" / "llm_cache.sqlite"
+
+
+class VerdictCache:
+    """SQLite-backed map cache_key -> normalised verdict dict."""
+
+    def __init__(self, path=DEFAULT_CACHE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path))
+        # WAL + NORMAL: a commit appends to the log without an fsync of the
+        # database file; a crash can only lose the last uncheckpointed commits.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " verdict TEXT NOT NULL,"
+            " created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS verdicts_model ON verdicts (model);"
+            "CREATE TABLE IF NOT EXISTS response_formats ("
+            " base_url TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " response_format TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (base_url, model));"
+        )
+        self._conn.commit()
+
+    def __enter__(self) -> "VerdictCache":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    def get(self, key: str) -> Optional[dict]:
+        row = self._conn.execute("SELECT verdict FROM verdicts WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, model: str, verdict: dict) -> None:
+        """Store one verdict and commit it."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO verdicts (key, model, verdict, created_at) VALUES (?, ?, ?, ?)",
+            (key, model, json.dumps(verdict, ensure_ascii=False), time.time()),
+        )
+        self._conn.commit()
+
+    def for_model(self, model: str) -> Dict[str, dict]:
+        """Every cached verdict of `model` ("" for imported ones of unknown model)."""
+        rows = self._conn.execute("SELECT key, verdict FROM verdicts WHERE model = ?", (model,))
+        return {key: json.loads(verdict) for key, verdict in rows}
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn.execute("SELECT model, COUNT(*) FROM verdicts GROUP BY model")
+        return dict(rows.fetchall())
+
+    def get_response_format(self, base_url: str, model: str) -> Optional[str]:
+        """The response_format name call_llm() settled on for this server, if any."""
+        row = self._conn.execute("SELECT response_format FROM response_formats WHERE base_url = ? AND model = ?",
+                                 (base_url.rstrip("/"), model)).fetchone()
+        return row[0] if row else None
+
+    def put_response_format(self, base_url: str, model: str, name: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO response_formats (base_url, model, response_format, updated_at)"
+            " VALUES (?, ?, ?, ?)", (base_url.rstrip("/"), model, name, time.time()),
+        )
+        self._conn.commit()
+
+    def response_formats(self) -> Dict[Tuple[str, str], str]:
+        rows = self._conn.execute("SELECT base_url, model, response_format FROM response_formats")
+        return {(base_url, model): name for base_url, model, name in rows}
+
+    def import_json(self, path, model: str = "") -> int:
+        """Copy the verdicts of an evaluate_llm JSON cache ({key: verdict}) in,
+        keeping entries already present; returns how many were new."""
+        with Path(path).open("r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected a JSON object of {{cache key: verdict}}")
+        before = len(self)
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO verdicts (key, model, verdict, created_at) VALUES (?, ?, ?, ?)",
+            [(str(key), model, json.dumps(verdict, ensure_ascii=False), now)
+             for key, verdict in data.items() if isinstance(verdict, dict)],
+        )
+        self._conn.commit()
+        return len(self) - before
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def open_cache(path=DEFAULT_CACHE) -> VerdictCache:
+    """The verdict cache at `path`, seeded the first time from the JSON cache
+    beside it (llm_cache.sqlite <- llm_cache.json). A .json `path`, as the
+    old --cache took, names that JSON cache."""
+    path = Path(path)
+    legacy_json = path.with_suffix(".json")
+    if path.suffix == ".json":
+        path = path.with_suffix(".sqlite")
+    cache = VerdictCache(path)
+    if legacy_json.exists() and not len(cache):
+        try:
+            imported = cache.import_json(legacy_json)
+        except (OSError, ValueError) as exc:
+            print(f"⚠️  Could not import {legacy_json}: {exc} (ignoring)")
+        else:
+            print(f"Imported {imported} verdicts from {legacy_json} into {cache.path}")
+    return cache
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Inspect or import the evaluate_llm.py verdict cache")
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE,
+                        help=f"Cache file (default: {DEFAULT_CACHE})")
+    parser.add_argument("--import", dest="import_json", type=Path, default=None, metavar="JSON",
+                        help="Import an evaluate_llm JSON cache ({key: verdict})")
+    parser.add_argument("--model", default="",
+                        help="Model the imported verdicts came from, or whose verdicts --dump prints")
+    parser.add_argument("--dump", action="store_true", help="Print --model's verdicts as JSON")
+    parser.add_argument("--stats", action="store_true", help="Print cached verdicts per model")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    args = parse_args(argv)
+    with VerdictCache(args.cache) as cache:
+        if args.import_json:
+            print(f"Imported {cache.import_json(args.import_json, args.model)} new verdicts")
+        if args.dump:
+            print(json.dumps(cache.for_model(args.model), ensure_ascii=False, indent=2))
+        if args.stats or not (args.import_json or args.dump):
+            for model, count in sorted(cache.stats().items()):
+                print(f"  {model or '(unknown, imported)'}: {count} verdicts")
+            for (base_url, model), name in sorted(cache.response_formats().items()):
+                print(f"  response_format {name} for {model} @ {base_url}")
+
+
+if __name__ == "__main__":
+    main()